@@ -0,0 +1,277 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QPushButton, QComboBox, QTableWidget, QTableWidgetItem,
+    QHeaderView, QSplitter, QMessageBox
+)
+from PySide6.QtCore import Qt, QRect
+from PySide6.QtGui import QColor, QPainter
+import datetime
+import time
+from sales_analytics import DIMENSIONS, MEASURES, DRILL_DOWN, pivot  # Срезы итогов продаж по месяцам
+from workers import create_task_group  # Фоновое выполнение запросов
+import assets  # Общий кэш логотипа и иконки
+import query_stats  # Действия интерфейса для статистики запросов
+
+
+def format_value(value):
+    # Число с разделением разрядов пробелами
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def format_label(dimension, label):
+    # Название значения измерения (месяц - в виде ГГГГ-ММ)
+    if label is None:
+        return "Не указано"
+    if dimension == "month":
+        return f"{label:%Y-%m}"
+    return str(label)
+
+
+# Столбчатая диаграмма: горизонтальные полосы (итоги строк) или вертикальные столбцы (итоги по месяцам)
+class BarChart(QWidget):
+    BAR_COLOR = QColor("#67BA80")
+    MAX_BARS = 12  # Для горизонтальной диаграммы показываются только наибольшие значения
+
+    def __init__(self, vertical=False, parent=None):
+        super().__init__(parent)
+        self.vertical = vertical
+        self.items = []  # [(подпись, значение)]
+        self.setMinimumHeight(160)
+
+    def set_items(self, items):
+        self.items = items if self.vertical else items[:self.MAX_BARS]
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        if not self.items:
+            painter.drawText(self.rect(), Qt.AlignCenter, "Нет данных")
+            return
+        maximum = max(value for _, value in self.items) or 1
+        metrics = painter.fontMetrics()
+        area = self.rect().adjusted(8, 8, -8, -8)
+        if self.vertical:
+            # Столбцы по месяцам, подписи под столбцами
+            label_height = metrics.height()
+            width = area.width() / len(self.items)
+            for number, (label, value) in enumerate(self.items):
+                height = int((area.height() - 2 * label_height) * value / maximum)
+                left = int(area.left() + number * width)
+                bar = QRect(left + 1, area.bottom() - label_height - height, max(int(width) - 2, 1), height)
+                painter.fillRect(bar, self.BAR_COLOR)
+                painter.drawText(QRect(left, area.bottom() - label_height, int(width), label_height), Qt.AlignCenter, label)
+        else:
+            # Полосы по убыванию: подпись слева, значение справа
+            label_width = min(area.width() // 3, max(metrics.horizontalAdvance(label) for label, _ in self.items) + 8)
+            value_width = max(metrics.horizontalAdvance(format_value(value)) for _, value in self.items) + 8
+            height = area.height() / len(self.items)
+            bar_space = area.width() - label_width - value_width
+            for number, (label, value) in enumerate(self.items):
+                top = int(area.top() + number * height)
+                row_height = max(min(int(height) - 2, 2 * metrics.height()), 1)
+                painter.drawText(QRect(area.left(), top, label_width - 4, row_height), Qt.AlignRight | Qt.AlignVCenter,
+                                 metrics.elidedText(label, Qt.ElideRight, label_width - 4))
+                bar_width = int(bar_space * value / maximum)
+                painter.fillRect(QRect(area.left() + label_width, top, bar_width, row_height), self.BAR_COLOR)
+                painter.drawText(QRect(area.left() + label_width + bar_width + 4, top, value_width, row_height),
+                                 Qt.AlignLeft | Qt.AlignVCenter, format_value(value))
+
+
+class AnalyticsDialog(QDialog):
+    # Варианты периода: количество месяцев, включая текущий (None - за все время).
+    # Итоги хранятся по месяцам, поэтому период задается целыми месяцами
+    PERIODS = {
+        "За все время": None,
+        "Текущий месяц": 1,
+        "Последние 3 месяца": 3,
+        "Последние 6 месяцев": 6,
+        "Последние 12 месяцев": 12,
+    }
+    NO_COLUMNS = "Без столбцов"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)  # Инициализация родительского класса QDialog
+        self.setWindowTitle("Аналитика продаж")  # Устанавливаем заголовок окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
+        self.setGeometry(100, 100, 1000, 700)  # Устанавливаем начальные размеры окна
+        self.tasks = create_task_group(self)  # Фоновые задачи построения срезов
+        self.finished.connect(self.tasks.cancel_all)  # Отменяем построение при закрытии окна
+        self.filters = []  # Путь перехода к подробностям: [(измерение, ключ, название)]
+        self.pivot = None  # Последняя построенная сводная таблица
+        self.init_ui()  # Инициализируем интерфейс
+        self.refresh()
+
+    def init_ui(self):
+        # Логотип и заголовок окна
+        logo_label = QLabel()
+        logo_label.setPixmap(assets.logo())  # Устанавливаем логотип (загружен и масштабирован один раз)
+        app_title = QLabel("Аналитика продаж")
+        app_title.setStyleSheet("font-family: SegoeUI; font-size: 18px; font-weight: bold; text-align: left;")  # Стиль для заголовка
+        header_widget = QWidget()
+        header_widget.setStyleSheet("background-color: #F4E8D3;")  # Задаем фон для шапки
+        header_layout = QHBoxLayout(header_widget)
+        header_layout.addWidget(logo_label)
+        header_layout.addWidget(app_title)
+
+        # Панель выбора среза: строки, столбцы, показатель и период
+        self.rows_combo = self.create_combo([(name, DIMENSIONS[name][0]) for name in DIMENSIONS], "partner_type")
+        self.columns_combo = self.create_combo([(None, self.NO_COLUMNS)] + [(name, DIMENSIONS[name][0]) for name in DIMENSIONS], "month")
+        self.measure_combo = self.create_combo([(name, title) for name, (title, _) in MEASURES.items()], "количество")
+        self.period_combo = self.create_combo([(months, title) for title, months in self.PERIODS.items()], None)
+        controls = QWidget()
+        controls_layout = QHBoxLayout(controls)
+        for title, combo in [("Строки", self.rows_combo), ("Столбцы", self.columns_combo), ("Показатель", self.measure_combo), ("Период", self.period_combo)]:
+            controls_layout.addWidget(QLabel(title))
+            controls_layout.addWidget(combo)
+            combo.currentIndexChanged.connect(self.on_slice_changed)
+
+        # Путь перехода к подробностям и кнопка возврата на уровень выше
+        self.path_label = QLabel()
+        self.up_button = self.create_button("Вверх", self.drill_up)
+        self.status_label = QLabel()
+        path_layout = QHBoxLayout()
+        path_layout.addWidget(self.path_label, 1)
+        path_layout.addWidget(self.status_label)
+        path_layout.addWidget(self.up_button)
+
+        # Диаграммы: итоги строк и итоги по месяцам
+        self.rows_chart = BarChart()
+        self.months_chart = BarChart(vertical=True)
+        charts = QWidget()
+        charts_layout = QHBoxLayout(charts)
+        charts_layout.addWidget(self.rows_chart)
+        charts_layout.addWidget(self.months_chart)
+
+        # Сводная таблица; двойной щелчок по строке открывает ее подробности
+        self.table = QTableWidget()
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)  # Таблица только для чтения
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.cellDoubleClicked.connect(self.drill_down)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(charts)
+        splitter.addWidget(self.table)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(header_widget)
+        layout.addWidget(controls)
+        layout.addLayout(path_layout)
+        layout.addWidget(splitter)
+        layout.addWidget(self.create_button("Закрыть", self.close))
+
+    # Метод для создания кнопки с заданным текстом и обработчиком
+    def create_button(self, text, handler):
+        button = QPushButton(text)  # Создаем кнопку
+        button.setStyleSheet("font-family: SegoeUI; background-color: #67BA80; color: white; border-radius: 5px; padding: 10px;")  # Стиль кнопки
+        button.clicked.connect(handler)  # Подключаем обработчик для нажатия
+        return button
+
+    @staticmethod
+    def create_combo(items, current):
+        # Выпадающий список; в элементе хранится значение параметра среза
+        combo = QComboBox()
+        for value, text in items:
+            combo.addItem(text, value)
+        combo.setCurrentIndex(max(combo.findData(current), 0))  # Пустое значение (None) - первый элемент списка
+        return combo
+
+    def period(self):
+        # Первый день периода (None - за все время); период продолжается до текущей даты
+        months = self.period_combo.currentData()
+        if not months:
+            return None
+        today = datetime.date.today()
+        year, month = divmod(today.year * 12 + today.month - months, 12)
+        return datetime.date(year, month + 1, 1)
+
+    def on_slice_changed(self):
+        # Другие строки или столбцы - новый срез с текущим путем подробностей
+        self.refresh()
+
+    def refresh(self):
+        # Срез строится в фоне; результат предыдущего незавершенного построения не нужен
+        self.tasks.cancel_all()
+        parameters = {
+            "rows": self.rows_combo.currentData(),
+            "columns": self.columns_combo.currentData(),
+            "measure": self.measure_combo.currentData(),
+            "date_from": self.period(),
+            "filters": {dimension: key for dimension, key, _ in self.filters},
+        }
+        if parameters["columns"] == parameters["rows"]:
+            parameters["columns"] = None  # Одно измерение в строках и столбцах дает только диагональ
+        self.path_label.setText(" / ".join(["Все продажи"] + [f"{DIMENSIONS[dimension][0]}: {title}" for dimension, _, title in self.filters]))
+        self.up_button.setEnabled(bool(self.filters))
+        self.status_label.setText("Построение...")
+        with query_stats.action("Срез аналитики продаж"):
+            self.tasks.start(self.load_pivot, parameters, on_chunk=self.show_pivot,
+                             on_failed=lambda message: self.show_message("Ошибка", f"Не удалось построить срез: {message}", QMessageBox.Critical))
+
+    @staticmethod
+    def load_pivot(session, parameters):
+        # Выполняется в фоне: сводная таблица и время ее построения
+        started = time.perf_counter()
+        result = pivot(session, **parameters)
+        yield parameters, result, time.perf_counter() - started
+
+    def show_pivot(self, chunk):
+        parameters, result, elapsed = chunk
+        self.parameters, self.pivot = parameters, result
+        rows, columns = parameters["rows"], parameters["columns"]
+        self.status_label.setText(f"Строк: {len(result.rows)}, построено за {elapsed * 1000:.0f} мс")
+
+        # Сводная таблица с итогами строк и столбцов
+        self.table.clear()
+        self.table.setRowCount(len(result.rows) + 1)
+        self.table.setColumnCount(len(result.columns) + 2 if columns else 2)
+        headers = [DIMENSIONS[rows][0]] + [format_label(columns, label) for _, label in result.columns] if columns else [DIMENSIONS[rows][0]]
+        self.table.setHorizontalHeaderLabels(headers + ["Итого"])
+        for row_number, (row_key, row_label) in enumerate(result.rows):
+            values = [result.value(row_key, column_key) for column_key, _ in result.columns] if columns else []
+            self.fill_row(row_number, format_label(rows, row_label), values + [result.row_totals[row_key]])
+        totals = [result.column_totals.get(column_key, 0) for column_key, _ in result.columns] if columns else []
+        self.fill_row(len(result.rows), "Итого", totals + [result.total])
+
+        # Диаграммы: итоги строк и, если столбцы - месяцы, итоги по месяцам
+        self.rows_chart.set_items([(format_label(rows, label), result.row_totals[key]) for key, label in result.rows])
+        self.months_chart.setVisible(columns == "month")
+        if columns == "month":
+            self.months_chart.set_items([(format_label(columns, label)[2:], result.column_totals.get(key, 0)) for key, label in result.columns])
+
+    def fill_row(self, row_number, title, values):
+        self.table.setItem(row_number, 0, QTableWidgetItem(title))
+        for column_number, value in enumerate(values, start=1):
+            item = QTableWidgetItem(format_value(value))
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.table.setItem(row_number, column_number, item)
+
+    def drill_down(self, row_number, column_number):
+        # Подробности строки: ее значение становится фильтром, строками - следующее измерение
+        if self.pivot is None or row_number >= len(self.pivot.rows):
+            return
+        rows = self.parameters["rows"]
+        if rows not in DRILL_DOWN:
+            return
+        row_key, row_label = self.pivot.rows[row_number]
+        self.filters.append((rows, row_key, format_label(rows, row_label)))
+        self.set_rows(DRILL_DOWN[rows])
+
+    def drill_up(self):
+        # Возврат на уровень выше: снимаем последний фильтр и показываем его измерение в строках
+        if self.filters:
+            dimension, _, _ = self.filters.pop()
+            self.set_rows(dimension)
+
+    def set_rows(self, dimension):
+        self.rows_combo.blockSignals(True)
+        self.rows_combo.setCurrentIndex(self.rows_combo.findData(dimension))
+        self.rows_combo.blockSignals(False)
+        self.refresh()
+
+    def show_message(self, title, message, icon):
+        # Метод для отображения сообщений
+        msg = QMessageBox()
+        msg.setIcon(icon)  # Устанавливаем иконку сообщения
+        msg.setText(message)  # Устанавливаем текст сообщения
+        msg.setWindowTitle(title)  # Устанавливаем заголовок окна сообщения
+        msg.exec()  # Отображаем сообщение
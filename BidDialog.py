@@ -0,0 +1,262 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QWidget, QLabel, QPushButton, QTableWidget, QTableWidgetItem, QHeaderView,
+    QMessageBox, QApplication, QStyledItemDelegate, QLineEdit, QCompleter
+)
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QColor
+from bids import load_price_list, price_lines, enter_bid  # Расчет и запись заявки
+from workers import create_task_group  # Фоновое выполнение запросов
+import assets  # Общий кэш логотипа и иконки
+import query_stats  # Действия интерфейса для статистики запросов
+
+ERROR_COLOR = QColor("#F6C9C4")  # Подсветка строк с ошибками
+# Колонки таблицы строк заявки; цена и стоимость рассчитываются и не редактируются
+PRODUCT, QUANTITY, PRODUCTION_DATE, PRICE, COST = range(5)
+HEADERS = ["Продукция", "Количество", "Дата производства", "Цена", "Стоимость"]
+
+
+def format_money(value):
+    return f"{value:,.2f}".replace(",", " ")
+
+
+# Редактор колонки продукции с подсказкой наименований из прайс-листа
+class ProductDelegate(QStyledItemDelegate):
+    def __init__(self, names, parent=None):
+        super().__init__(parent)
+        self.names = names
+
+    def createEditor(self, parent, option, index):
+        editor = QLineEdit(parent)
+        completer = QCompleter(self.names, editor)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        completer.setFilterMode(Qt.MatchContains)
+        editor.setCompleter(completer)
+        return editor
+
+
+# Диалог ввода заявки партнера: строки можно вводить вручную или вставлять из таблицы (Excel, CSV).
+# Цены продукции и скидка партнера загружаются один раз при открытии, после каждого изменения
+# все строки проверяются и пересчитываются в памяти; заявка записывается в фоне одной транзакцией
+class BidDialog(QDialog):
+    def __init__(self, partner_id, parent=None):
+        super().__init__(parent)  # Инициализация родительского класса QDialog
+        self.setWindowTitle("Заявка партнера")  # Устанавливаем заголовок окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
+        self.setGeometry(100, 100, 900, 600)  # Устанавливаем начальные размеры окна
+        self.partner_id = partner_id
+        self.price_list = None  # Цены продукции и скидка партнера (загружаются в фоне)
+        self.lines = []  # Непустые строки таблицы: (продукция, количество, дата производства)
+        self.priced = []  # Рассчитанные строки
+        self.errors = []  # Ошибки проверки: (номер строки, причина)
+        self.saving = False  # Заявка записывается в фоне
+        self.tasks = create_task_group(self)  # Фоновые задачи загрузки цен и записи заявки
+        self.finished.connect(self.tasks.cancel_all)
+        self.init_ui()  # Инициализируем интерфейс
+        with query_stats.action("Открытие заявки партнера"):
+            self.tasks.start(self.load_prices, partner_id, on_chunk=self.on_prices_loaded, on_failed=self.on_load_failed)
+
+    def init_ui(self):
+        # Логотип и заголовок окна
+        logo_label = QLabel()
+        logo_label.setPixmap(assets.logo())  # Устанавливаем логотип (загружен и масштабирован один раз)
+        app_title = QLabel("Заявка партнера")
+        app_title.setStyleSheet("font-family: SegoeUI; font-size: 18px; font-weight: bold; text-align: left;")  # Стиль для заголовка
+        header_widget = QWidget()
+        header_widget.setStyleSheet("background-color: #F4E8D3;")  # Задаем фон для шапки
+        header_layout = QHBoxLayout(header_widget)
+        header_layout.addWidget(logo_label)
+        header_layout.addWidget(app_title)
+
+        self.partner_label = QLabel("Загрузка цен...")  # Партнер и его скидка
+
+        # Строки заявки
+        self.table = QTableWidget(0, len(HEADERS))
+        self.table.setHorizontalHeaderLabels(HEADERS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setSectionResizeMode(PRODUCT, QHeaderView.Stretch)
+        self.table.cellChanged.connect(self.reprice)
+        self.edit_triggers = self.table.editTriggers()  # Способы редактирования (отключаются на время записи)
+
+        # Кнопки работы со строками
+        lines_layout = QHBoxLayout()
+        self.line_buttons = [
+            self.create_button("Добавить строку", self.add_line),
+            self.create_button("Удалить строки", self.remove_lines),
+            self.create_button("Вставить из буфера", self.paste_lines),
+        ]
+        for button in self.line_buttons:
+            button.setEnabled(False)  # До загрузки цен строки не проверить
+            lines_layout.addWidget(button)
+        lines_layout.addStretch()
+
+        self.total_label = QLabel()  # Количество строк, сумма и ошибки
+        self.save_button = self.create_button("Сохранить", self.save_bid)
+        self.save_button.setEnabled(False)
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.total_label, 1)
+        buttons_layout.addWidget(self.save_button)
+        buttons_layout.addWidget(self.create_button("Закрыть", self.close))
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(header_widget)
+        layout.addWidget(self.partner_label)
+        layout.addLayout(lines_layout)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons_layout)
+
+    # Метод для создания кнопки с заданным текстом и обработчиком
+    def create_button(self, text, handler):
+        button = QPushButton(text)  # Создаем кнопку
+        button.setStyleSheet("font-family: SegoeUI; background-color: #67BA80; color: white; border-radius: 5px; padding: 10px;")  # Стиль кнопки
+        button.clicked.connect(handler)  # Подключаем обработчик для нажатия
+        return button
+
+    @staticmethod
+    def load_prices(session, partner_id):
+        # Выполняется в фоне: цены всей продукции и скидка партнера
+        yield load_price_list(session, partner_id)
+
+    def on_prices_loaded(self, price_list):
+        self.price_list = price_list
+        self.partner_label.setText(f"Партнер: {price_list.partner_name}, скидка {price_list.discount}%")
+        names = sorted(name for name, _ in price_list.products.values() if name)
+        self.table.setItemDelegateForColumn(PRODUCT, ProductDelegate(names, self.table))
+        for button in self.line_buttons:
+            button.setEnabled(True)
+        self.add_line()
+
+    def on_load_failed(self, message):
+        self.partner_label.setText("Цены не загружены")
+        self.show_message("Ошибка", f"Не удалось загрузить цены: {message}", QMessageBox.Critical)
+
+    def add_line(self):
+        self.append_rows([["", "", ""]])
+        self.table.setCurrentCell(self.table.rowCount() - 1, PRODUCT)
+
+    def remove_lines(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()}, reverse=True)
+        self.table.blockSignals(True)
+        for row in rows:
+            self.table.removeRow(row)
+        self.table.blockSignals(False)
+        self.reprice()
+
+    def paste_lines(self):
+        # Строки из буфера обмена: поля разделены табуляцией (копирование из таблицы) или точкой с запятой
+        text = QApplication.clipboard().text()
+        rows = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            fields = line.split("\t") if "\t" in line else line.split(";")
+            rows.append((fields + ["", "", ""])[:3])
+        # Пустые строки в конце таблицы заменяются вставленными
+        while self.table.rowCount() and not any(self.cell_text(self.table.rowCount() - 1, column) for column in (PRODUCT, QUANTITY, PRODUCTION_DATE)):
+            self.table.removeRow(self.table.rowCount() - 1)
+        self.append_rows(rows)
+
+    def append_rows(self, rows):
+        # Добавление строк без пересчета после каждой ячейки; пересчет один раз в конце
+        self.table.blockSignals(True)
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(rows))
+        for offset, values in enumerate(rows):
+            for column, value in enumerate(values):
+                self.table.setItem(start + offset, column, QTableWidgetItem(value.strip()))
+            for column in (PRICE, COST):
+                item = QTableWidgetItem()
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(start + offset, column, item)
+        self.table.blockSignals(False)
+        self.reprice()
+
+    def cell_text(self, row, column):
+        item = self.table.item(row, column)
+        return item.text().strip() if item else ""
+
+    def reprice(self, *args):
+        # Проверка и расчет всех строк за один проход; пустые строки таблицы пропускаются
+        if self.price_list is None:
+            return
+        lines, rows = [], []
+        for row in range(self.table.rowCount()):
+            values = [self.cell_text(row, column) for column in (PRODUCT, QUANTITY, PRODUCTION_DATE)]
+            if any(values):
+                lines.append(values)
+                rows.append(row)
+        self.lines = lines
+        self.priced, self.errors = price_lines(self.price_list, lines) if lines else ([], [])
+        priced = {line.line: line for line in self.priced}
+        errors = {}
+        for line, reason in self.errors:
+            errors.setdefault(line, reason)
+
+        self.table.blockSignals(True)
+        for number, row in enumerate(rows, 1):
+            line = priced.get(number)
+            self.table.item(row, PRICE).setText(format_money(line.price) if line else "")
+            self.table.item(row, COST).setText(format_money(line.cost) if line else "")
+            error = errors.get(number)
+            for column in range(len(HEADERS)):
+                item = self.table.item(row, column)
+                item.setData(Qt.BackgroundRole, ERROR_COLOR if error else None)
+                item.setToolTip(error or "")
+        self.table.blockSignals(False)
+
+        total = sum(line.cost for line in self.priced)
+        self.total_label.setText(f"Строк: {len(self.priced)}, сумма: {format_money(total)}" + (f", ошибок: {len(self.errors)}" if self.errors else ""))
+        self.save_button.setEnabled(bool(self.priced) and not self.errors and not self.saving)
+
+    def set_saving(self, saving):
+        # Во время записи строки не редактируются, а окно не закрывается: иначе заявку можно записать дважды
+        # или закрыть окно, не узнав, сохранена ли она
+        self.saving = saving
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers if saving else self.edit_triggers)
+        for button in self.line_buttons:
+            button.setEnabled(not saving)
+        self.save_button.setEnabled(not saving and bool(self.priced) and not self.errors)
+
+    def save_bid(self):
+        # Заявка записывается в фоне одной транзакцией; окно закрывается после фиксации
+        if self.errors or not self.priced or self.saving:
+            return
+        self.set_saving(True)
+        with query_stats.action("Сохранение заявки"):
+            self.tasks.start(self.save_lines, self.partner_id, self.lines, self.price_list, on_chunk=self.on_saved, on_failed=self.on_save_failed)
+
+    @staticmethod
+    def save_lines(session, partner_id, lines, price_list):
+        # Выполняется в фоне: повторная проверка по тем же ценам, запись заявки и строк
+        bid_id, priced = enter_bid(session, partner_id, lines, price_list=price_list)
+        yield bid_id, len(priced), sum(line.cost for line in priced)
+
+    def on_saved(self, chunk):
+        bid_id, count, total = chunk
+        self.saving = False
+        self.show_message("Успех", f"Заявка {bid_id} сохранена: строк {count}, сумма {format_money(total)}", QMessageBox.Information)
+        self.accept()
+
+    def on_save_failed(self, message):
+        self.set_saving(False)
+        self.show_message("Ошибка", f"Не удалось сохранить заявку: {message}", QMessageBox.Critical)
+
+    def closeEvent(self, event):
+        # Окно не закрывается, пока заявка записывается (результат записи будет показан)
+        if self.saving:
+            event.ignore()
+            return
+        super().closeEvent(event)
+
+    def reject(self):
+        # То же для клавиши Esc
+        if not self.saving:
+            super().reject()
+
+    def show_message(self, title, message, icon):
+        # Метод для отображения сообщений
+        msg = QMessageBox()
+        msg.setIcon(icon)  # Устанавливаем иконку сообщения
+        msg.setText(message)  # Устанавливаем текст сообщения
+        msg.setWindowTitle(title)  # Устанавливаем заголовок окна сообщения
+        msg.exec()  # Отображаем сообщение
@@ -2,29 +2,41 @@ from PySide6.QtWidgets import (
     QDialog, QFormLayout, QLineEdit, QComboBox, QSpinBox, QPushButton,
     QLabel, QVBoxLayout, QHBoxLayout, QMessageBox, QWidget
 )
-from PySide6.QtCore import Qt, Signal
-from datebase import Partner, Type_partner, Legal_address, Connect
-from PySide6.QtGui import QPixmap, QIcon
+from PySide6.QtCore import Signal
+from datebase import Partner
+from reference_data import partner_types, legal_addresses  # Общий кэш справочников
+from workers import create_task_group  # Фоновое выполнение запросов
+import assets  # Общий кэш логотипа и иконки
+import query_stats  # Действия интерфейса для статистики запросов
 
 class PartnerForm(QDialog):
-    partner_added = Signal()  # Сигнал, который будет отправлен при добавлении или редактировании партнера
+    partner_added = Signal(int)  # Сигнал с id партнера, отправляется при добавлении или редактировании партнера
 
-    def __init__(self, partner=None):
+    def __init__(self, partner_id=None):
         super().__init__()
         self.setWindowTitle("Добавить/Редактировать партнера")  # Заголовок окна
-        self.setWindowIcon(QIcon('icon.ico'))  # Устанавливаем иконку окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
         self.setGeometry(200, 200, 400, 300)  # Устанавливаем начальные размеры окна
 
-        self.partner = partner  # Если редактируем, передаем объект партнера
-        self.session = Connect.create_connection()  # Создаем подключение к базе данных
+        self.tasks = create_task_group(self)  # Фоновые задачи окна
+        self.session = self.tasks.create_session()  # Берем сессию из общего пула соединений на время работы диалога
+        self.finished.connect(self.tasks.cancel_all)  # Отменяем загрузку при закрытии окна
+        self.finished.connect(lambda: self.tasks.close_session(self.session))  # Возвращаем соединение в пул при закрытии диалога
+        self.partner = None  # Редактируемый партнер (загружается в сессию этого диалога)
         self.init_ui()  # Инициализация пользовательского интерфейса
 
+        # Партнер и справочники загружаются одновременно, окно открывается сразу; сохранение доступно после загрузки
+        self.pending = 1 if partner_id is None else 2
+        on_failed = lambda message: self.show_message("Ошибка", f"Не удалось загрузить данные: {message}", QMessageBox.Critical)
+        if partner_id is not None:
+            self.tasks.start(self.load_partner, partner_id, on_chunk=self.fill_partner, on_failed=on_failed,
+                             on_finished=self.on_loaded, session=self.session)
+        self.tasks.start(self.load_choices, on_chunk=self.fill_choices, on_failed=on_failed, on_finished=self.on_loaded)
+
     def init_ui(self):
         # Логотип
         logo_label = QLabel()
-        logo_pixmap = QPixmap('logotype.png')  # Загружаем логотип
-        logo_pixmap = logo_pixmap.scaled(50, 50, Qt.AspectRatioMode.KeepAspectRatio)  # Масштабируем логотип
-        logo_label.setPixmap(logo_pixmap)  # Устанавливаем логотип на метке
+        logo_label.setPixmap(assets.logo())  # Устанавливаем логотип (загружен и масштабирован один раз)
         
         # Заголовок формы
         app_title = QLabel("Добавление/редактирование")
@@ -38,10 +50,7 @@ class PartnerForm(QDialog):
         self.name_input.setPlaceholderText("Наименование")  # Устанавливаем текст-подсказку
 
         self.type_input = QComboBox()  # Выпадающий список типов партнеров
-        self.type_input.addItems([tp.наименование for tp in self.session.query(Type_partner).all()])  # Получаем все типы из базы данных
-
         self.address_input = QComboBox()  # Выпадающий список юридических адресов
-        self.address_input.addItems([f"{addr.город}, {addr.улица}, {addr.дом}" for addr in self.session.query(Legal_address).all()])  # Все адреса из базы данных
 
         # Поля для других данных
         self.inn_input = QLineEdit(self.partner.инн if self.partner else "")
@@ -67,9 +76,10 @@ class PartnerForm(QDialog):
         form_layout.addRow("Рейтинг", self.rating_input)
 
         # Кнопка для сохранения
-        save_button = QPushButton("Сохранить")
-        save_button.setStyleSheet("background-color: #67BA80; color: white; border-radius: 5px; padding: 10px;")
-        save_button.clicked.connect(self.save_partner)  # Привязываем обработчик для сохранения данных
+        self.save_button = QPushButton("Сохранить")
+        self.save_button.setStyleSheet("background-color: #67BA80; color: white; border-radius: 5px; padding: 10px;")
+        self.save_button.clicked.connect(self.save_partner)  # Привязываем обработчик для сохранения данных
+        self.save_button.setEnabled(False)  # Сохранение доступно после загрузки списков
 
         # Основной layout окна
         layout = QVBoxLayout()
@@ -85,10 +95,56 @@ class PartnerForm(QDialog):
         # Добавляем шапку, форму и кнопку на основной layout
         layout.addWidget(header_widget)
         layout.addLayout(form_layout)
-        layout.addWidget(save_button)
+        layout.addWidget(self.save_button)
 
         self.setLayout(layout)  # Устанавливаем layout для окна
 
+    @staticmethod
+    def load_partner(session, partner_id):
+        # Выполняется в фоне в сессии диалога
+        yield session.get(Partner, partner_id)
+
+    def fill_partner(self, partner):
+        # Заполняем поля данными редактируемого партнера
+        self.partner = partner
+        if partner is None:
+            return
+        self.name_input.setText(partner.наименование or "")
+        self.inn_input.setText(partner.инн or "")
+        self.director_input.setText(partner.фио_директора or "")
+        self.phone_input.setText(partner.телефон or "")
+        self.email_input.setText(partner.email or "")
+        self.rating_input.setValue(int(partner.рейтинг) if partner.рейтинг else 0)
+        self.select_current(self.type_input, partner.id_тип)
+        self.select_current(self.address_input, partner.id_юр_адрес)
+
+    def on_loaded(self):
+        self.pending -= 1
+        if not self.pending:
+            self.save_button.setEnabled(True)
+
+    @staticmethod
+    def select_current(combo, item_id):
+        # Выбор текущего значения партнера, если список уже заполнен
+        if combo.count():
+            combo.setCurrentIndex(max(combo.findData(item_id), 0))
+
+    @staticmethod
+    def load_choices(session):
+        # Выполняется в фоновом потоке; справочники берутся из общего кэша (запрос - только при первом открытии)
+        yield "types", partner_types.choices(session)
+        yield "addresses", legal_addresses.choices(session)
+
+    def fill_choices(self, chunk):
+        # Заполняем выпадающий список, как только для него готовы данные; в элементе хранится id строки справочника
+        kind, items = chunk
+        combo = self.type_input if kind == "types" else self.address_input
+        for item_id, text in items:
+            combo.addItem(text, item_id)
+        # При редактировании выбираем текущие тип и адрес партнера (если партнер уже загружен)
+        if self.partner:
+            self.select_current(combo, self.partner.id_тип if kind == "types" else self.partner.id_юр_адрес)
+
     def save_partner(self):
         # Получаем значения из полей ввода
         name = self.name_input.text().strip()
@@ -114,54 +170,62 @@ class PartnerForm(QDialog):
             self.show_message("Ошибка", "Поле 'Email' не может быть пустым.", QMessageBox.Critical)
             return
         
+        # Получаем id выбранных типа партнера и юридического адреса
+        type_id = self.type_input.currentData()
+        address_id = self.address_input.currentData()
+
+        # Если не выбраны тип партнера или адрес
+        if type_id is None or address_id is None:
+            self.show_message("Ошибка", "Необходимо выбрать тип партнера и юридический адрес.", QMessageBox.Critical)
+            return
+
+        values = {
+            "наименование": self.name_input.text(),
+            "id_тип": type_id,
+            "id_юр_адрес": address_id,
+            "инн": self.inn_input.text(),
+            "фио_директора": self.director_input.text(),
+            "телефон": self.phone_input.text(),
+            "email": self.email_input.text(),
+            "рейтинг": self.rating_input.value(),
+        }
+        # Изменения сохраняются в фоне в сессии диалога; окно закрывается после фиксации
+        self.save_button.setEnabled(False)
+        with query_stats.action("Сохранение партнера"):
+            self.save_task = self.tasks.start(self.save_values, values, on_chunk=self.on_saved, on_failed=self.on_save_failed, session=self.session)
+
+    def save_values(self, session, values):
+        # Выполняется в фоне: изменяем редактируемого партнера или создаем нового
+        partner = self.partner or Partner()
+        for key, value in values.items():
+            setattr(partner, key, value)
+        if self.partner is None:
+            session.add(partner)
         try:
-            # Получаем выбранные значения для типа партнера и юридического адреса
-            type_partner = self.session.query(Type_partner).filter_by(наименование=self.type_input.currentText()).first()
-            legal_address = self.session.query(Legal_address).filter_by(город=self.address_input.currentText().split(",")[0]).first()
-
-            # Если не выбраны тип партнера или адрес
-            if not type_partner or not legal_address:
-                raise ValueError("Необходимо выбрать тип партнера и юридический адрес.")
-
-            if self.partner:
-                # Если редактируем существующего партнера
-                self.partner.наименование = self.name_input.text()
-                self.partner.id_тип = type_partner.id
-                self.partner.id_юр_адрес = legal_address.id
-                self.partner.инн = self.inn_input.text()
-                self.partner.фио_директора = self.director_input.text()
-                self.partner.телефон = self.phone_input.text()
-                self.partner.email = self.email_input.text()
-                self.partner.рейтинг = str(self.rating_input.value())
-            else:
-                # Если создаем нового партнера
-                new_partner = Partner(
-                    наименование=self.name_input.text(),
-                    id_тип=type_partner.id,
-                    id_юр_адрес=legal_address.id,
-                    инн=self.inn_input.text(),
-                    фио_директора=self.director_input.text(),
-                    телефон=self.phone_input.text(),
-                    email=self.email_input.text(),
-                    рейтинг=str(self.rating_input.value())
-                )
-                self.session.add(new_partner)
-
-            # Сохраняем изменения в базе данных
-            self.session.commit()
-
-            # Отправляем сигнал, что партнер был добавлен или обновлен
-            self.partner_added.emit()
-
-            # Показываем сообщение об успешном сохранении
-            self.show_message("Успех", "Партнер успешно сохранен!", QMessageBox.Information)
-
-            # Закрываем окно после успешного сохранения
-            self.accept()
-
-        except Exception as e:
-            # В случае ошибки показываем сообщение с описанием ошибки
-            self.show_message("Ошибка", f"Не удалось сохранить данные: {str(e)}", QMessageBox.Critical)
+            # id запоминаем до фиксации, чтобы не перечитывать объект после нее
+            session.flush()
+            partner_id = partner.id
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        yield partner_id
+
+    def on_saved(self, partner_id):
+        # Отправляем сигнал с id добавленного или обновленного партнера
+        with query_stats.attach(self.save_task.action):
+            self.partner_added.emit(partner_id)
+
+        # Показываем сообщение об успешном сохранении
+        self.show_message("Успех", "Партнер успешно сохранен!", QMessageBox.Information)
+
+        # Закрываем окно после успешного сохранения
+        self.accept()
+
+    def on_save_failed(self, message):
+        # В случае ошибки показываем сообщение с описанием ошибки
+        self.save_button.setEnabled(True)
+        self.show_message("Ошибка", f"Не удалось сохранить данные: {message}", QMessageBox.Critical)
 
     def show_message(self, title, message, icon):
         # Метод для отображения сообщений
@@ -1,24 +1,32 @@
 from PySide6.QtWidgets import (
-    QDialog, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QLabel, QHBoxLayout, QWidget
+    QDialog, QVBoxLayout, QTableView, QPushButton, QLabel, QHBoxLayout, QWidget, QLineEdit, QDateEdit, QComboBox
 )
-from datebase import history_implementation, Products, Partner  # Импортируем модели для работы с базой данных
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPixmap, QIcon
+from sales_history_model import SalesHistoryModel  # Модель истории реализации с потоковой загрузкой
+from PySide6.QtCore import Qt, QDate
+import assets  # Общий кэш логотипа и иконки
+import query_stats  # Действия интерфейса для статистики запросов
 
 class ProductRequestDialog(QDialog):
-    def __init__(self, session, parent=None):
+    # Варианты периода: количество месяцев, включая текущий (None - даты не заполняются автоматически)
+    PERIODS = {
+        "За все время": None,
+        "Текущий месяц": 1,
+        "Последние 3 месяца": 3,
+        "Последние 12 месяцев": 12,
+        "Выбрать даты": None,
+    }
+
+    def __init__(self, parent=None):
         super().__init__(parent)  # Инициализация родительского класса QDialog
         self.setWindowTitle("Реализация продукции")  # Устанавливаем заголовок окна
-        self.setWindowIcon(QIcon('icon.ico'))  # Устанавливаем иконку окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
         self.setGeometry(100, 100, 800, 600)  # Устанавливаем начальные размеры окна
-        self.session = session  # Сессия для работы с базой данных
         self.init_ui()  # Инициализируем интерфейс
 
     def init_ui(self):
         # Логотип для окна
         logo_label = QLabel()  # Создаем метку для логотипа
-        logo_pixmap = QPixmap('logotype.png').scaled(50, 50, Qt.AspectRatioMode.KeepAspectRatio)  # Загружаем логотип и задаем его размер
-        logo_label.setPixmap(logo_pixmap)  # Устанавливаем логотип
+        logo_label.setPixmap(assets.logo())  # Устанавливаем логотип (загружен и масштабирован один раз)
 
         # Заголовок окна
         app_title = QLabel("Реализация продукции")  # Текст заголовка
@@ -27,15 +35,18 @@ class ProductRequestDialog(QDialog):
         # Основной layout для окна
         layout = QVBoxLayout(self)
 
-        # Создаем таблицу для отображения данных
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(4)  # Устанавливаем количество колонок
-        self.table.setHorizontalHeaderLabels(["Партнер", "Продукция", "Количество", "Дата продажи"])  # Устанавливаем заголовки колонок
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)  # Делаем таблицу доступной только для чтения
+        # Создаем таблицу для отображения данных: строки подгружаются блоками в фоне по мере прокрутки
+        self.model = SalesHistoryModel(parent=self)
+        self.finished.connect(self.model.close)  # Отменяем чтение и освобождаем курсор при закрытии окна
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)  # Делаем таблицу доступной только для чтения
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # Изначально без сортировки
+        self.table.setSortingEnabled(True)  # Сортировка по щелчку на заголовке выполняется в SQL
+
+        # Панель фильтров по партнеру, продукции и периоду продажи
+        filter_widget = self.create_filters()
 
-        # Загружаем данные для отображения в таблице
-        self.load_history_implementation()
-        
         # Кнопка для закрытия окна
         close_button = self.create_button("Назад", self.open_main_window)
 
@@ -48,6 +59,7 @@ class ProductRequestDialog(QDialog):
 
         # Составляем общий layout окна
         layout.addWidget(header_widget)  # Добавляем шапку в основной layout
+        layout.addWidget(filter_widget)  # Добавляем панель фильтров
         layout.addWidget(self.table)  # Добавляем таблицу
         layout.addWidget(close_button)  # Добавляем кнопку для закрытия окна
 
@@ -67,24 +79,53 @@ class ProductRequestDialog(QDialog):
         self.main_window = MainWindow()
         self.main_window.show()
 
-    # Метод для загрузки данных о реализации продукции в таблицу
-    def load_history_implementation(self):
-        # Выполняем запрос к базе данных для получения данных о реализации
-        history_data = self.session.query(
-            history_implementation,  # История реализации
-            Partner.наименование.label('partner_name'),  # Название партнера
-            Products.наименование.label('product_name')  # Название продукции
-        ).join(Partner, history_implementation.c.id_партнер == Partner.id).join(Products, history_implementation.c.id_продукция == Products.id).all()# Присоединяем таблицу продукции, партнеров и получаем все записи
-
-        # Устанавливаем количество строк в таблице, равное количеству полученных данных
-        self.table.setRowCount(len(history_data))
-
-        # Заполняем таблицу данными
-        for row, record in enumerate(history_data):
-            partner_name = record.partner_name or "Неизвестно"  # Если имя партнера отсутствует, выводим "Неизвестно"
-            product_name = record.product_name or "Неизвестно"  # Если имя продукции отсутствует, выводим "Неизвестно"
-            # Заполняем каждую ячейку таблицы
-            self.table.setItem(row, 0, QTableWidgetItem(partner_name))  # Имя партнера
-            self.table.setItem(row, 1, QTableWidgetItem(product_name))  # Имя продукции
-            self.table.setItem(row, 2, QTableWidgetItem(str(record.количество)))  # Количество продукции
-            self.table.setItem(row, 3, QTableWidgetItem(str(record.дата_продажи)))  # Дата продажи
\ No newline at end of file
+    # Метод для создания панели фильтров
+    def create_filters(self):
+        self.partner_filter = QLineEdit()
+        self.partner_filter.setPlaceholderText("Партнер")
+        self.product_filter = QLineEdit()
+        self.product_filter.setPlaceholderText("Продукция")
+
+        # Период продажи: готовые варианты или произвольные даты
+        self.period_combo = QComboBox()
+        self.period_combo.addItems(list(self.PERIODS))
+        self.period_combo.currentTextChanged.connect(self.select_period)
+        self.date_from = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.date_from.setCalendarPopup(True)
+        self.date_to = QDateEdit(QDate.currentDate())
+        self.date_to.setCalendarPopup(True)
+        self.select_period(self.period_combo.currentText())
+
+        apply_button = self.create_button("Применить", self.apply_filters)
+
+        filter_widget = QWidget()
+        filter_layout = QHBoxLayout(filter_widget)
+        filter_layout.addWidget(self.partner_filter)
+        filter_layout.addWidget(self.product_filter)
+        filter_layout.addWidget(self.period_combo)
+        filter_layout.addWidget(self.date_from)
+        filter_layout.addWidget(self.date_to)
+        filter_layout.addWidget(apply_button)
+        return filter_widget
+
+    # Метод для выбора периода: готовый вариант заполняет даты, произвольный период разрешает их менять
+    def select_period(self, period):
+        months = self.PERIODS[period]
+        custom = period == "Выбрать даты"
+        self.date_from.setEnabled(custom)
+        self.date_to.setEnabled(custom)
+        if months:
+            today = QDate.currentDate()
+            self.date_from.setDate(QDate(today.year(), today.month(), 1).addMonths(1 - months))
+            self.date_to.setDate(today)
+
+    # Метод для применения фильтров к таблице реализации
+    def apply_filters(self):
+        period = self.period_combo.currentText() != "За все время"
+        with query_stats.action("Фильтр реализации продукции"):
+            self.model.set_filters(
+                partner=self.partner_filter.text().strip(),
+                product=self.product_filter.text().strip(),
+                date_from=self.date_from.date().toPython() if period else None,
+                date_to=self.date_to.date().toPython() if period else None
+            )
@@ -0,0 +1,36 @@
+# Общий кэш изображений приложения: логотип и иконка загружаются с диска и масштабируются один раз,
+# после чего все окна и диалоги используют готовые объекты.
+# Пути строятся от папки приложения, поэтому приложение можно запускать из любой текущей папки.
+import os
+from functools import lru_cache
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QPixmap, QIcon
+
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))  # Папка с изображениями
+LOGO_FILE = "logotype.png"
+ICON_FILE = "icon.ico"
+
+
+def asset_path(name):
+    return os.path.join(ASSETS_DIR, name)
+
+
+@lru_cache(maxsize=None)
+def pixmap(name, width=None, height=None, keep_aspect=True):
+    # Изображение из файла, при необходимости масштабированное
+    image = QPixmap(asset_path(name))
+    if width is not None and not image.isNull():
+        mode = Qt.AspectRatioMode.KeepAspectRatio if keep_aspect else Qt.AspectRatioMode.IgnoreAspectRatio
+        image = image.scaled(width, height, mode)
+    return image
+
+
+@lru_cache(maxsize=None)
+def icon(name=ICON_FILE):
+    # Иконка окна
+    return QIcon(asset_path(name))
+
+
+def logo(size=50, keep_aspect=True):
+    # Логотип для шапки окна
+    return pixmap(LOGO_FILE, size, size, keep_aspect)
@@ -0,0 +1,199 @@
+# Асинхронный слой доступа к базе данных на расширении asyncio SQLAlchemy: драйвер asyncpg для PostgreSQL,
+# aiosqlite для SQLite (локальные проверки). Включается переменной окружения PRAKTIKA_ASYNC=1
+# или Connect.configure(async_io=True); строка подключения та же, что у Connect, драйвер подставляется автоматически.
+#
+# Цикл событий asyncio работает в отдельном потоке. Задачи окон выполняются в нем одновременно, каждая на своем
+# соединении, и не занимают по потоку на запрос. Результаты передаются в поток интерфейса теми же сигналами,
+# что и у DbWorker, поэтому AsyncTaskGroup можно использовать вместо DbTaskGroup без изменения окон.
+# Функции задач остаются обычными генераторами job(session, *args): они выполняются через AsyncSession.run_sync,
+# и запросы моделей и кэшей не приходится переписывать. Задачи не должны выполнять долгие вычисления
+# или ждать другие процессы - это остановит цикл событий для всех окон (такие задачи остаются на DbTaskGroup).
+# Зависимости: pip install "sqlalchemy[asyncio]" asyncpg aiosqlite
+import asyncio
+import concurrent.futures
+import threading
+from PySide6.QtCore import QObject
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from datebase import Connect  # Настройки подключения и проверка схемы
+from workers import WorkerSignals  # Сигналы задачи
+import query_stats  # Действие интерфейса, запустившее задачу
+
+# Асинхронные драйверы для строк подключения Connect
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+class AsyncConnect:
+    # Общие для процесса цикл событий, асинхронный движок и фабрика сессий
+    _loop = None  # Цикл событий в отдельном потоке
+    _engine = None  # Асинхронный движок с пулом соединений
+    _engine_lock = None  # Защита от одновременного создания движка задачами цикла
+    _session_factory = None
+    _lock = threading.Lock()  # Защита от одновременного запуска цикла из разных потоков
+
+    @staticmethod
+    def async_url(dsn):
+        # Строка подключения Connect с асинхронным драйвером
+        url = make_url(dsn)
+        backend = url.get_backend_name()
+        if backend not in ASYNC_DRIVERS:
+            raise ValueError(f"Нет асинхронного драйвера для {backend}")
+        return url.set(drivername=ASYNC_DRIVERS[backend])
+
+    @classmethod
+    def loop(cls):
+        # Цикл событий; поток запускается при первом обращении
+        if cls._loop is None:
+            with cls._lock:
+                if cls._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="async-db", daemon=True).start()
+                    cls._loop = loop
+        return cls._loop
+
+    @classmethod
+    def submit(cls, coroutine):
+        # Запуск сопрограммы в цикле событий из любого потока; возвращает concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coroutine, cls.loop())
+
+    @classmethod
+    async def get_engine(cls):
+        # Выполняется в цикле событий: движок создается при первом обращении
+        if cls._engine is None:
+            if cls._engine_lock is None:
+                cls._engine_lock = asyncio.Lock()
+            async with cls._engine_lock:
+                if cls._engine is None:
+                    settings = Connect.settings()
+                    url = cls.async_url(settings["dsn"])
+                    engine_options = {"pool_pre_ping": settings["pool_pre_ping"]}
+                    if url.get_backend_name() != "sqlite":
+                        engine_options["pool_size"] = settings["pool_size"]
+                        engine_options["max_overflow"] = settings["max_overflow"]
+                    engine = create_async_engine(url, **engine_options)
+                    if settings["query_stats"]:
+                        query_stats.install(engine.sync_engine)
+                    if settings["create_schema"]:
+                        # Та же проверка версии схемы, что и у Connect, через синхронный интерфейс движка
+                        async with engine.connect() as connection:
+                            await connection.run_sync(lambda _: Connect.ensure_schema(engine.sync_engine))
+                    if settings["replica"]:
+                        # Таблицы реплики читаются из локального файла; синхронизация - в потоке реплики Connect
+                        replica = await asyncio.to_thread(Connect.replica)
+                        cls._session_factory = replica.async_session_factory(engine)
+                    else:
+                        cls._session_factory = async_sessionmaker(engine)
+                    cls._engine = engine
+        return cls._engine
+
+    @classmethod
+    async def create_session(cls):
+        # Новая асинхронная сессия на общем пуле соединений
+        await cls.get_engine()
+        return cls._session_factory()
+
+    @classmethod
+    def dispose(cls):
+        # Закрытие пула соединений (например, перед сменой настроек)
+        if cls._engine is not None:
+            engine, cls._engine, cls._session_factory = cls._engine, None, None
+            cls.submit(engine.dispose()).result()
+
+
+# Задача асинхронного слоя: тот же интерфейс, что у DbWorker (signals, cancel, cancelled)
+class AsyncTask:
+    def __init__(self, job, args, session):
+        self.job = job  # Функция-генератор job(session, *args)
+        self.args = args
+        self.session = session  # Асинхронная сессия вызывающего кода (если есть)
+        self.cancelled = False
+        self.action = query_stats.current_action()  # Действие интерфейса, во время которого создана задача
+        self.signals = WorkerSignals()
+        self.future = None  # Выполнение задачи в цикле событий
+
+    def cancel(self):
+        # Отмена проверяется между порциями результата, как у DbWorker
+        self.cancelled = True
+
+    def emit_chunks(self, sync_session):
+        # Выполняется внутри run_sync: запросы генератора не блокируют цикл событий
+        for chunk in self.job(sync_session, *self.args):
+            if self.cancelled:
+                break
+            self.signals.chunk.emit(chunk)  # Передаем порцию в поток интерфейса
+
+    async def run(self):
+        session = None
+        try:
+            if self.session is None:
+                session = await AsyncConnect.create_session()  # Собственная сессия задачи
+            else:
+                session = await resolve(self.session)
+            # Задачи с общей сессией выполняются по очереди: сессию нельзя использовать одновременно
+            async with session_lock(session):
+                with query_stats.attach(self.action):  # Действие хранится в контексте задачи asyncio
+                    await session.run_sync(self.emit_chunks)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+        finally:
+            if self.session is None and session is not None:
+                await session.close()  # Возвращаем соединение в пул
+            self.signals.finished.emit()
+
+
+async def resolve(session):
+    # Сессия вызывающего кода: AsyncTaskGroup.create_session отдает Future, сессия создается в цикле событий
+    if isinstance(session, concurrent.futures.Future):
+        return await asyncio.wrap_future(session)
+    return session
+
+
+def session_lock(session):
+    # Блокировка сессии для задач цикла событий (создается в потоке цикла)
+    return session.info.setdefault("async_lock", asyncio.Lock())
+
+
+# Группа задач окна на асинхронном слое: тот же интерфейс, что у DbTaskGroup
+class AsyncTaskGroup(QObject):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.workers = set()  # Выполняющиеся задачи
+
+    def start(self, job, *args, on_chunk=None, on_failed=None, on_finished=None, session=None):
+        task = AsyncTask(job, args, session)
+        # Результаты отмененной задачи в интерфейс не передаются
+        if on_chunk:
+            task.signals.chunk.connect(lambda chunk: None if task.cancelled else on_chunk(chunk))
+        if on_failed:
+            task.signals.failed.connect(lambda message: None if task.cancelled else on_failed(message))
+        task.signals.finished.connect(lambda: self.on_worker_finished(task, on_finished))
+        self.workers.add(task)
+        task.future = AsyncConnect.submit(task.run())
+        return task
+
+    def on_worker_finished(self, task, on_finished):
+        self.workers.discard(task)
+        if on_finished and not task.cancelled:
+            on_finished()
+
+    def cancel_all(self):
+        for task in list(self.workers):
+            task.cancel()
+
+    def wait(self):
+        # Ожидание завершения задач группы (вызывается из потока интерфейса)
+        concurrent.futures.wait([task.future for task in self.workers])
+
+    def create_session(self):
+        # Сессия, принадлежащая окну или модели (передается в start через session=). Поток интерфейса не ждет
+        # цикл событий и создание движка: возвращается Future, задачи группы получают из него саму сессию
+        return AsyncConnect.submit(AsyncConnect.create_session())
+
+    def close_session(self, session):
+        async def close():
+            await (await resolve(session)).close()
+        AsyncConnect.submit(close())
@@ -0,0 +1,2 @@
+# Нагрузочные измерения приложения: генератор синтетических данных, сценарии и сравнение результатов.
+# Запуск: python -m benchmark generate | run | compare (подробности - python -m benchmark --help)
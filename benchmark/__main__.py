@@ -0,0 +1,124 @@
+# Командная строка измерений:
+#   python -m benchmark generate --dsn sqlite:///bench.db --scale medium [--seed 1] [--schema sql|models]
+#   python -m benchmark run --dsn sqlite:///bench.db [--scenarios startup,discounts] [--repeat 3] [--output results.json]
+#   python -m benchmark compare old.json new.json [--threshold 0.2]
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Окна создаются без экрана
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Модули приложения
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(dsn, names, repeat):
+    # Выполнение сценариев; для каждой метрики сохраняются все замеры, минимум и медиана
+    from PySide6.QtWidgets import QApplication
+    from datebase import Connect, Partner, history_implementation
+    from sqlalchemy import select, func
+    import benchmark.scenarios as scenarios
+
+    Connect.configure(dsn=dsn, create_schema=False)
+    app = QApplication.instance() or QApplication([])
+    with Connect.session_scope() as session:
+        partners = session.execute(select(func.count()).select_from(Partner)).scalar()
+        sales = session.execute(select(func.count()).select_from(history_implementation)).scalar()
+
+    results = {}
+    for name in names:
+        runs = {}
+        for attempt in range(repeat):
+            for metric, value in scenarios.SCENARIOS[name]().items():
+                runs.setdefault(f"{name}.{metric}", []).append(value)
+        for key, values in runs.items():
+            results[key] = {"runs": values, "min": min(values), "median": statistics.median(values)}
+            print(f"{key}: {results[key]['median']:.4f}")
+    app.processEvents()
+    return {
+        "meta": {
+            "backend": Connect.get_engine().dialect.name,
+            "partners": partners,
+            "sales": sales,
+            "repeat": repeat,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(old, new, threshold):
+    # Сравнение медиан; замедление больше порога считается регрессией. Возвращает количество регрессий
+    regressions = 0
+    print(f"{'метрика':40} {'было':>10} {'стало':>10} {'изменение':>10}")
+    for key in sorted(set(old["results"]) & set(new["results"])):
+        before, after = old["results"][key]["median"], new["results"][key]["median"]
+        change = (after - before) / before if before else 0.0
+        # Метрики-счетчики (количество строк) не являются временем и не сравниваются
+        flag = ""
+        if not key.endswith(".rows") and change > threshold:
+            flag = "  РЕГРЕССИЯ"
+            regressions += 1
+        print(f"{key:40} {before:10.4f} {after:10.4f} {change:+10.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    from benchmark.generator import SCALES
+    from benchmark.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Измерение производительности приложения")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="создать и заполнить базу данных")
+    generate_parser.add_argument("--dsn", required=True, help="строка подключения к пустой базе данных")
+    generate_parser.add_argument("--scale", choices=list(SCALES), default="small", help="объем данных: " + ", ".join(f"{name} - {count} продаж" for name, count in SCALES.items()))
+    generate_parser.add_argument("--sales", type=int, help="количество строк истории реализации (вместо --scale)")
+    generate_parser.add_argument("--seed", type=int, default=1, help="начальное значение генератора случайных чисел")
+    generate_parser.add_argument("--schema", choices=["sql", "models"], default="sql", help="источник схемы: create tables.sql или модели datebase.py")
+
+    run_parser = commands.add_parser("run", help="выполнить сценарии")
+    run_parser.add_argument("--dsn", required=True, help="строка подключения к заполненной базе данных")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="сценарии через запятую: " + ", ".join(SCENARIOS))
+    run_parser.add_argument("--repeat", type=int, default=3, help="количество повторов каждого сценария")
+    run_parser.add_argument("--output", default="benchmark_results.json", help="файл результатов")
+
+    compare_parser = commands.add_parser("compare", help="сравнить два файла результатов")
+    compare_parser.add_argument("old", help="результаты до изменений")
+    compare_parser.add_argument("new", help="результаты после изменений")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        from datebase import Connect
+        from benchmark.generator import generate
+        Connect.configure(dsn=args.dsn)
+        size = generate(args.sales or SCALES[args.scale], args.seed, args.schema)
+        print("Создано:", json.dumps(size.as_dict(), ensure_ascii=False))
+    elif args.command == "run":
+        names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+        result = run(args.dsn, names, args.repeat)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f"Результаты: {args.output}")
+    else:
+        with open(args.old, encoding="utf-8") as file:
+            old = json.load(file)
+        with open(args.new, encoding="utf-8") as file:
+            new = json.load(file)
+        sys.exit(1 if compare(old, new, args.threshold) else 0)
@@ -0,0 +1,149 @@
+# Генератор синтетических данных заданного объема.
+# Схема создается по файлу "create tables.sql" (как у рабочей базы данных) или по моделям datebase.py,
+# затем таблицы заполняются данными от генератора случайных чисел с фиксированным начальным значением:
+# одинаковые параметры всегда дают одинаковую базу данных.
+# PostgreSQL заполняется командой COPY, SQLite - пакетной вставкой.
+import datetime
+import os
+import random
+from math import gcd
+from sqlalchemy import Table, MetaData, Column, inspect, text
+from datebase import (
+    Connect, Type_partner, Legal_address, Supplier, Composition, Material_type, Material,
+    Product_type, Products, Partner, Bid, materials_products, product_request, history_implementation
+)
+from bulk_import import copy_rows, insert_rows, sync_sequence
+from sales_totals import rebuild_totals
+import sales_history
+
+SQL_SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create tables.sql")
+SCALES = {"small": 1_000, "medium": 100_000, "large": 10_000_000}  # Количество строк истории реализации
+BATCH_SIZE = 50_000  # Количество строк в одном пакете загрузки
+FIRST_SALE = datetime.date(2023, 1, 1)  # Начало периода продаж
+SALE_DAYS = 730  # Длительность периода продаж в днях
+
+PARTNER_TYPES = ["ЗАО", "ООО", "ПАО", "ОАО"]
+PRODUCT_TYPES = [("Ламинат", 2.35), ("Массивная доска", 5.15), ("Паркетная доска", 4.34), ("Пробковое покрытие", 1.5)]
+CITIES = ["Юрга", "Северодвинск", "Приморск", "Реутов", "Старый Оскол", "Томск", "Казань", "Самара"]
+STREETS = ["Лесная", "Строителей", "Парковая", "Свободы", "Рабочая", "Мира", "Садовая"]
+
+
+class DatasetSize:
+    # Объем справочников, согласованный с количеством продаж.
+    # Пары (партнер, продукция) уникальны, поэтому партнеров и продукции должно хватать на все строки истории
+    def __init__(self, sales):
+        self.sales = sales
+        self.products = 200
+        self.partners = max(100, -(-sales // self.products) * 2)
+        self.addresses = max(10, self.partners // 10)
+        self.materials = 50
+        self.bids = max(50, self.partners // 2)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def create_schema(engine, source):
+    # Схема по SQL-файлу (затем модели добавляют недостающие таблицы и триггеры) или только по моделям
+    if source == "sql":
+        with open(SQL_SCHEMA, encoding="utf-8") as file:
+            script = file.read()
+        if engine.dialect.name == "sqlite":
+            script = script.replace("serial primary key", "integer primary key")
+        with engine.begin() as connection:
+            for statement in script.split(";"):
+                if statement.strip():
+                    connection.exec_driver_sql(statement)
+    Connect.create_tables(engine)  # Таблицы моделей, триггеры и версия схемы
+
+
+def subset(table, names):
+    # Описание части колонок таблицы для загрузки
+    return Table(table.name, MetaData(), *[Column(name, table.c[name].type) for name in names])
+
+
+def load(connection, table, names, rows):
+    # Загрузка строк в таблицу: COPY для PostgreSQL, пакетная вставка для остальных СУБД
+    target = subset(table, names)
+    if connection.dialect.name == "postgresql":
+        copy_rows(connection, target, rows, BATCH_SIZE)
+    else:
+        insert_rows(connection, target, rows, BATCH_SIZE)
+    if "id" in names:
+        sync_sequence(connection, table, ["id"])
+
+
+def sales_rows(rng, size):
+    # Строки истории реализации. Номер строки i переводится в уникальную пару (партнер, продукция)
+    # умножением на число, взаимно простое с количеством пар, поэтому пары равномерно разбросаны без хранения в памяти
+    pairs = size.partners * size.products
+    step = next(step for step in range(pairs // 2 + 1, pairs) if gcd(step, pairs) == 1)
+    for i in range(size.sales):
+        pair = i * step % pairs
+        yield (
+            pair // size.products + 1, pair % size.products + 1, rng.randint(1, 500),
+            FIRST_SALE + datetime.timedelta(days=rng.randrange(SALE_DAYS))
+        )
+
+
+def generate(sales, seed=1, schema="sql", progress=print):
+    # Создание схемы и заполнение базы данных; база данных должна быть пустой
+    size = DatasetSize(sales)
+    rng = random.Random(seed)
+    Connect.configure(**dict(Connect.settings(), create_schema=False))  # Схему создает генератор
+    engine = Connect.get_engine()
+    if inspect(engine).has_table(Partner.__tablename__):
+        raise RuntimeError("База данных не пустая; для генерации нужна новая база данных")
+    create_schema(engine, schema)
+
+    with engine.begin() as connection:
+        progress("Справочники")
+        load(connection, Type_partner.__table__, ["id", "наименование"], enumerate(PARTNER_TYPES, 1))
+        load(connection, Legal_address.__table__, ["id", "индекс", "регион", "город", "улица", "дом"], (
+            (i, rng.randint(100000, 699999), "Область", rng.choice(CITIES), rng.choice(STREETS), rng.randint(1, 200))
+            for i in range(1, size.addresses + 1)
+        ))
+        load(connection, Supplier.__table__, ["id", "наименование", "инн"], ((i, f"Поставщик {i}", f"{rng.randrange(10 ** 12):012d}") for i in range(1, 11)))
+        load(connection, Composition.__table__, ["id", "текущие_остатки"], ((i, f"Склад {i}") for i in range(1, 4)))
+        load(connection, Material_type.__table__, ["id", "наименование", "процент_брака"], ((i, f"Тип материала {i}", round(rng.uniform(0.1, 1.0), 2)) for i in range(1, 6)))
+        load(connection, Material.__table__, ["id", "наименование", "id_поставщик", "id_склад", "ед_измерения", "стоимость", "колво_на_складе", "мин_колво", "id_тип"], (
+            (i, f"Материал {i}", rng.randint(1, 10), rng.randint(1, 3), "кг", rng.randint(10, 1000), rng.randint(0, 100000), rng.randint(10, 1000), rng.randint(1, 5))
+            for i in range(1, size.materials + 1)
+        ))
+        load(connection, Product_type.__table__, ["id", "наименование", "коэф_типа_продукции"], ((i, name, coef) for i, (name, coef) in enumerate(PRODUCT_TYPES, 1)))
+        load(connection, Products.__table__, ["id", "id_тип", "наименование", "мин_стоимость", "колво_на_складе"], (
+            (i, rng.randint(1, len(PRODUCT_TYPES)), f"Продукция {i}", round(rng.uniform(1000, 10000), 2), rng.randint(0, 10000))
+            for i in range(1, size.products + 1)
+        ))
+        load(connection, materials_products, ["id_продукции", "id_материала"], (
+            (product, material) for product in range(1, size.products + 1) for material in rng.sample(range(1, size.materials + 1), 3)
+        ))
+
+        progress(f"Партнеры: {size.partners}")
+        load(connection, Partner.__table__, ["id", "id_тип", "наименование", "id_юр_адрес", "инн", "фио_директора", "телефон", "email", "рейтинг"], (
+            (i, rng.randint(1, len(PARTNER_TYPES)), f"Партнер {i}", rng.randint(1, size.addresses), f"{rng.randrange(10 ** 10):010d}",
+             f"Директор {i}", f"+7 {rng.randint(900, 999)} {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+             f"partner{i}@example.com", rng.randint(0, 10))
+            for i in range(1, size.partners + 1)
+        ))
+
+        progress(f"Заявки: {size.bids}")
+        load(connection, Bid.__table__, ["id", "дата_создания", "статус", "id_партнер"], (
+            (i, FIRST_SALE + datetime.timedelta(days=rng.randrange(SALE_DAYS)), "Новая", rng.randint(1, size.partners))
+            for i in range(1, size.bids + 1)
+        ))
+        load(connection, product_request, ["id_заявки", "id_продукции", "количество_продукции", "стоимость"], (
+            (bid, product, rng.randint(1, 1000), round(rng.uniform(1000, 10000), 2))
+            for bid in range(1, size.bids + 1) for product in rng.sample(range(1, size.products + 1), rng.randint(1, 3))
+        ))
+
+        # Секции месяцев периода продаж (если таблица секционирована)
+        if sales_history.is_partitioned(connection):
+            sales_history.create_partitions(connection, FIRST_SALE, FIRST_SALE + datetime.timedelta(days=SALE_DAYS))
+
+        progress(f"История реализации: {size.sales}")
+        load(connection, history_implementation, ["id_партнер", "id_продукция", "количество", "дата_продажи"], sales_rows(rng, size))
+        rebuild_totals(connection)
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("ANALYZE"))
+    return size
@@ -0,0 +1,191 @@
+# Сценарии измерений. Каждый сценарий возвращает словарь "метрика -> секунды".
+# Окна создаются без экрана (платформа Qt offscreen), фоновая загрузка ожидается обработкой событий.
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from PySide6.QtWidgets import QApplication
+from datebase import Connect
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # Папка приложения
+TIMEOUT = 600  # Предельное время ожидания фоновой загрузки, секунд
+
+# Запуск приложения в отдельном процессе: время импорта модулей, создания окна и появления первой страницы партнеров
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+app = QApplication([])
+from main_window import MainWindow
+imported = time.perf_counter()
+window = MainWindow()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+while window.partner_model.rowCount() == 0 and window.partner_model.has_more and time.perf_counter() - started < {timeout}:
+    app.processEvents()
+    time.sleep(0.001)
+first_page = time.perf_counter()
+print(json.dumps({{"import": imported - started, "window": shown - started, "first_page": first_page - started}}))
+"""
+
+
+def wait_until(condition, timeout=TIMEOUT):
+    # Обработка событий Qt до выполнения условия
+    app = QApplication.instance()
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Превышено время ожидания")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def startup():
+    env = dict(os.environ, PRAKTIKA_DSN=Connect.settings()["dsn"], PRAKTIKA_CREATE_SCHEMA="0", QT_QPA_PLATFORM="offscreen")
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT.format(timeout=TIMEOUT)], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def partner_list():
+    # Загрузка всего списка партнеров страницами, как при прокрутке до конца
+    from partner_list import PartnerListModel
+    started = time.perf_counter()
+    model = PartnerListModel()
+    model.fetchMore()
+    wait_until(lambda: model.rowCount() > 0 or not model.has_more)
+    first_page = time.perf_counter() - started
+    while model.canFetchMore() or model.loading:
+        if model.canFetchMore():
+            model.fetchMore()
+        wait_until(lambda: not model.loading)
+    return {"first_page": first_page, "all_pages": time.perf_counter() - started, "rows": model.rowCount()}
+
+
+def discounts():
+    # Скидки всех партнеров: без кэша итогов продаж и из кэша
+    from discount import get_partners_discounts
+    from sales_totals import totals_cache
+    totals_cache.invalidate()
+    with Connect.session_scope() as session:
+        started = time.perf_counter()
+        get_partners_discounts(session)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        get_partners_discounts(session)
+        warm = time.perf_counter() - started
+    return {"cold": cold, "warm": warm}
+
+
+def history_dialog(blocks=10):
+    # Открытие истории реализации: первый блок строк и прокрутка еще на несколько блоков
+    from ProductRequestDialog import ProductRequestDialog
+    started = time.perf_counter()
+    dialog = ProductRequestDialog()
+    model = dialog.model
+    model.fetchMore()
+    wait_until(lambda: model.rowCount() > 0 or model.exhausted)
+    first_block = time.perf_counter() - started
+    for _ in range(blocks):
+        if not model.canFetchMore():
+            break
+        model.fetchMore()
+        wait_until(lambda: not model.loading)
+    scrolled = time.perf_counter() - started
+    dialog.done(0)
+    return {"first_block": first_block, "scrolled": scrolled}
+
+
+def report_generation():
+    # Все отчеты во временную папку
+    import reports
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, function in [("partners", reports.partners_report), ("sales", reports.sales_report), ("material", reports.material_report)]:
+            started = time.perf_counter()
+            function(os.path.join(folder, f"{name}.pdf"))
+            result[name] = time.perf_counter() - started
+    return result
+
+
+def analytics():
+    # Срезы аналитики продаж по итогам месяцев
+    from sales_analytics import pivot
+    result = {}
+    with Connect.session_scope() as session:
+        for name, rows, columns in [("partner_types_by_month", "partner_type", "month"), ("partners_by_product_type", "partner", "product_type")]:
+            started = time.perf_counter()
+            pivot(session, rows, columns)
+            result[name] = time.perf_counter() - started
+    return result
+
+
+def search():
+    # Поиск партнеров: загрузка индекса в памяти и запросы разной избирательности по данным генератора
+    from partner_search import PartnerIndex
+    index = PartnerIndex()
+    result = {}
+    with Connect.session_scope() as session:
+        started = time.perf_counter()
+        index.load(session)
+        result["index_load"] = time.perf_counter() - started
+    for name, query in [("name", "Партнер 12"), ("phone", "+7 95"), ("email", "partner1@"), ("common", "партнер")]:
+        started = time.perf_counter()
+        index.search(query)
+        result[name] = time.perf_counter() - started
+    return result
+
+
+def bid_entry(bids=10):
+    # Ввод заявок со всей продукцией каталога: расчет строк в памяти и запись заявок; время приводится к 1000 строк.
+    # Созданные заявки удаляются, чтобы повторные измерения шли на тех же данных
+    from sqlalchemy import select, delete
+    from datebase import Bid, Partner, Products, product_request
+    from bids import load_price_list, price_lines, save_bid
+    with Connect.session_scope() as session:
+        partner_id = session.execute(select(Partner.id).order_by(Partner.id).limit(1)).scalar()
+        lines = [(product_id, 10) for product_id in session.execute(select(Products.id).where(Products.мин_стоимость.is_not(None))).scalars()]
+        price_list = load_price_list(session, partner_id)
+        started = time.perf_counter()
+        for _ in range(bids):
+            priced, _ = price_lines(price_list, lines)
+        priced_seconds = time.perf_counter() - started
+        created = []
+        started = time.perf_counter()
+        for _ in range(bids):
+            created.append(save_bid(session, partner_id, priced))
+            session.commit()
+        saved_seconds = time.perf_counter() - started
+        session.execute(delete(product_request).where(product_request.c.id_заявки.in_(created)))
+        session.execute(delete(Bid).where(Bid.id.in_(created)))
+    total_lines = bids * len(lines)
+    return {"price_1000_lines": priced_seconds * 1000 / total_lines, "save_1000_lines": saved_seconds * 1000 / total_lines}
+
+
+def sales_export():
+    # Выгрузка всей истории реализации в Parquet и CSV; время приводится к миллиону строк
+    from sales_export import export_sales
+    result = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for file_format in ("parquet", "csv"):
+            started = time.perf_counter()
+            rows, _ = export_sales(os.path.join(folder, file_format), file_format)
+            result[f"{file_format}_1m_rows"] = (time.perf_counter() - started) * 1000000 / max(rows, 1)
+    return result
+
+
+SCENARIOS = {
+    "startup": startup,
+    "partner_list": partner_list,
+    "discounts": discounts,
+    "history_dialog": history_dialog,
+    "reports": report_generation,
+    "analytics": analytics,
+    "search": search,
+    "bid_entry": bid_entry,
+    "sales_export": sales_export,
+}
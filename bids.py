@@ -0,0 +1,212 @@
+# Ввод заявок партнеров. Заявка проверяется и рассчитывается целиком в памяти: цены всей продукции и скидка
+# партнера загружаются заранее (PriceList), затем все строки проверяются и получают стоимость за один проход
+# (price_lines). Заявка и все ее строки записываются в одной транзакции: строка заявки - одной вставкой
+# с возвратом id, строки продукции - одной пакетной вставкой (executemany) без создания ORM-объектов.
+# Стоимость строки - минимальная стоимость продукции с учетом скидки партнера, умноженная на количество.
+#
+# Запуск: python bids.py строки.csv --partner 5 [--delimiter ";"]
+# Колонки файла: продукция (id или наименование), количество, дата производства (необязательно).
+import argparse
+import csv
+import datetime
+import time
+from sqlalchemy import select, insert
+from datebase import Connect, Bid, Partner, Products, product_request
+from discount import get_partners_discounts  # Скидка партнера по итогам продаж
+
+STATUS_NEW = "Новая"  # Статус новой заявки
+
+
+class BidError(ValueError):
+    # Заявка не прошла проверку; errors - список (номер строки или None для заявки в целом, причина)
+    def __init__(self, errors):
+        self.errors = errors
+        shown = "; ".join(f"строка {line}: {reason}" if line else reason for line, reason in errors[:5])
+        more = f" (и еще ошибок: {len(errors) - 5})" if len(errors) > 5 else ""
+        super().__init__(shown + more)
+
+
+def normalize_name(name):
+    return " ".join(name.lower().replace("ё", "е").split())
+
+
+# Цены продукции и скидка партнера для расчета строк заявки в памяти
+class PriceList:
+    def __init__(self, partner_id, partner_name, discount, products):
+        self.partner_id = partner_id
+        self.partner_name = partner_name
+        self.discount = discount  # Скидка партнера, %
+        self.products = products  # id продукции -> (наименование, минимальная стоимость)
+        self.by_name = {normalize_name(name): product_id for product_id, (name, _) in products.items() if name}
+
+    def find(self, value):
+        # id продукции по id или наименованию (без учета регистра); None, если продукции нет
+        if isinstance(value, int):
+            return value if value in self.products else None
+        value = str(value).strip()
+        if value.isdigit() and int(value) in self.products:
+            return int(value)
+        return self.by_name.get(normalize_name(value))
+
+    def unit_price(self, product_id):
+        # Цена единицы продукции для партнера (None, если у продукции нет минимальной стоимости)
+        price = self.products[product_id][1]
+        return None if price is None else round(price * (100 - self.discount) / 100, 2)
+
+
+def load_price_list(session, partner_id):
+    # Цены всей продукции одним запросом и скидка партнера
+    partner = session.execute(select(Partner.id, Partner.наименование).where(Partner.id == partner_id)).first()
+    if partner is None:
+        raise BidError([(None, f"нет партнера с id {partner_id}")])
+    products = {row.id: (row.наименование, row.мин_стоимость) for row in session.execute(
+        select(Products.id, Products.наименование, Products.мин_стоимость)
+    )}
+    discount = get_partners_discounts(session, [partner_id])[partner_id]
+    return PriceList(partner_id, partner.наименование, discount, products)
+
+
+# Строка заявки после проверки и расчета
+class PricedLine:
+    __slots__ = ("line", "product_id", "quantity", "price", "cost", "production_date")
+
+    def __init__(self, line, product_id, quantity, price, production_date):
+        self.line = line  # Номер строки во вводе
+        self.product_id = product_id
+        self.quantity = quantity
+        self.price = price  # Цена единицы с учетом скидки
+        self.cost = round(price * quantity, 2)  # Стоимость строки
+        self.production_date = production_date
+
+
+def parse_quantity(value):
+    # Количество: целое положительное число (из ввода оно может прийти строкой)
+    if isinstance(value, int):
+        quantity = value
+    elif value is None or not str(value).strip():
+        raise ValueError("не указано количество")
+    else:
+        try:
+            quantity = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f"количество {value!r} не является целым числом") from None
+    if quantity <= 0:
+        raise ValueError("количество должно быть больше нуля")
+    return quantity
+
+
+def parse_date(value):
+    # Дата производства: date, строка ГГГГ-ММ-ДД или ДД.ММ.ГГГГ, пустое значение - без даты
+    if value is None or isinstance(value, datetime.date):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        if "." in value:
+            return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"неверная дата производства {value!r}") from None
+
+
+def price_lines(price_list, lines):
+    # Проверка и расчет всех строк за один проход.
+    # lines - последовательность (продукция, количество[, дата производства]); строки нумеруются с 1.
+    # Возвращает (рассчитанные строки, ошибки); продукция может входить в заявку только один раз
+    priced, errors = [], []
+    seen = {}  # id продукции -> номер строки, в которой она уже есть
+    for number, values in enumerate(lines, 1):
+        product = values[0] if len(values) > 0 else None
+        quantity = values[1] if len(values) > 1 else None
+        product_id = price_list.find(product) if product not in (None, "") else None
+        if product_id is None:
+            errors.append((number, f"нет продукции {product!r}" if product not in (None, "") else "не указана продукция"))
+            continue
+        if product_id in seen:
+            errors.append((number, f"продукция уже есть в строке {seen[product_id]}"))
+            continue
+        seen[product_id] = number
+        price = price_list.unit_price(product_id)
+        if price is None:
+            errors.append((number, "у продукции не указана минимальная стоимость"))
+            continue
+        try:
+            quantity = parse_quantity(quantity)
+            production_date = parse_date(values[2] if len(values) > 2 else None)
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+        priced.append(PricedLine(number, product_id, quantity, price, production_date))
+    if not priced and not errors:
+        errors.append((None, "в заявке нет строк"))
+    return priced, errors
+
+
+def save_bid(session, partner_id, priced, employee_id=None, prepayment=None, production_date=None):
+    # Запись заявки и всех строк без фиксации транзакции; возвращает id заявки
+    bid_id = session.execute(insert(Bid).values(
+        дата_создания=datetime.date.today(),
+        статус=STATUS_NEW,
+        id_партнер=partner_id,
+        id_сотрудник=employee_id,
+        предоплата=prepayment,
+        дата_производства=production_date,
+        согласована=False,
+    ).returning(Bid.id)).scalar_one()
+    session.execute(insert(product_request), [
+        {
+            "id_заявки": bid_id,
+            "id_продукции": line.product_id,
+            "количество_продукции": line.quantity,
+            "стоимость": line.cost,
+            "дата_производства": line.production_date,
+        }
+        for line in priced
+    ])
+    return bid_id
+
+
+def enter_bid(session, partner_id, lines, price_list=None, **fields):
+    # Проверка, расчет и запись заявки в одной транзакции; при ошибках проверки - BidError, в базу ничего не пишется.
+    # Возвращает (id заявки, рассчитанные строки)
+    if price_list is None:
+        price_list = load_price_list(session, partner_id)
+    priced, errors = price_lines(price_list, lines)
+    if errors:
+        raise BidError(errors)
+    try:
+        bid_id = save_bid(session, partner_id, priced, **fields)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return bid_id, priced
+
+
+def read_lines(path, delimiter):
+    # Строки заявки из CSV-файла; первая строка - заголовок
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        next(reader, None)
+        return [row for row in reader if any(value.strip() for value in row)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ввод заявки партнера из CSV-файла")
+    parser.add_argument("file", help="CSV-файл: продукция (id или наименование), количество, дата производства")
+    parser.add_argument("--partner", type=int, required=True, help="id партнера")
+    parser.add_argument("--delimiter", default=";", help="Разделитель полей (по умолчанию ;)")
+    args = parser.parse_args()
+    lines = read_lines(args.file, args.delimiter)
+    started = time.perf_counter()
+    with Connect.session_scope() as session:
+        try:
+            bid_id, priced = enter_bid(session, args.partner, lines)
+        except BidError as e:
+            for line, reason in e.errors:
+                print(f"строка {line}: {reason}" if line else reason)
+            raise SystemExit(1)
+    seconds = time.perf_counter() - started
+    print(f"Заявка {bid_id}: строк {len(priced)}, сумма {sum(line.cost for line in priced):.2f}, "
+          f"{seconds:.3f} с, {len(priced) / seconds:.0f} строк/с")
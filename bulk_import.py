@@ -0,0 +1,329 @@
+# Массовая загрузка данных из CSV: история реализации и справочники.
+# Файл читается потоком и проходит через временную (промежуточную) таблицу:
+#   1. строки разбираются и проверяются по типам колонок, ошибочные строки отклоняются сразу;
+#   2. PostgreSQL получает строки командой COPY, другие СУБД - пакетной вставкой (executemany);
+#   3. внешние ключи, пустые ключи и повторы ключа в файле проверяются одним SQL-запросом на каждое правило;
+#   4. прошедшие проверку строки одной командой вставляются в целевую таблицу с обновлением
+#      существующих строк по первичному ключу; для истории реализации ключ - id_партнер, id_продукция (UPSERT_KEYS),
+#      поэтому строка с исправленной датой продажи обновляет прежнюю. В секционированной таблице PostgreSQL
+#      дата продажи входит в первичный ключ, уникального индекса по партнеру и продукции нет, и вместо
+#      INSERT ... ON CONFLICT выполняются обновление найденных строк и вставка остальных.
+# Отклоненные строки с номером строки файла и причиной записываются в отдельный CSV-файл.
+#
+# Запуск: python bulk_import.py продажи.csv [--table история_реализации] [--delimiter ";"] [--batch-size 10000]
+# Первая строка файла - имена колонок таблицы; колонки первичного ключа обязательны.
+import argparse
+import csv
+import datetime
+import decimal
+import io
+import time
+from sqlalchemy import (
+    Table, MetaData, Column, Integer, String, Float, Numeric, Boolean, Date, inspect, select, insert, update, delete, exists, and_, func, literal, text, true
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from datebase import Base, Connect, history_implementation
+
+BATCH_SIZE = 10000  # Количество строк в одном пакете вставки или COPY
+STAGING_PREFIX = "импорт_"  # Префикс имени промежуточной таблицы
+UPSERT_KEYS = {  # Таблица -> колонки, по которым строка файла заменяет строку таблицы (если не совпадают с первичным ключом)
+    history_implementation.name: ["id_партнер", "id_продукция"],
+}
+
+
+class ImportResult:
+    # Итоги загрузки файла
+    def __init__(self, table):
+        self.table = table  # Целевая таблица
+        self.read = 0  # Прочитано строк данных
+        self.loaded = 0  # Загружено (вставлено или обновлено) строк
+        self.rejected = []  # Отклоненные строки: (номер строки, причина, значения)
+        self.superseded = 0  # Строки, замененные следующей строкой файла с тем же ключом
+        self.seconds = 0.0  # Время загрузки
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.table}: прочитано {self.read}, загружено {self.loaded}, заменено повторами ключа {self.superseded}, "
+                f"отклонено {len(self.rejected)}, "
+                f"{self.seconds:.2f} с, {self.rows_per_second:.0f} строк/с")
+
+
+def parse_date(value):
+    # Даты принимаются в формате ГГГГ-ММ-ДД или ДД.ММ.ГГГГ
+    if "." in value:
+        return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+    return datetime.date.fromisoformat(value)
+
+
+def value_parser(column_type):
+    # Функция преобразования текста из файла в значение колонки
+    if isinstance(column_type, Integer):
+        return int
+    if isinstance(column_type, Float):
+        return lambda value: float(value.replace(",", "."))
+    if isinstance(column_type, Numeric):
+        return lambda value: decimal.Decimal(value.replace(",", "."))
+    if isinstance(column_type, Date):
+        return parse_date
+    if isinstance(column_type, Boolean):
+        return lambda value: value.lower() in ("1", "true", "да", "t", "y")
+    return str
+
+
+def parse_rows(reader, columns, result):
+    # Разбор строк файла; строки с неверным количеством полей или форматом значений отклоняются
+    parsers = [value_parser(column.type) for column in columns]
+    for values in reader:
+        result.read += 1
+        line = reader.line_num
+        if len(values) != len(columns):
+            result.rejected.append((line, f"ожидалось полей: {len(columns)}, получено: {len(values)}", values))
+            continue
+        try:
+            yield [line] + [parser(value.strip()) if value.strip() else None for parser, value in zip(parsers, values)]
+        except (ValueError, decimal.InvalidOperation) as e:
+            result.rejected.append((line, f"неверный формат значения: {e}", values))
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_staging(connection, table, columns):
+    # Временная таблица с колонками файла и номером строки файла
+    staging = Table(
+        STAGING_PREFIX + table.name, MetaData(),
+        Column("номер_строки", Integer),
+        *[Column(column.name, column.type) for column in columns],
+        prefixes=["TEMPORARY"]
+    )
+    staging.drop(connection, checkfirst=True)
+    staging.create(connection)
+    return staging
+
+
+def copy_rows(connection, staging, rows, batch_size):
+    # Загрузка строк в промежуточную таблицу командой COPY (psycopg 3 или psycopg2)
+    preparer = connection.dialect.identifier_preparer
+    sql = f"COPY {preparer.format_table(staging)} ({', '.join(preparer.quote(column.name) for column in staging.columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = connection.connection.cursor()
+    try:
+        if connection.dialect.driver == "psycopg":
+            with cursor.copy(sql) as copy:
+                for batch in batches(rows, batch_size):
+                    copy.write(csv_block(batch))
+        else:
+            cursor.copy_expert(sql, CsvStream(batches(rows, batch_size)))
+    finally:
+        cursor.close()
+
+
+def csv_block(batch):
+    # Пакет строк в формате CSV для COPY; NULL передается пустым полем без кавычек
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(batch)
+    return buffer.getvalue()
+
+
+class CsvStream:
+    # Файлоподобный объект для copy_expert (psycopg2): отдает CSV по пакетам, не держа весь файл в памяти
+    def __init__(self, batches):
+        self.batches = batches
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            batch = next(self.batches, None)
+            if batch is None:
+                break
+            self.buffer += csv_block(batch)
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    readline = read
+
+
+def insert_rows(connection, staging, rows, batch_size):
+    # Пакетная вставка в промежуточную таблицу для СУБД без COPY
+    names = [column.name for column in staging.columns]
+    statement = insert(staging)
+    for batch in batches(rows, batch_size):
+        connection.execute(statement, [dict(zip(names, row)) for row in batch])
+
+
+def reject_where(connection, staging, rejects, reason, condition, from_clause=None):
+    # Отклонение строк промежуточной таблицы, удовлетворяющих условию (одним запросом)
+    query = select(staging.c.номер_строки, literal(reason)).select_from(from_clause if from_clause is not None else staging).where(condition)
+    connection.execute(insert(rejects).from_select(["номер_строки", "причина"], query))
+
+
+def validate(connection, table, staging, key_columns):
+    # Проверки на уровне множеств: пустой ключ и отсутствующие внешние ключи
+    rejects = Table(
+        STAGING_PREFIX + "отклоненные", MetaData(),
+        Column("номер_строки", Integer), Column("причина", String),
+        prefixes=["TEMPORARY"]
+    )
+    rejects.drop(connection, checkfirst=True)
+    rejects.create(connection)
+
+    for name in key_columns:
+        reject_where(connection, staging, rejects, f"пустое значение ключа {name}", staging.c[name].is_(None))
+
+    for foreign_key in table.foreign_keys:
+        column = foreign_key.parent
+        if column.name not in staging.c:
+            continue
+        parent = foreign_key.column.table
+        reject_where(
+            connection, staging, rejects, f"нет записи {parent.name}.{foreign_key.column.name} = {column.name}",
+            staging.c[column.name].is_not(None) & foreign_key.column.is_(None),
+            staging.outerjoin(parent, staging.c[column.name] == foreign_key.column)
+        )
+
+    # Отклоненные строки с причиной и значениями, затем удаление их из промежуточной таблицы
+    reasons = select(rejects.c.номер_строки, func.min(rejects.c.причина).label("причина")).group_by(rejects.c.номер_строки).subquery()
+    rejected = [
+        (row[0], row[1], list(row[2:])) for row in connection.execute(
+            select(reasons.c.номер_строки, reasons.c.причина, *list(staging.columns)[1:]).join_from(
+                reasons, staging, reasons.c.номер_строки == staging.c.номер_строки
+            )
+        )
+    ]
+    connection.execute(delete(staging).where(staging.c.номер_строки.in_(select(rejects.c.номер_строки))))
+    rejects.drop(connection)
+    return rejected
+
+
+def remove_superseded(connection, staging, key_columns):
+    # Из строк файла с одинаковым ключом остается последняя: более ранние строки ею заменяются
+    ranked = select(
+        staging.c.номер_строки,
+        func.row_number().over(partition_by=[staging.c[name] for name in key_columns], order_by=staging.c.номер_строки.desc()).label("номер")
+    ).subquery()
+    superseded = select(ranked.c.номер_строки).where(ranked.c.номер > 1)
+    return connection.execute(delete(staging).where(staging.c.номер_строки.in_(superseded))).rowcount
+
+
+def upsert(connection, table, staging, columns, key_columns):
+    # Вставка строк промежуточной таблицы с обновлением существующих строк по ключу
+    names = [column.name for column in columns]
+    query = select(*[staging.c[name] for name in names]).where(true())  # WHERE нужен SQLite для разбора INSERT ... SELECT ... ON CONFLICT
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table).from_select(names, query)
+    update_columns = {name: statement.excluded[name] for name in names if name not in key_columns}
+    if update_columns:
+        statement = statement.on_conflict_do_update(index_elements=key_columns, set_=update_columns)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+    connection.execute(statement)
+
+
+def update_insert(connection, table, staging, columns, key_columns):
+    # Замена строк по ключу, за которым нет уникального индекса: строки таблицы с ключом из файла обновляются
+    # (строка с новой датой продажи переходит в другую секцию), остальные строки файла вставляются.
+    # Загрузки в одну таблицу выполняются по очереди, чтобы одновременная загрузка не вставила тот же ключ
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": STAGING_PREFIX + table.name})
+    names = [column.name for column in columns]
+    matches = and_(*[table.c[name] == staging.c[name] for name in key_columns])
+    values = {name: staging.c[name] for name in names if name not in key_columns}
+    if values:
+        connection.execute(update(table).values(values).where(matches))
+    query = select(*[staging.c[name] for name in names]).where(~exists().where(matches))
+    connection.execute(insert(table).from_select(names, query))
+
+
+def sync_sequence(connection, table, key_columns):
+    # После загрузки справочника с явными id счетчик serial переводится за максимальный id
+    if connection.dialect.name == "postgresql" and key_columns == ["id"]:
+        connection.execute(text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE(MAX(id), 1)) FROM " + connection.dialect.identifier_preparer.format_table(table)
+        ), {"table": connection.dialect.identifier_preparer.format_table(table)})
+
+
+def import_csv(file_path, table=history_implementation, delimiter=",", batch_size=BATCH_SIZE):
+    # Загрузка CSV-файла в таблицу; возвращает ImportResult
+    if isinstance(table, str):
+        table = Base.metadata.tables[table]
+    result = ImportResult(table.name)
+    started = time.perf_counter()
+
+    with open(file_path, encoding="utf-8-sig", newline="") as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        header = [name.strip() for name in next(reader)]
+        unknown = [name for name in header if name not in table.c]
+        if unknown:
+            raise ValueError(f"В таблице {table.name} нет колонок: {', '.join(unknown)}")
+        columns = [table.c[name] for name in header]
+
+        with Connect.get_engine().begin() as connection:
+            # Ключ берется из базы данных: он определяет, по каким колонкам строки считаются одинаковыми,
+            # если для таблицы не задан собственный ключ замены строк
+            primary_key = inspect(connection).get_pk_constraint(table.name)["constrained_columns"]
+            key_columns = UPSERT_KEYS.get(table.name, primary_key)
+            required = list(dict.fromkeys(key_columns + primary_key))
+            missing = [name for name in required if name not in header]
+            if missing:
+                raise ValueError(f"В файле нет колонок ключа: {', '.join(missing)}")
+
+            staging = create_staging(connection, table, columns)
+            rows = parse_rows(reader, columns, result)
+            if connection.dialect.name == "postgresql":
+                copy_rows(connection, staging, rows, batch_size)
+            else:
+                insert_rows(connection, staging, rows, batch_size)
+
+            result.rejected.extend(validate(connection, table, staging, required))
+            result.superseded = remove_superseded(connection, staging, key_columns)
+            result.loaded = connection.execute(select(func.count()).select_from(staging)).scalar()
+            if set(key_columns) == set(primary_key):
+                upsert(connection, table, staging, columns, key_columns)
+            else:
+                update_insert(connection, table, staging, columns, key_columns)
+            sync_sequence(connection, table, key_columns)
+            staging.drop(connection)
+
+    result.rejected.sort(key=lambda row: row[0])
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def write_rejected(result, file_path, header):
+    # Отчет об отклоненных строках: номер строки файла, причина и значения строки
+    with open(file_path, "w", encoding="utf-8-sig", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["номер_строки", "причина"] + header)
+        for line, reason, values in result.rejected:
+            writer.writerow([line, reason] + ["" if value is None else value for value in values])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая загрузка CSV-файла в таблицу базы данных")
+    parser.add_argument("file", help="CSV-файл, первая строка - имена колонок")
+    parser.add_argument("--table", default=history_implementation.name, help="целевая таблица (по умолчанию история реализации)")
+    parser.add_argument("--delimiter", default=",", help="разделитель полей")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="количество строк в одном пакете")
+    parser.add_argument("--rejected", help="файл отчета об отклоненных строках (по умолчанию <файл>.rejected.csv)")
+    args = parser.parse_args()
+
+    result = import_csv(args.file, args.table, args.delimiter, args.batch_size)
+    print(result.summary())
+    if result.rejected:
+        rejected_path = args.rejected or args.file + ".rejected.csv"
+        with open(args.file, encoding="utf-8-sig", newline="") as file:
+            header = next(csv.reader(file, delimiter=args.delimiter))
+        write_rejected(result, rejected_path, header)
+        print(f"Отклоненные строки: {rejected_path}")
@@ -91,6 +91,7 @@ foreign key (id_тип) references тип_партнера(id),
 foreign key (id_юр_адрес) references юридический_адрес(id)
 );
 
+-- Секции по месяцам даты продажи (PostgreSQL): python sales_history.py partition; в секционированной таблице дата продажи входит в первичный ключ
 create table история_реализации (
 id_партнер int,
 id_продукция int,
@@ -101,6 +102,8 @@ foreign key(id_партнер) references партнер(id) on delete cascade,
 foreign key(id_продукция) references продукция(id) on delete cascade
 );
 
+create index история_реализации_дата_idx on история_реализации(дата_продажи);
+
 create table паспорт (
 id serial primary key,
 серия int,
@@ -1,10 +1,19 @@
-from datebase import Partner, history_implementation
+from sales_totals import totals_cache  # Итоги продаж, поддерживаемые триггерами
 
 def get_total_sales(partner_id, session):
-    # Запрос к базе данных для подсчета всех продаж данного партнера
-    sales = session.query(history_implementation).filter(history_implementation.c.id_партнер == partner_id).all()
-    total_sales = sum(int(sale.количество) for sale in sales)  # Предполагаем, что 'количество' - это количество реализованных товаров
-    return total_sales
+    # Итог продаж партнера читается из таблицы итогов (или кэша), без обращения к истории реализации
+    return get_partners_total_sales(session, [partner_id]).get(partner_id, 0)
+
+def get_partners_total_sales(session, partner_ids=None):
+    # Итоги для списка партнеров одним запросом по первичному ключу таблицы итогов
+    return totals_cache.get_many(session, partner_ids)
+
+def get_partners_discounts(session, partner_ids=None):
+    # Скидки для списка партнеров по данным одного запроса (без списка - для всех партнеров с продажами)
+    totals = get_partners_total_sales(session, partner_ids)
+    if partner_ids is None:
+        partner_ids = totals.keys()
+    return {partner_id: calculate_discount(totals.get(partner_id, 0)) for partner_id in partner_ids}
 
 def calculate_discount(total_sales):
     # Логика расчета скидки в зависимости от объема продаж
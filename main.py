@@ -1,7 +1,15 @@
-from PySide6.QtWidgets import  QApplication
-from main_window import MainWindow
+import startup_timing  # Отметки времени запуска (импортируется первым)
 
-app = QApplication([]) # Создаем объект приложения QApplication
-window = MainWindow() # Создаем объект MainWindow
-window.show() # Отображаем окно приложения
-app.exec() # Запускаем цикл событий приложения
\ No newline at end of file
+# Проверка нужна, чтобы дочерние процессы (выписки партнерам) не запускали приложение повторно
+if __name__ == "__main__":
+    from PySide6.QtWidgets import  QApplication
+    from main_window import MainWindow
+    startup_timing.mark("импорт модулей")
+
+    app = QApplication([]) # Создаем объект приложения QApplication
+    startup_timing.mark("создание QApplication")
+    window = MainWindow() # Создаем объект MainWindow
+    startup_timing.mark("создание окна")
+    startup_timing.watch(window) # Первая отрисовка и первая страница партнеров
+    window.show() # Отображаем окно приложения
+    app.exec() # Запускаем цикл событий приложения
@@ -1,65 +1,40 @@
-from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFrame, QScrollArea, QPushButton, QMessageBox
-from PySide6.QtGui import QPixmap, QIcon
-from datebase import Partner, Connect  # Импортируем модели Partner и Connect для работы с базой данных
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QListView, QPushButton, QMessageBox, QMenu, QProgressDialog, QFileDialog
+from PySide6.QtCore import Qt, QEvent, QTimer
 from PartnerForm import PartnerForm  # Импортируем форму для добавления/редактирования партнера
-from ProductRequestDialog import ProductRequestDialog  # Импортируем диалог для работы с реализацией продукции
-from discount import calculate_discount, get_total_sales # Импортируем методы
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-
-# Класс, представляющий карточку партнера
-class PartnerCard(QFrame):
-    def __init__(self, partner, type_partner, session):
-        super().__init__()  # Инициализация родительского класса QFrame
-        self.setFrameShape(QFrame.Box)  # Устанавливаем рамку карточки
-        self.setLineWidth(1)  # Устанавливаем ширину линии рамки
-
-        self.partner = partner  # Сохраняем информацию о партнере
-        self.session = session  # Соединение с базой данных
-        
-        # Основной layout карточки (горизонтальный)
-        layout = QHBoxLayout()
-
-        # Левая часть карточки с информацией о партнере
-        left_layout = QVBoxLayout()
-        left_layout.addWidget(QLabel(f"{type_partner.наименование} | {partner.наименование}"))  # Наименование партнера
-        left_layout.addWidget(QLabel(f"{partner.фио_директора}"))  # ФИО директора
-        left_layout.addWidget(QLabel(f"{partner.телефон}"))  # Телефон
-        left_layout.addWidget(QLabel(f"Рейтинг: {partner.рейтинг}"))  # Рейтинг партнера
-
-        # Правая часть карточки с информацией о скидке
-        right_layout = QVBoxLayout()
-        self.discount_label = QLabel()  # Не задаем скидку сразу
-        right_layout.addWidget(self.discount_label)  # Добавляем виджет скидки в layout
-
-        # Собираем layout: добавляем левую и правую части
-        layout.addLayout(left_layout)
-        layout.addLayout(right_layout)
-        self.setLayout(layout)  # Устанавливаем layout для текущей карточки
-
-        self.update_discount()  # Обновляем скидку после полной инициализации карточки
-
-    def update_discount(self):
-        # Обновляем скидку на интерфейсе
-        self.discount_label.setText(f"Скидка: {self.update_partner_discount()}%")
-    
-    def update_partner_discount(self):
-        total_sales = get_total_sales(self.partner.id, self.session)  # Получаем общие продажи для партнера
-        discount = calculate_discount(total_sales)  # Рассчитываем скидку
-        return discount
-
-    
+from partner_list import PartnerListModel, PartnerCardDelegate  # Модель и делегат списка партнеров
+import datetime
+import os
+import assets  # Общий кэш логотипа и иконки
+from workers import DbTaskGroup, create_task_group  # Фоновые задачи
+import partner_search  # Поиск партнеров
+import stock_monitor  # Монитор остатков на складах
+from stock_panel import StockEvents  # События монитора остатков в потоке интерфейса
+from datebase import Connect  # Настройки подключения
+import query_stats  # Действия интерфейса для статистики запросов
+from PySide6.QtGui import QShortcut, QKeySequence
+# Диалоги реализации продукции, аналитики и заявок, отчеты (reportlab, NumPy) и выписки импортируются при первом использовании,
+# чтобы не замедлять запуск приложения
+
 # Главный класс окна приложения
 class MainWindow(QMainWindow):
+    SEARCH_DELAY = 100  # Пауза ввода перед поиском, мс: при быстром наборе страницы не загружаются на каждый символ
+
     def __init__(self):
         super().__init__()  # Инициализация родительского класса QMainWindow
         self.setWindowTitle("Мастер пол")  # Устанавливаем заголовок окна
-        self.setWindowIcon(QIcon('icon.ico'))  # Устанавливаем иконку окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
         self.setGeometry(100, 100, 800, 600)  # Устанавливаем начальные размеры окна
-        self.session = Connect.create_connection()  # Создаем соединение с базой данных
+        # Фоновые задачи окна. Выписки ждут завершения процессов, поэтому всегда выполняются в пуле потоков,
+        # а не в асинхронном слое (см. async_db.py)
+        self.tasks = DbTaskGroup(self)
+        self.search_tasks = create_task_group(self)  # Поиск партнеров
+        self.search_prepared = False  # Запущена ли загрузка индекса поиска
+        self.stock_panel = None  # Панель остатков (создается при первом открытии)
         self.init_ui()  # Инициализируем пользовательский интерфейс
+        if Connect.settings()["query_stats"]:
+            # Отладочная панель статистики запросов
+            self.query_stats_panel = None
+            QShortcut(QKeySequence("Ctrl+Shift+Q"), self, self.show_query_stats)
 
     def init_ui(self):
         main_layout = QVBoxLayout()  # Основной вертикальный layout для окна
@@ -67,11 +42,23 @@ class MainWindow(QMainWindow):
         # Создаем кнопки для добавления партнера и работы с реализацией продукции
         new_partner_button = self.create_button("Добавить партнера", self.add_partner)
         btn_sales_products = self.create_button("Реализация продукции", self.show_product_request)
-        report_button = self.create_button("Сгенерировать отчет", self.generate_report)
+        analytics_button = self.create_button("Аналитика продаж", self.show_analytics)
+        self.stock_button = self.create_button("Склад", self.show_stock_panel)
+        report_button = self.create_button("Сгенерировать отчет", lambda: None)
+        # Меню выбора отчета
+        report_menu = QMenu(report_button)
+        report_menu.addAction("Расчет количества материала", lambda: self.generate_report("material_report"))
+        report_menu.addAction("Партнеры и скидки", lambda: self.generate_report("partners_report"))
+        report_menu.addAction("Реализация продукции", lambda: self.generate_report("sales_report"))
+        report_menu.addAction("Выписки партнерам за прошлый месяц", self.generate_statements)
+        report_menu.addSeparator()
+        report_menu.addAction("Выгрузка истории реализации в Parquet", lambda: self.export_sales("parquet"))
+        report_menu.addAction("Выгрузка истории реализации в CSV", lambda: self.export_sales("csv"))
+        report_button.setMenu(report_menu)
 
         # Логотип и название приложения
         logo_label = QLabel()
-        logo_label.setPixmap(QPixmap('logotype.png').scaled(50, 50))  # Устанавливаем логотип
+        logo_label.setPixmap(assets.logo(keep_aspect=False))  # Устанавливаем логотип из общего кэша
         app_title = QLabel("Мастер пол")  # Название приложения
         app_title.setStyleSheet("font-family: SegoeUI; font-size: 18px; font-weight: bold;")  # Стиль для названия
 
@@ -82,21 +69,49 @@ class MainWindow(QMainWindow):
         header_layout.addWidget(app_title)
         header_layout.addWidget(new_partner_button)
         header_layout.addWidget(btn_sales_products)
+        header_layout.addWidget(analytics_button)
+        header_layout.addWidget(self.stock_button)
         header_layout.addWidget(report_button)
         header_widget.setStyleSheet("background-color: #F4E8D3;")  # Устанавливаем стиль фона
 
-        # Создаем область прокрутки для списка партнеров
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)  # Прокручиваемая область будет изменять размер
-        scroll_content = QWidget()
-        scroll_layout = QVBoxLayout(scroll_content)
-        self.update_partner_list(scroll_layout)  # Загружаем список партнеров
+        # Количество позиций ниже порога на кнопке склада обновляется по событиям монитора остатков
+        self.stock_tasks = create_task_group(self)
+        self.stock_events = StockEvents(self)
+        self.stock_events.changed.connect(lambda record: self.update_stock_button())
+        self.stock_tasks.start(stock_monitor.load_job, on_chunk=lambda count: self.update_stock_button())
 
-        self.scroll_area.setWidget(scroll_content)  # Устанавливаем область прокрутки
+        # Создаем список партнеров: модель подгружает страницы по мере прокрутки, делегат рисует карточки
+        self.partner_model = PartnerListModel(parent=self)
+        self.partner_view = QListView()
+        self.partner_view.setModel(self.partner_model)
+        self.partner_view.setItemDelegate(PartnerCardDelegate(self.partner_view))
+        self.partner_view.setUniformItemSizes(True)  # Все карточки одной высоты, layout не пересчитывается для каждой
+        self.partner_view.setVerticalScrollMode(QListView.ScrollPerPixel)
+        # Устанавливаем обработчик нажатия на карточку для редактирования
+        self.partner_view.clicked.connect(lambda index: self.edit_partner(index.data(PartnerListModel.PartnerIdRole)))
+        # Контекстное меню карточки: редактирование и новая заявка партнера
+        self.partner_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.partner_view.customContextMenuRequested.connect(self.show_partner_menu)
 
-        # Основной layout добавляет header и область прокрутки
+        # Строка поиска: результаты обновляются по мере ввода
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск: наименование, ИНН, ФИО директора, телефон, email")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(lambda: self.search_timer.start())
+        self.search_edit.installEventFilter(self)  # Индекс поиска загружается при переходе в поле
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.search_partners)
+        self.search_label = QLabel()  # Количество найденных партнеров
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.search_edit)
+        search_layout.addWidget(self.search_label)
+
+        # Основной layout добавляет header, строку поиска и область прокрутки
         main_layout.addWidget(header_widget)
-        main_layout.addWidget(self.scroll_area)
+        main_layout.addLayout(search_layout)
+        main_layout.addWidget(self.partner_view)
 
         # Устанавливаем центральный виджет для окна
         central_widget = QWidget()
@@ -114,79 +129,215 @@ class MainWindow(QMainWindow):
     def show_product_request(self):
         self.close()
         
-        self.dialog = ProductRequestDialog(self.session)
+        from ProductRequestDialog import ProductRequestDialog  # Импортируем диалог для работы с реализацией продукции
+        with query_stats.action("Открытие реализации продукции"):
+            self.dialog = ProductRequestDialog()
         self.dialog.exec_()
 
+    # Метод для отображения аналитики продаж (срезы по партнерам, продукции и месяцам)
+    def show_analytics(self):
+        from AnalyticsDialog import AnalyticsDialog
+        dialog = AnalyticsDialog(self)
+        dialog.exec()
+
+    def eventFilter(self, watched, event):
+        # Индекс поиска загружается заранее, пока пользователь начинает вводить запрос
+        if watched is self.search_edit and event.type() == QEvent.FocusIn and not self.search_prepared:
+            self.search_prepared = True
+            self.search_tasks.start(partner_search.prepare_job)
+        return super().eventFilter(watched, event)
+
+    # Метод для поиска партнеров по введенной строке; найденные id передаются в модель списка
+    def search_partners(self):
+        query = self.search_edit.text().strip()
+        self.search_tasks.cancel_all()  # Результаты предыдущего запроса больше не нужны
+        if not query:
+            self.search_label.clear()
+            self.partner_model.set_search_ids(None)
+            return
+        with query_stats.action("Поиск партнеров"):
+            self.search_tasks.start(partner_search.search_job, query, on_chunk=self.show_search_results, on_failed=self.on_search_failed)
+
+    def show_search_results(self, ids):
+        self.search_label.setText(f"Найдено: {len(ids)}")
+        self.partner_model.set_search_ids(ids)  # Список перезагружается, только если результаты изменились
+
+    def on_search_failed(self, message):
+        self.show_message("Ошибка", f"Не удалось выполнить поиск: {message}", QMessageBox.Critical)
+
+    # Метод для отображения панели остатков (что нужно пополнить)
+    def show_stock_panel(self):
+        if self.stock_panel is None:
+            from stock_panel import StockPanel
+            self.stock_panel = StockPanel(self)
+        self.stock_panel.show()
+        self.stock_panel.raise_()
+
+    def update_stock_button(self):
+        count = stock_monitor.monitor.count()
+        self.stock_button.setText(f"Склад: пополнить {count}" if count else "Склад")
+
     # Метод для обновления списка партнеров
-    def update_partner_list(self, scroll_layout):
-        # Очищаем текущие карточки партнеров
-        for i in reversed(range(scroll_layout.count())):
-            widget = scroll_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()  # Удаляем старые виджеты
-
-        # Загружаем новых партнеров из базы данных
-        partners = self.session.query(Partner).all()
-        for partner in partners:
-            type_partner = partner.тип_партнера  # Получаем тип партнера
-            card = PartnerCard(partner, type_partner, self.session)  # Создаем карточку партнера
-            # Устанавливаем обработчик нажатия на карточку для редактирования
-            card.mousePressEvent = lambda event, p=partner: self.edit_partner(p)
-            scroll_layout.addWidget(card)  # Добавляем карточку в layout
+    def update_partner_list(self):
+        with query_stats.action("Обновление списка партнеров"):
+            self.partner_model.reload()  # Список заново загрузит видимые страницы
+
+    # При закрытии окна отменяем фоновую загрузку списка
+    def closeEvent(self, event):
+        self.partner_model.tasks.cancel_all()
+        self.search_tasks.cancel_all()
+        self.stock_tasks.cancel_all()
+        self.tasks.cancel_all()
+        super().closeEvent(event)
 
     # Метод для добавления нового партнера
     def add_partner(self):
-        form = PartnerForm()  # Создаем форму для добавления партнера
+        with query_stats.action("Открытие формы партнера"):
+            form = PartnerForm()  # Создаем форму для добавления партнера
         form.partner_added.connect(self.on_partner_added)  # Подключаем сигнал, когда партнер добавлен
         form.exec()  # Показываем форму
 
     # Метод для редактирования существующего партнера
-    def edit_partner(self, partner):
-        form = PartnerForm(partner)  # Создаем форму для редактирования партнера
+    def edit_partner(self, partner_id):
+        with query_stats.action("Открытие формы партнера"):
+            form = PartnerForm(partner_id)  # Создаем форму для редактирования партнера
         form.partner_added.connect(self.on_partner_added)  # Подключаем сигнал, когда изменения сохранены
         form.exec()  # Показываем форму
 
+    # Метод для отображения контекстного меню карточки партнера
+    def show_partner_menu(self, position):
+        index = self.partner_view.indexAt(position)
+        if not index.isValid():
+            return
+        partner_id = index.data(PartnerListModel.PartnerIdRole)
+        menu = QMenu(self)
+        menu.addAction("Редактировать", lambda: self.edit_partner(partner_id))
+        menu.addAction("Новая заявка", lambda: self.add_bid(partner_id))
+        menu.exec(self.partner_view.viewport().mapToGlobal(position))
+
+    # Метод для ввода новой заявки партнера
+    def add_bid(self, partner_id):
+        from BidDialog import BidDialog  # Диалог заявки импортируется при первом использовании
+        dialog = BidDialog(partner_id, self)
+        dialog.exec()
+
     # Метод, вызываемый после добавления или редактирования партнера
-    def on_partner_added(self):
-        scroll_layout = self.scroll_area.widget().layout()  # Получаем layout списка партнеров
-        self.update_partner_list(scroll_layout)  # Обновляем список партнеров
+    def on_partner_added(self, partner_id):
+        self.partner_model.refresh_partner(partner_id)  # Обновляем только карточку этого партнера
+        if self.search_edit.text().strip():
+            self.search_partners()  # Индекс уже обновлен при сохранении: партнер мог войти в результаты или выйти из них
 
-    def generate_report(self):
-        # Путь для сохранения PDF
-        file_path = "material_calculation_report.pdf"
+    # Метод для создания отчета; report_name - имя функции из модуля reports
+    def generate_report(self, report_name):
+        import reports  # Генерация PDF-отчетов
 
-        # Создаем объект canvas для генерации PDF
-        c = canvas.Canvas(file_path, pagesize=letter)
+        progress = QProgressDialog("Создание отчета...", "Отмена", 0, 0, self)
+        progress.setWindowTitle("Отчет")
+        progress.setMinimumDuration(0)
+        result = {"files": []}
+        errors = []
 
-        # Регистрируем шрифт с поддержкой кириллицы
-        pdfmetrics.registerFont(TTFont('SegoeUI', 'SegoeUIRegular.ttf'))  # Укажите путь к шрифту
-        c.setFont("SegoeUI", 16)  # Устанавливаем шрифт для заголовка
+        def on_progress(chunk):
+            page, result["files"] = chunk
+            progress.setLabelText(f"Готово страниц: {page}")
+
+        def on_failed(message):
+            errors.append(message)
+
+        def on_finished():
+            progress.close()
+            if errors:
+                self.show_message("Ошибка", f"Не удалось создать отчет: {errors[0]}", QMessageBox.Critical)
+            else:
+                # Показать сообщение об успешном создании отчета
+                self.show_message("Успех", f"Отчет успешно Создан! Файлы: {', '.join(result['files'])}", QMessageBox.Information)
+
+        # Строки читаются из базы данных потоком в фоне, страницы пишутся на диск томами; окно остается отзывчивым
+        with query_stats.action(f"Отчет {report_name}"):
+            worker = self.tasks.start(
+                lambda session: reports.iter_report(session, report_name),
+                on_chunk=on_progress, on_failed=on_failed, on_finished=on_finished
+            )
+        progress.canceled.connect(worker.cancel)
+
+    # Метод для создания выписок партнерам за прошлый месяц в пуле процессов
+    def generate_statements(self):
+        import statements  # Пакетная генерация выписок партнерам
+        month = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        output_dir = os.path.join("statements", f"{month.year}-{month.month:02d}")
+
+        progress = QProgressDialog("Создание выписок...", "Отмена", 0, 0, self)
+        progress.setWindowTitle("Выписки партнерам")
+        progress.setMinimumDuration(0)
+
+        def on_progress(chunk):
+            done, total, _ = chunk
+            progress.setMaximum(total)
+            progress.setValue(done)
+
+        errors = []
+
+        def on_failed(message):
+            errors.append(message)
+
+        def on_finished():
+            progress.close()
+            if errors:
+                self.show_message("Ошибка", f"Не удалось создать выписки: {errors[0]}", QMessageBox.Critical)
+            else:
+                self.show_message("Успех", f"Выписки сохранены в папку {output_dir}", QMessageBox.Information)
+
+        # Процессы запускаются из фонового потока, окно остается отзывчивым
+        with query_stats.action("Выписки партнерам"):
+            worker = self.tasks.start(
+                lambda session: statements.iter_statements(month.year, month.month, output_dir),
+                on_chunk=on_progress, on_failed=on_failed, on_finished=on_finished
+            )
+        progress.canceled.connect(worker.cancel)
+
+    # Метод для выгрузки истории реализации в выбранную папку; строки читаются и пишутся в фоне порциями
+    def export_sales(self, file_format):
+        folder = QFileDialog.getExistingDirectory(self, "Папка для выгрузки истории реализации")
+        if not folder:
+            return
+        import sales_export  # Выгрузка в Parquet и CSV (pyarrow загружается при первом использовании)
+        output_dir = os.path.join(folder, f"история_реализации_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+
+        progress = QProgressDialog("Выгрузка истории реализации...", "Отмена", 0, 0, self)
+        progress.setWindowTitle("Выгрузка истории реализации")
+        progress.setMinimumDuration(0)
+        result = {"rows": 0, "files": []}
+        errors = []
+
+        def on_progress(chunk):
+            result["rows"], result["files"] = chunk
+            progress.setLabelText(f"Выгружено строк: {result['rows']}")
+
+        def on_failed(message):
+            errors.append(message)
+
+        def on_finished():
+            progress.close()
+            if errors:
+                self.show_message("Ошибка", f"Не удалось выгрузить историю реализации: {errors[0]}", QMessageBox.Critical)
+            else:
+                self.show_message("Успех", f"Выгружено строк: {result['rows']}, файлов: {len(result['files'])}. Папка: {output_dir}", QMessageBox.Information)
+
+        with query_stats.action(f"Выгрузка истории реализации ({file_format})"):
+            worker = self.tasks.start(
+                lambda session: sales_export.iter_export(session, output_dir, file_format),
+                on_chunk=on_progress, on_failed=on_failed, on_finished=on_finished
+            )
+        progress.canceled.connect(worker.cancel)
+
+    # Отладочная панель статистики запросов (создается при первом открытии)
+    def show_query_stats(self):
+        if self.query_stats_panel is None:
+            from query_stats_panel import QueryStatsPanel
+            self.query_stats_panel = QueryStatsPanel(self)
+        self.query_stats_panel.show()
+        self.query_stats_panel.raise_()
 
-        # Заголовок
-        title = "Отчет по количеству материала"
-        
-        # Вычисляем горизонтальную позицию для центра
-        title_width = c.stringWidth(title, "SegoeUI", 16)
-        title_x = (letter[0] - title_width) / 2  # Центрируем заголовок по горизонтали
-        c.drawString(title_x, 750, title)
-        
-        # Устанавливаем шрифт для основного текста
-        c.setFont("SegoeUI", 12)
-        text = "Расчет количества материала, требуемого для производства продукции:"
-
-        # Разбиваем текст на несколько строк, чтобы он не выходил за пределы страницы
-        lines = text.split("\n")
-        y_position = 700
-        for line in lines:
-            c.drawString(100, y_position, line)
-            y_position -= 14  # Смещаем текст вниз на 14 единиц
-
-        # Завершаем создание PDF
-        c.save()
-
-        # Показать сообщение об успешном создании отчета
-        self.show_message("Успех", "Отчет успешно Создан!", QMessageBox.Information)
-        
     def show_message(self, title, message, icon):
         # Метод для отображения сообщений
         msg = QMessageBox()
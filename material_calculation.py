@@ -0,0 +1,78 @@
+# Расчет количества сырья, необходимого для производства продукции.
+# Справочники (продукция, коэффициенты типов продукции, состав продукции, процент брака материалов и остатки)
+# загружаются в массивы NumPy один раз, после чего расчет для любого количества строк заказа
+# выполняется одним векторизованным проходом без циклов на Python.
+#
+# Количество сырья для строки заказа: количество * ширина * длина * коэффициент типа продукции,
+# для каждого материала продукции увеличенное на процент брака этого типа материала.
+import numpy as np
+from datebase import Products, Product_type, Material, Material_type, materials_products, product_request
+
+
+class MaterialCalculator:
+    def __init__(self, session):
+        # Продукция и коэффициенты ее типов; id отсортированы для поиска индексов через searchsorted
+        products = session.query(Products.id, Product_type.коэф_типа_продукции).outerjoin(
+            Product_type, Products.id_тип == Product_type.id
+        ).order_by(Products.id).all()
+        self.product_ids = np.array([row[0] for row in products], dtype=np.int64)
+        self.product_coef = np.array([row[1] or 0.0 for row in products], dtype=np.float64)
+
+        # Материалы, их остатки на складе и процент брака по типу материала
+        materials = session.query(
+            Material.id, Material.наименование, Material.колво_на_складе, Material_type.процент_брака
+        ).outerjoin(Material_type, Material.id_тип == Material_type.id).order_by(Material.id).all()
+        self.material_ids = np.array([row[0] for row in materials], dtype=np.int64)
+        self.material_names = [row[1] for row in materials]
+        self.material_stock = np.array([row[2] or 0 for row in materials], dtype=np.float64)
+        self.material_scrap = np.array([row[3] or 0.0 for row in materials], dtype=np.float64) / 100
+
+        # Состав продукции: пары (индекс продукции, индекс материала)
+        links = session.query(materials_products.c.id_продукции, materials_products.c.id_материала).all()
+        link_products = np.array([row[0] for row in links], dtype=np.int64)
+        link_materials = np.array([row[1] for row in links], dtype=np.int64)
+        known = np.isin(link_products, self.product_ids) & np.isin(link_materials, self.material_ids)
+        self.link_product = np.searchsorted(self.product_ids, link_products[known])
+        self.link_material = np.searchsorted(self.material_ids, link_materials[known])
+
+    def product_index(self, product_ids):
+        # Индексы продукции в массивах справочника; неизвестные id считаются ошибкой
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        index = np.searchsorted(self.product_ids, product_ids)
+        index = np.minimum(index, len(self.product_ids) - 1)
+        unknown = product_ids[self.product_ids[index] != product_ids] if len(self.product_ids) else product_ids
+        if len(unknown):
+            raise ValueError(f"Неизвестная продукция: {sorted(set(unknown.tolist()))[:10]}")
+        return index
+
+    def calculate(self, product_ids, quantities, widths=1.0, lengths=1.0):
+        # Расчет для всех строк заказа сразу.
+        # Возвращает словарь массивов по материалам: требуемое количество (с учетом брака), остаток и нехватку.
+        index = self.product_index(product_ids)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        if np.any(quantities < 0):
+            raise ValueError("Количество продукции не может быть отрицательным")
+
+        # Сырье на строку без учета брака, затем суммарно по каждой продукции
+        line_amount = quantities * np.asarray(widths, dtype=np.float64) * np.asarray(lengths, dtype=np.float64) * self.product_coef[index]
+        product_amount = np.bincount(index, weights=line_amount, minlength=len(self.product_ids))
+
+        # Распределение по материалам состава продукции с надбавкой на брак
+        link_amount = product_amount[self.link_product] * (1 + self.material_scrap[self.link_material])
+        required = np.ceil(np.bincount(self.link_material, weights=link_amount, minlength=len(self.material_ids)))
+
+        return {
+            "material_id": self.material_ids,
+            "material_name": self.material_names,
+            "required": required,
+            "stock": self.material_stock,
+            "shortfall": np.maximum(required - self.material_stock, 0),
+        }
+
+
+def load_order_book(session):
+    # Строки всех заявок (продукция и количество) одним запросом
+    rows = session.query(product_request.c.id_продукции, product_request.c.количество_продукции).all()
+    product_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    quantities = np.array([row[1] or 0 for row in rows], dtype=np.float64)
+    return product_ids, quantities
@@ -0,0 +1,115 @@
+# Миграция данных: приведение типов колонок в базе данных к типам, объявленным в моделях datebase.py.
+# Колонки, созданные ранее как строковые (количество, стоимость, рейтинг и т.д.), преобразуются на месте:
+# добавляется новая колонка нужного типа, данные переносятся пакетами с фиксацией после каждого пакета,
+# затем старая колонка удаляется, а новая получает ее имя.
+#
+# Запуск: python migrate_types.py [--batch-size 10000] [--dry-run]
+import argparse
+from sqlalchemy import inspect, text, Numeric, Float, Integer
+from datebase import Base, Connect, product_request
+
+TEMP_SUFFIX = "__typed"  # Суффикс временной колонки нового типа
+
+# Колонки, переименованные в моделях: (таблица, старое имя, новое имя)
+RENAMED_COLUMNS = [
+    (product_request.name, "дата_продажи", "дата_производства"),
+]
+
+
+def quote(engine, name):
+    # Экранирование имени таблицы или колонки
+    return engine.dialect.identifier_preparer.quote(name)
+
+
+def rename_columns(engine, dry_run):
+    # Переименование колонок, имя которых изменилось в моделях
+    inspector = inspect(engine)
+    for table, old_name, new_name in RENAMED_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if old_name in columns and new_name not in columns:
+            print(f"{table}.{old_name} -> {new_name}")
+            if not dry_run:
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {quote(engine, table)} RENAME COLUMN {quote(engine, old_name)} TO {quote(engine, new_name)}"))
+
+
+def find_mismatched_columns(engine):
+    # Колонки, тип которых в базе данных отличается от типа в модели
+    inspector = inspect(engine)
+    mismatched = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        db_types = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            db_type = db_types.get(column.name)
+            if db_type is not None and db_type._type_affinity is not column.type._type_affinity:
+                mismatched.append((table, column, db_type))
+    return mismatched
+
+
+def convert_expression(engine, column):
+    # Выражение преобразования старого значения: пустые строки становятся NULL, запятая в числах - точкой
+    source = f"NULLIF(TRIM(CAST({quote(engine, column.name)} AS TEXT)), '')"
+    if isinstance(column.type, (Numeric, Float, Integer)):
+        source = f"REPLACE({source}, ',', '.')"
+        if isinstance(column.type, Integer):
+            # Целые значения могли храниться как "15.0"
+            source = f"CAST({source} AS NUMERIC)"
+    return f"CAST({source} AS {column.type.compile(dialect=engine.dialect)})"
+
+
+def convert_column(engine, table, column, batch_size):
+    # Перенос данных в колонку нового типа пакетами по batch_size строк
+    table_name = quote(engine, table.name)
+    old_name = quote(engine, column.name)
+    new_name = quote(engine, column.name + TEMP_SUFFIX)
+    sql_type = column.type.compile(dialect=engine.dialect)
+
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {new_name} {sql_type}"))
+
+    # Строки выбираются по физическому адресу (ctid), поэтому способ работает и для таблиц с составным ключом
+    update = text(
+        f"UPDATE {table_name} SET {new_name} = {convert_expression(engine, column)} "
+        f"WHERE ctid IN (SELECT ctid FROM {table_name} "
+        f"WHERE {new_name} IS NULL AND NULLIF(TRIM(CAST({old_name} AS TEXT)), '') IS NOT NULL LIMIT :batch_size)"
+    )
+    converted = 0
+    while True:
+        with engine.begin() as connection:
+            count = connection.execute(update, {"batch_size": batch_size}).rowcount
+        converted += count
+        if count < batch_size:
+            break
+        print(f"  {table.name}.{column.name}: {converted} строк")
+
+    # Замена старой колонки новой
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table_name} DROP COLUMN {old_name}"))
+        connection.execute(text(f"ALTER TABLE {table_name} RENAME COLUMN {new_name} TO {old_name}"))
+    return converted
+
+
+def migrate(batch_size=10000, dry_run=False):
+    Connect.configure(create_schema=False)  # Схема изменяется только этой миграцией
+    engine = Connect.get_engine()
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Миграция выполняется только для PostgreSQL; базу данных другого типа создайте заново по моделям")
+
+    rename_columns(engine, dry_run)
+    for table, column, db_type in find_mismatched_columns(engine):
+        print(f"{table.name}.{column.name}: {db_type} -> {column.type.compile(dialect=engine.dialect)}")
+        if not dry_run:
+            converted = convert_column(engine, table, column, batch_size)
+            print(f"  преобразовано строк: {converted}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Приведение типов колонок базы данных к моделям datebase.py")
+    parser.add_argument("--batch-size", type=int, default=10000, help="количество строк в одном пакете")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, какие колонки будут преобразованы")
+    args = parser.parse_args()
+    migrate(args.batch_size, args.dry_run)
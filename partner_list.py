@@ -0,0 +1,220 @@
+from bisect import bisect_left, bisect_right
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QRect, Signal
+from PySide6.QtWidgets import QStyledItemDelegate, QStyle
+from PySide6.QtGui import QColor, QPen
+from datebase import Partner  # Модель партнера
+from reference_data import partner_types  # Кэш справочника типов партнеров
+from discount import get_partners_discounts  # Расчет скидок для страницы партнеров
+from workers import create_task_group  # Фоновое выполнение запросов
+import query_stats  # Действия интерфейса для статистики запросов
+
+PAGE_SIZE = 100  # Количество партнеров, загружаемых за один раз
+
+
+# Модель списка партнеров с постраничной загрузкой по мере прокрутки.
+# Страницы загружаются в фоновом потоке и появляются в списке по мере готовности.
+class PartnerListModel(QAbstractListModel):
+    PartnerIdRole = Qt.UserRole + 1  # Роль для получения id партнера
+    PartnerRole = Qt.UserRole + 2  # Роль для получения всех данных карточки
+    page_loaded = Signal(int)  # Страница загружена (количество строк; 0 - партнеров больше нет)
+
+    def __init__(self, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.tasks = create_task_group(self)  # Фоновые задачи загрузки страниц
+        self.page_size = page_size  # Размер страницы
+        self.rows = []  # Загруженные карточки партнеров
+        self.last_id = 0  # id последнего загруженного партнера (ключ для следующей страницы)
+        self.has_more = True  # Есть ли еще партнеры в базе данных
+        self.loading = False  # Загружается ли сейчас страница
+        self.search_ids = None  # id найденных партнеров по возрастанию (None - показываются все партнеры)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row["наименование"]
+        if role == self.PartnerIdRole:
+            return row["id"]
+        if role == self.PartnerRole:
+            return row
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.loading:
+            return
+        # Запрос следующей страницы выполняется в фоновом потоке
+        self.loading = True
+        with query_stats.action("Прокрутка списка партнеров"):
+            if self.search_ids is None:
+                self.tasks.start(self.load_page, self.last_id, on_chunk=self.append_page, on_failed=self.on_load_failed)
+            else:
+                # Результаты поиска: следующая страница - следующие id из списка найденных
+                position = bisect_right(self.search_ids, self.last_id)
+                page_ids = self.search_ids[position:position + self.page_size]
+                self.tasks.start(self.load_ids, page_ids, on_chunk=self.append_page, on_failed=self.on_load_failed)
+
+    def append_page(self, chunk):
+        # Добавляем в модель только что загруженную страницу
+        rows, last_id = chunk
+        self.loading = False
+        if self.search_ids is None:
+            self.has_more = len(rows) == self.page_size
+        else:
+            self.has_more = bisect_right(self.search_ids, last_id) < len(self.search_ids)
+        self.last_id = max(self.last_id, last_id)
+        if not rows and self.has_more and self.search_ids is not None:
+            # Все партнеры страницы результатов поиска удалены: строки не добавились, и представление не запросит
+            # следующую страницу само, поэтому она загружается сразу
+            self.fetchMore()
+            return
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+        self.page_loaded.emit(len(rows))
+
+    def on_load_failed(self, message):
+        # При ошибке прекращаем подгрузку, чтобы не повторять неудачный запрос при каждой прокрутке
+        self.loading = False
+        self.has_more = False
+
+    def load_page(self, session, after_id):
+        # Выполняется в фоновом потоке с собственной сессией.
+        # Keyset-пагинация: следующая страница начинается сразу после последнего загруженного id
+        rows = self.card_rows(session, self.card_query(session).filter(
+            Partner.id > after_id
+        ).order_by(Partner.id).limit(self.page_size).all())
+        yield rows, rows[-1]["id"] if rows else after_id
+
+    def load_ids(self, session, page_ids):
+        # Выполняется в фоновом потоке: карточки страницы результатов поиска (удаленные партнеры пропускаются)
+        rows = self.card_rows(session, self.card_query(session).filter(
+            Partner.id.in_(page_ids)
+        ).order_by(Partner.id).all())
+        yield rows, page_ids[-1]
+
+    @staticmethod
+    def card_query(session):
+        # Колонки партнера, нужные для карточки
+        return session.query(
+            Partner.id,
+            Partner.id_тип,
+            Partner.наименование,
+            Partner.фио_директора,
+            Partner.телефон,
+            Partner.рейтинг
+        )
+
+    @staticmethod
+    def card_rows(session, records):
+        # Карточки для найденных партнеров; скидки для всех партнеров одним запросом
+        discounts = get_partners_discounts(session, [record.id for record in records])
+        rows = []
+        for record in records:
+            row = dict(record._mapping)
+            partner_type = partner_types.get(row.pop("id_тип"), session)  # Название типа - из кэша справочника
+            row["тип"] = partner_type.наименование if partner_type else None
+            row["скидка"] = discounts.get(record.id, 0)
+            rows.append(row)
+        return rows
+
+    def refresh_partner(self, partner_id):
+        # Обновление одной карточки после изменения партнера: запрашивается только этот партнер и его скидка
+        self.tasks.start(self.load_partner, partner_id, on_chunk=self.apply_partner)
+
+    def load_partner(self, session, partner_id):
+        # Выполняется в фоновом потоке: карточка партнера или None, если партнер удален
+        rows = self.card_rows(session, self.card_query(session).filter(Partner.id == partner_id).all())
+        yield partner_id, rows[0] if rows else None
+
+    def apply_partner(self, chunk):
+        # Изменение, вставка или удаление одной строки; строки упорядочены по id
+        partner_id, row = chunk
+        if row is not None and self.search_ids is not None:
+            found = bisect_left(self.search_ids, partner_id)
+            if found == len(self.search_ids) or self.search_ids[found] != partner_id:
+                row = None  # Партнер не входит в результаты поиска
+        position = bisect_left(self.rows, partner_id, key=lambda item: item["id"])
+        exists = position < len(self.rows) and self.rows[position]["id"] == partner_id
+        if row is None:
+            if exists:
+                self.beginRemoveRows(QModelIndex(), position, position)
+                del self.rows[position]
+                self.endRemoveRows()
+        elif exists:
+            self.rows[position] = row
+            index = self.index(position)
+            self.dataChanged.emit(index, index)
+        elif partner_id < self.last_id or not self.has_more:
+            # Партнер попадает в уже загруженную часть списка; иначе он придет со следующей страницей
+            self.beginInsertRows(QModelIndex(), position, position)
+            self.rows.insert(position, row)
+            self.last_id = max(self.last_id, partner_id)
+            self.endInsertRows()
+
+    def reload(self):
+        # Сбрасываем загруженные страницы, представление заново запросит первую страницу
+        self.tasks.cancel_all()
+        self.beginResetModel()
+        self.rows = []
+        self.last_id = 0
+        self.has_more = self.search_ids is None or len(self.search_ids) > 0
+        self.loading = False
+        self.endResetModel()
+
+    def set_search_ids(self, ids):
+        # Показ результатов поиска (ids - id по возрастанию) или всего списка (None); страницы загружаются заново
+        if ids == self.search_ids:
+            return False
+        self.search_ids = ids
+        self.reload()
+        return True
+
+
+# Делегат, рисующий карточку партнера вместо набора отдельных виджетов
+class PartnerCardDelegate(QStyledItemDelegate):
+    MARGIN = 4  # Отступ между карточками
+    PADDING = 8  # Внутренний отступ карточки
+    LINES = 4  # Количество строк с информацией о партнере
+
+    def sizeHint(self, option, index):
+        line_height = option.fontMetrics.height()
+        height = self.LINES * line_height + 2 * (self.PADDING + self.MARGIN)
+        return QSize(option.rect.width(), height)
+
+    def paint(self, painter, option, index):
+        row = index.data(PartnerListModel.PartnerRole)
+        if row is None:
+            return
+        painter.save()
+
+        # Рамка карточки
+        card_rect = option.rect.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(card_rect, QColor("#F4E8D3"))
+        painter.setPen(QPen(option.palette.text().color(), 1))
+        painter.drawRect(card_rect)
+
+        # Левая часть карточки с информацией о партнере
+        content_rect = card_rect.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING)
+        line_height = option.fontMetrics.height()
+        lines = [
+            f"{row['тип'] or ''} | {row['наименование']}",  # Тип и наименование партнера
+            f"{row['фио_директора']}",  # ФИО директора
+            f"{row['телефон']}",  # Телефон
+            f"Рейтинг: {row['рейтинг']}",  # Рейтинг партнера
+        ]
+        for number, line in enumerate(lines):
+            line_rect = QRect(content_rect.left(), content_rect.top() + number * line_height, content_rect.width(), line_height)
+            painter.drawText(line_rect, Qt.AlignLeft | Qt.AlignVCenter, line)
+
+        # Правая часть карточки со скидкой
+        painter.drawText(content_rect, Qt.AlignRight | Qt.AlignTop, f"Скидка: {row['скидка']}%")
+        painter.restore()
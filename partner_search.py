@@ -0,0 +1,298 @@
+# Поиск партнеров по наименованию, ИНН, ФИО директора, телефону и email.
+# По умолчанию используется индекс триграмм в памяти процесса: для каждой тройки подряд идущих символов хранится
+# список партнеров, в тексте которых она встречается. Запрос разбивается на слова, кандидаты берутся из самого
+# короткого списка триграмм слов (для слова из двух символов - из объединения списков триграмм, которые его содержат)
+# и проверяются вхождением остальных слов в текст партнера, поэтому время поиска зависит от числа кандидатов,
+# а не от числа партнеров; запрос, под который подходят почти все партнеры, проверяет каждого.
+# Индекс загружается одним запросом при первом поиске и обновляется при фиксации сессии, в которой партнер
+# добавлен, изменен или удален через ORM.
+# Изменения партнеров запросами SQLAlchemy Core или другими приложениями индекс не видит:
+# после таких изменений вызывается partner_index.invalidate().
+#
+# Для больших баз данных PostgreSQL поиск можно выполнять на сервере по индексу GIN расширения pg_trgm:
+#   python partner_search.py install  - создать расширение и индекс
+# и включить его переменной окружения PRAKTIKA_SEARCH=pg_trgm или Connect.configure(search="pg_trgm").
+import argparse
+import re
+from bisect import bisect_left
+import threading
+from array import array
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+from datebase import Connect, Partner
+
+FIELDS = ("наименование", "инн", "фио_директора", "телефон", "email")  # Поля партнера, по которым выполняется поиск
+PENDING_KEY = "partner_search_changes"  # Изменения партнеров сессии до фиксации (session.info)
+NON_DIGITS = re.compile(r"\D")
+SAMPLE_SIZE = 200  # Кандидатов в выборке для оценки избирательности слов запроса
+
+
+def normalize(value):
+    # Текст для поиска: нижний регистр, "ё" как "е", одиночные пробелы
+    return " ".join(str(value).lower().replace("ё", "е").split())
+
+
+def document(values):
+    # Текст партнера для индекса; телефон дополнительно хранится одними цифрами, чтобы находить его без пробелов и скобок.
+    # Пробелы по краям: любое вхождение слова из двух символов попадает в одну из триграмм текста
+    parts = [normalize(values[field]) for field in FIELDS if values.get(field)]
+    if values.get("телефон"):
+        parts.append(NON_DIGITS.sub("", values["телефон"]))
+    return " " + " ".join(parts) + " "
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def discard(ids, partner_id):
+    # Удаление id из упорядоченного списка триграммы
+    position = bisect_left(ids, partner_id)
+    if position < len(ids) and ids[position] == partner_id:
+        del ids[position]
+
+
+def add_pairs(pairs, trigram):
+    pairs.setdefault(trigram[:2], set()).add(trigram)
+    pairs.setdefault(trigram[1:], set()).add(trigram)
+
+
+def refines(words, previous):
+    # Уточняет ли запрос предыдущий: каждое слово предыдущего запроса входит в одно из слов нового,
+    # поэтому результат нового запроса - часть результата предыдущего
+    return all(any(old in word for word in words) for old in previous)
+
+
+# Индекс триграмм партнеров в памяти процесса
+class PartnerIndex:
+    def __init__(self):
+        self.texts = None  # id партнера -> текст для поиска (None - индекс не загружен)
+        self.postings = {}  # Триграмма -> id партнеров по возрастанию, в тексте которых она встречается
+        self.pairs = {}  # Пара символов -> триграммы, которые с нее начинаются или ею заканчиваются
+        self.ordered = True  # Идут ли id в texts по возрастанию (новый партнер может получить id меньше последнего)
+        self.generation = 0  # Увеличивается при каждом сбросе и изменении индекса
+        self.last = None  # Последний поиск: (поколение, слова, результат) - следующее нажатие клавиши обычно его уточняет
+        # Поиск выполняется в фоновых потоках, изменения приходят из потоков, фиксирующих сессии
+        self.lock = threading.Lock()
+
+    def load(self, session):
+        # Загрузка индекса одним запросом; блокировка не удерживается во время запроса (см. reference_data.py)
+        with self.lock:
+            if self.texts is not None:
+                return
+            generation = self.generation
+        rows = session.execute(select(Partner.id, *(getattr(Partner, field) for field in FIELDS)).order_by(Partner.id)).all()
+        texts, postings, pairs = {}, {}, {}
+        for row in rows:
+            value = document(row._mapping)
+            texts[row.id] = value
+            for trigram in trigrams(value):
+                ids = postings.get(trigram)
+                if ids is None:
+                    ids = postings[trigram] = array("i")
+                    add_pairs(pairs, trigram)
+                ids.append(row.id)
+        with self.lock:
+            if generation == self.generation:  # Партнеры не изменились, пока выполнялся запрос
+                self.texts, self.postings, self.pairs, self.ordered = texts, postings, pairs, True
+
+    def put(self, partner_id, values):
+        # Добавление или изменение партнера; values - значения полей FIELDS.
+        # Списки триграмм остаются точными: id удаляется из списков триграмм, которых больше нет в тексте
+        value = document(values)
+        with self.lock:
+            self.generation += 1
+            if self.texts is None:
+                return  # Индекс еще не загружен: партнер попадет в него при загрузке
+            old = self.texts.get(partner_id)
+            new_trigrams, old_trigrams = trigrams(value), trigrams(old) if old else set()
+            for trigram in new_trigrams - old_trigrams:
+                ids = self.postings.get(trigram)
+                if ids is None:
+                    ids = self.postings[trigram] = array("i")
+                    add_pairs(self.pairs, trigram)
+                position = bisect_left(ids, partner_id)
+                if position == len(ids) or ids[position] != partner_id:
+                    ids.insert(position, partner_id)
+            for trigram in old_trigrams - new_trigrams:
+                discard(self.postings[trigram], partner_id)
+            if old is None and self.texts and partner_id < next(reversed(self.texts)):
+                self.ordered = False
+            self.texts[partner_id] = value
+
+    def remove(self, partner_id):
+        with self.lock:
+            self.generation += 1
+            if self.texts is not None:
+                old = self.texts.pop(partner_id, None)
+                for trigram in trigrams(old) if old else ():
+                    discard(self.postings[trigram], partner_id)
+
+    def invalidate(self):
+        # Сброс индекса: следующий поиск загрузит его заново
+        with self.lock:
+            self.texts = None
+            self.postings, self.pairs = {}, {}
+            self.generation += 1
+
+    def search(self, query, session=None):
+        # id партнеров, в тексте которых встречаются все слова запроса, по возрастанию
+        words = normalize(query).split()
+        if not words:
+            return []
+        while True:
+            with self.lock:
+                if self.texts is not None:
+                    return self.find(words)
+            # Индекс не загружен или сброшен; загрузка, отброшенная из-за изменения партнеров во время запроса, повторяется
+            if session is not None:
+                self.load(session)
+            else:
+                with Connect.session_scope() as own_session:
+                    self.load(own_session)
+
+    def find(self, words):
+        # Поиск по загруженному индексу (вызывается под блокировкой)
+        texts = self.texts
+        # Кандидаты - самый короткий список среди триграмм всех слов; слово из одной триграммы этим списком
+        # уже проверено, потому что списки точные. Короткие слова проверяются перебором
+        candidates, checked = None, set()
+        for word in words:
+            for trigram in trigrams(word):
+                ids = self.postings.get(trigram)
+                if not ids:
+                    return []
+                if candidates is None or len(ids) < len(candidates):
+                    candidates, checked = ids, {word} if len(word) == 3 else set()
+        # Слово из двух символов: точный список - объединение списков триграмм, которые с него начинаются
+        # или им заканчиваются; объединение строится, только если оно дешевле проверки кандидатов
+        for word in words:
+            if len(word) == 2:
+                lists = [self.postings[trigram] for trigram in self.pairs.get(word, ())]
+                size = sum(map(len, lists))
+                if not size:
+                    return []
+                if size < 2 * (len(texts) if candidates is None else len(candidates)):
+                    ids = sorted(set().union(*lists))
+                    if candidates is None or len(ids) < len(candidates):
+                        candidates, checked = ids, {word}
+        # Следующее нажатие клавиши обычно уточняет предыдущий запрос: его результат - кандидаты поменьше,
+        # а совпадающие слова уже проверены
+        if self.last is not None and self.last[0] == self.generation and refines(words, self.last[1]):
+            previous = self.last[2]
+            if candidates is None or len(previous) < len(candidates):
+                candidates, checked = previous, set(self.last[1])
+        scanned = candidates is None
+        found = list(texts) if scanned else candidates
+        pending = [word for word in dict.fromkeys(words) if word not in checked]
+        get = texts.get
+        if len(pending) > 1:
+            # Первым проверяется слово, которому соответствует меньше всего кандидатов из выборки:
+            # каждая проверка сужает список для следующих
+            sample = found[::max(len(found) // SAMPLE_SIZE, 1)]
+            pending.sort(key=lambda word: sum(word in get(partner_id, "") for partner_id in sample))
+        for word in pending:
+            found = [partner_id for partner_id in found if word in get(partner_id, "")]
+        found = sorted(found) if scanned and not self.ordered else list(found)
+        self.last = (self.generation, words, found)
+        return found
+
+
+partner_index = PartnerIndex()  # Общий для процесса индекс
+
+
+@event.listens_for(Partner, "after_insert")
+@event.listens_for(Partner, "after_update")
+def on_partner_saved(mapper, connection, target):
+    # Изменение запоминается в сессии и попадает в индекс только после фиксации транзакции
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(PENDING_KEY, {})[target.id] = {field: getattr(target, field) for field in FIELDS}
+
+
+@event.listens_for(Partner, "after_delete")
+def on_partner_deleted(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(PENDING_KEY, {})[target.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def on_commit(session):
+    for partner_id, values in session.info.pop(PENDING_KEY, {}).items():
+        if values is None:
+            partner_index.remove(partner_id)
+        else:
+            partner_index.put(partner_id, values)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def on_rollback(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Поиск на сервере PostgreSQL: тот же текст партнера, что и в индексе в памяти, выражением индекса GIN
+TRIGRAM_INDEX = "партнер_поиск_trgm_idx"
+TRIGRAM_EXPRESSION = (
+    "translate(lower(coalesce(наименование, '') || ' ' || coalesce(инн, '') || ' ' || coalesce(фио_директора, '') || ' ' || "
+    "coalesce(телефон, '') || ' ' || coalesce(email, '') || ' ' || regexp_replace(coalesce(телефон, ''), '\\D', '', 'g')), 'ё', 'е')"
+)
+
+
+def install_trigram_index(connection):
+    # Расширение pg_trgm и индекс GIN по тексту партнера (создание расширения может требовать прав суперпользователя)
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    connection.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON {Partner.__tablename__} USING gin (({TRIGRAM_EXPRESSION}) gin_trgm_ops)"
+    )
+
+
+def like_pattern(word):
+    # Шаблон LIKE для вхождения слова; символы шаблона в слове экранируются
+    return "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def trigram_search(session, query):
+    # id партнеров, в тексте которых встречаются все слова запроса; для слов от трех символов используется индекс
+    words = normalize(query).split()
+    if not words:
+        return []
+    conditions = " AND ".join(f"{TRIGRAM_EXPRESSION} LIKE :word{number}" for number in range(len(words)))
+    parameters = {f"word{number}": like_pattern(word) for number, word in enumerate(words)}
+    return list(session.execute(
+        text(f"SELECT id FROM {Partner.__tablename__} WHERE {conditions} ORDER BY id"), parameters
+    ).scalars())
+
+
+def search(session, query):
+    # Поиск выбранным способом; pg_trgm используется только на PostgreSQL
+    if Connect.settings()["search"] == "pg_trgm" and session.get_bind().dialect.name == "postgresql":
+        return trigram_search(session, query)
+    return partner_index.search(query, session)
+
+
+def search_job(session, query):
+    # Задача для фоновой группы: одна порция - список найденных id
+    yield search(session, query)
+
+
+def prepare_job(session):
+    # Задача заблаговременной загрузки индекса в памяти (например, при переходе в поле поиска)
+    if Connect.settings()["search"] != "pg_trgm":
+        partner_index.load(session)
+    yield None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск партнеров")
+    parser.add_argument("command", choices=["install", "search"], help="install - установить индекс pg_trgm, search - найти партнеров")
+    parser.add_argument("query", nargs="?", default="", help="Строка поиска для команды search")
+    args = parser.parse_args()
+    if args.command == "install":
+        with Connect.get_engine().begin() as connection:
+            install_trigram_index(connection)
+        print(f"Индекс {TRIGRAM_INDEX} создан")
+    else:
+        with Connect.session_scope() as session:
+            for partner_id in search(session, args.query):
+                print(partner_id)
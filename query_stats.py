@@ -0,0 +1,249 @@
+# Инструментирование запросов к базе данных: время выполнения, количество строк и действие интерфейса,
+# во время которого выполнен запрос. Запросы одной формы (одинаковый SQL без учета значений параметров),
+# повторенные в пределах одного действия много раз, отмечаются как N+1 - например, отдельный запрос
+# итогов продаж для каждой карточки партнера вместо одного запроса на страницу.
+# Включается переменной окружения PRAKTIKA_QUERY_STATS=1 или Connect.configure(query_stats=True).
+# Если задана переменная PRAKTIKA_QUERY_STATS_FILE, статистика сохраняется в этот JSON-файл при завершении процесса.
+#   python query_stats.py stats.json  - текстовый отчет по сохраненному файлу
+import atexit
+import contextvars
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from sqlalchemy import event
+
+N_PLUS_ONE_THRESHOLD = 10  # Сколько раз запрос одной формы должен повториться в действии, чтобы считаться N+1
+MAX_ACTIONS = 500  # Сколько последних действий хранится в памяти
+MAX_STATEMENTS = 2000  # Сколько запросов одного действия хранится подробно (сводка по формам ведется всегда)
+APP_DIR = os.path.dirname(os.path.abspath(__file__))  # Папка приложения: по ней ищется вызывающий код
+# Служебные модули, которые не считаются вызывающим кодом
+SKIPPED_FILES = {os.path.join(APP_DIR, name) for name in ("query_stats.py", "datebase.py", "workers.py")}
+
+actions = deque(maxlen=MAX_ACTIONS)  # Записанные действия, от старых к новым
+_lock = threading.Lock()  # Защита статистики: запросы одного действия выполняются в разных потоках
+# Текущее действие: переменная контекста, а не потока, чтобы асинхронные задачи одного потока (async_db.py)
+# не смешивали свои действия
+_action = contextvars.ContextVar("query_stats_action", default=None)
+_local = threading.local()  # Неявное действие потока (см. implicit_action)
+_ids = iter(range(1, sys.maxsize))  # Номера действий
+
+# Значения в тексте запроса заменяются на "?", списки IN (...) и VALUES (...) любой длины сворачиваются
+_SHAPE_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),  # Строковые литералы
+    (re.compile(r"%\(\w+\)s|\$\d+|(?<!:):\w+"), "?"),  # Параметры psycopg, asyncpg и именованные параметры
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),  # Числа
+    (re.compile(r"\?::\w+(?:\[\])?"), "?"),  # Приведения типов параметров (psycopg 3)
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),  # Списки параметров
+    (re.compile(r"(?:\(\.\.\.\)\s*,\s*)+\(\.\.\.\)"), "(...)"),  # Несколько строк VALUES
+    (re.compile(r"\s+"), " "),
+]
+
+
+def statement_shape(statement):
+    # Форма запроса: текст SQL без конкретных значений
+    for pattern, replacement in _SHAPE_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def caller():
+    # Ближайшая функция приложения в стеке вызова (модуль.функция:строка), без SQLAlchemy и служебных модулей
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename not in SKIPPED_FILES:
+            module = os.path.splitext(os.path.relpath(filename, APP_DIR))[0].replace(os.sep, ".")
+            return f"{module}.{frame.f_code.co_name}", frame.f_lineno
+        frame = frame.f_back
+    return "-", 0
+
+
+# Статистика одного действия: подробный журнал запросов и сводка по формам запросов
+class ActionStats:
+    def __init__(self, name, implicit=False):
+        self.id = next(_ids)
+        self.name = name  # Название действия интерфейса или вызывающая функция
+        self.implicit = implicit  # Действие не было задано явно и определено по вызывающему коду
+        self.started = datetime.datetime.now()
+        self.statements = []  # Подробный журнал: первые MAX_STATEMENTS запросов
+        self.shapes = {}  # Форма запроса -> сводка
+        self.count = 0  # Всего запросов
+        self.elapsed = 0.0  # Суммарное время запросов, мс
+
+    def record(self, statement, elapsed, rows, where, line, error=None):
+        shape = statement_shape(statement)
+        with _lock:
+            self.count += 1
+            self.elapsed += elapsed
+            if len(self.statements) < MAX_STATEMENTS:
+                entry = {"sql": statement, "ms": round(elapsed, 3), "rows": rows, "caller": f"{where}:{line}", "thread": threading.current_thread().name}
+                if error:
+                    entry["error"] = error
+                self.statements.append(entry)
+            summary = self.shapes.get(shape)
+            if summary is None:
+                summary = self.shapes[shape] = {"count": 0, "ms": 0.0, "rows": 0, "callers": set()}
+            summary["count"] += 1
+            summary["ms"] += elapsed
+            summary["rows"] += rows or 0
+            summary["callers"].add(where)
+            count = summary["count"]
+        if count == N_PLUS_ONE_THRESHOLD and is_select(shape):
+            print(f"N+1: {self.name}: запрос выполнен {count} раз ({where}): {shape[:200]}", file=sys.stderr)
+
+    def n_plus_one(self):
+        # Формы SELECT-запросов, повторенные не меньше N_PLUS_ONE_THRESHOLD раз
+        with _lock:
+            return [(shape, summary["count"]) for shape, summary in self.shapes.items()
+                    if summary["count"] >= N_PLUS_ONE_THRESHOLD and is_select(shape)]
+
+    def as_dict(self):
+        with _lock:
+            shapes = [
+                {"shape": shape, "count": summary["count"], "ms": round(summary["ms"], 3), "rows": summary["rows"],
+                 "callers": sorted(summary["callers"])}
+                for shape, summary in self.shapes.items()
+            ]
+            statements = list(self.statements)
+        shapes.sort(key=lambda item: item["ms"], reverse=True)
+        return {
+            "id": self.id,
+            "action": self.name,
+            "implicit": self.implicit,
+            "started": self.started.isoformat(timespec="milliseconds"),
+            "count": self.count,
+            "ms": round(self.elapsed, 3),
+            "n_plus_one": [{"shape": shape, "count": count} for shape, count in self.n_plus_one()],
+            "shapes": shapes,
+            "statements": statements,
+        }
+
+
+def is_select(shape):
+    return shape.lstrip("(").upper().startswith(("SELECT", "WITH"))
+
+
+def current_action():
+    # Явно заданное действие текущего потока или асинхронной задачи (None, если его нет)
+    return _action.get()
+
+
+@contextmanager
+def action(name):
+    # Действие интерфейса: все запросы внутри блока, в том числе выполняемые запущенными из него фоновыми задачами,
+    # относятся к этому действию. Вложенные действия относятся к внешнему
+    if current_action() is not None:
+        yield current_action()
+        return
+    stats = ActionStats(name)
+    with _lock:
+        actions.append(stats)
+    with attach(stats):
+        yield stats
+
+
+@contextmanager
+def attach(stats):
+    # Выполнение блока в рамках уже начатого действия (используется фоновыми задачами)
+    token = _action.set(stats)
+    try:
+        yield stats
+    finally:
+        _action.reset(token)
+
+
+def implicit_action(where):
+    # Запросы вне явного действия группируются по вызывающей функции: подряд идущие запросы одной функции
+    # в одном потоке считаются одним действием
+    stats = getattr(_local, "implicit", None)
+    if stats is None or stats.name != where:
+        stats = _local.implicit = ActionStats(where, implicit=True)
+        with _lock:
+            actions.append(stats)
+    return stats
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = (time.perf_counter() - conn.info["query_stats_started"].pop()) * 1000
+    rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None  # SQLite не сообщает количество строк SELECT
+    record(statement, elapsed, rows)
+
+
+def handle_error(context):
+    started = context.connection.info.get("query_stats_started") if context.connection is not None else None
+    if started:
+        elapsed = (time.perf_counter() - started.pop()) * 1000
+        record(context.statement or "", elapsed, None, error=str(context.original_exception))
+
+
+def record(statement, elapsed, rows, error=None):
+    where, line = caller()
+    stats = current_action() or implicit_action(where)
+    stats.record(statement, elapsed, rows, where, line, error)
+
+
+def install(engine):
+    # Подключение к движку; повторный вызов для того же движка ничего не делает
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    dump_file = os.environ.get("PRAKTIKA_QUERY_STATS_FILE")
+    if dump_file:
+        atexit.register(dump, dump_file)
+
+
+def clear():
+    with _lock:
+        actions.clear()
+    _local.implicit = None
+
+
+def snapshot():
+    # Копия статистики всех действий, от старых к новым
+    with _lock:
+        recorded = list(actions)
+    return [stats.as_dict() for stats in recorded]
+
+
+def dump(path=None):
+    # Статистика в формате JSON; при указании пути сохраняется в файл
+    data = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+        "actions": snapshot(),
+    }
+    if path:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+    return data
+
+
+def report(data, top=5):
+    # Текстовый отчет: действия с количеством и временем запросов, самые долгие формы запросов и найденные N+1
+    lines = []
+    for item in data["actions"]:
+        lines.append(f"{item['started'][11:]}  {item['action']}: {item['count']} запросов, {item['ms']:.1f} мс")
+        for shape in item["shapes"][:top]:
+            lines.append(f"    {shape['count']:6} x {shape['ms']:10.1f} мс  {shape['shape'][:120]}")
+        for problem in item["n_plus_one"]:
+            lines.append(f"    N+1: {problem['count']} раз: {problem['shape'][:120]}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Использование: python query_stats.py stats.json")
+    with open(sys.argv[1], encoding="utf-8") as file:
+        print(report(json.load(file)))
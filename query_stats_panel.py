@@ -0,0 +1,114 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QSplitter, QHeaderView, QFileDialog, QLabel
+)
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor
+import query_stats  # Статистика запросов к базе данных
+import assets  # Общий кэш логотипа и иконки
+
+N_PLUS_ONE_COLOR = QColor("#F6C9C4")  # Подсветка действий и запросов с признаками N+1
+
+
+# Отладочная панель статистики запросов: список действий интерфейса и формы запросов выбранного действия.
+# Открывается из главного окна сочетанием Ctrl+Shift+Q, если статистика запросов включена
+class QueryStatsPanel(QDialog):
+    REFRESH_INTERVAL = 1000  # Период обновления, мс
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика запросов")  # Устанавливаем заголовок окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
+        self.setGeometry(150, 150, 1000, 600)  # Устанавливаем начальные размеры окна
+        self.data = []  # Последний снимок статистики
+        self.init_ui()
+        # Панель немодальная: статистика обновляется, пока пользователь работает в других окнах
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_INTERVAL)
+        self.refresh()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Действия: время начала, название, количество и суммарное время запросов, найденные N+1
+        self.actions_table = self.create_table(["Начало", "Действие", "Запросов", "Время, мс", "N+1"])
+        self.actions_table.itemSelectionChanged.connect(self.show_shapes)
+        # Формы запросов выбранного действия
+        self.shapes_table = self.create_table(["Раз", "Время, мс", "Среднее, мс", "Строк", "Откуда", "Запрос"])
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.actions_table)
+        splitter.addWidget(self.shapes_table)
+        layout.addWidget(splitter)
+
+        self.summary_label = QLabel()
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.summary_label)
+        buttons.addStretch()
+        for text, handler in [("Очистить", self.clear), ("Сохранить JSON", self.save_json)]:
+            button = QPushButton(text)
+            button.clicked.connect(handler)
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+
+    def create_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setSelectionMode(QTableWidget.SingleSelection)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        return table
+
+    def fill_row(self, table, row, values, highlight=False):
+        for column, value in enumerate(values):
+            item = QTableWidgetItem(str(value))
+            if isinstance(value, (int, float)):
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            if highlight:
+                item.setBackground(N_PLUS_ONE_COLOR)
+            table.setItem(row, column, item)
+
+    def refresh(self):
+        # Новые действия показываются сверху; выбранное действие остается выбранным
+        selected = self.selected_action()
+        self.data = list(reversed(query_stats.snapshot()))
+        self.actions_table.blockSignals(True)
+        self.actions_table.setRowCount(len(self.data))
+        for row, item in enumerate(self.data):
+            problems = len(item["n_plus_one"])
+            self.fill_row(self.actions_table, row, [
+                item["started"][11:], item["action"], item["count"], round(item["ms"], 1), problems or ""
+            ], highlight=bool(problems))
+            if selected is not None and item["id"] == selected["id"]:
+                self.actions_table.selectRow(row)
+        self.actions_table.blockSignals(False)
+        total = sum(item["count"] for item in self.data)
+        self.summary_label.setText(f"Действий: {len(self.data)}, запросов: {total}")
+        self.show_shapes()
+
+    def selected_action(self):
+        rows = self.actions_table.selectionModel().selectedRows()
+        return self.data[rows[0].row()] if rows and rows[0].row() < len(self.data) else None
+
+    def show_shapes(self):
+        item = self.selected_action()
+        shapes = item["shapes"] if item else []
+        problems = {problem["shape"] for problem in item["n_plus_one"]} if item else set()
+        self.shapes_table.setRowCount(len(shapes))
+        for row, shape in enumerate(shapes):
+            self.fill_row(self.shapes_table, row, [
+                shape["count"], round(shape["ms"], 1), round(shape["ms"] / shape["count"], 2), shape["rows"],
+                ", ".join(shape["callers"]), shape["shape"]
+            ], highlight=shape["shape"] in problems)
+
+    def clear(self):
+        query_stats.clear()
+        self.refresh()
+
+    def save_json(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Сохранить статистику", "query_stats.json", "JSON (*.json)")
+        if file_path:
+            query_stats.dump(file_path)
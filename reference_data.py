@@ -0,0 +1,88 @@
+# Кэш справочников: типы партнеров, юридические адреса, типы продукции и типы материалов.
+# Справочник загружается одним запросом при первом обращении и дальше общий для всех окон процесса.
+# Любая вставка, изменение или удаление строк справочника (через ORM или SQLAlchemy Core) сбрасывает
+# его кэш, и следующее обращение загрузит справочник заново.
+import threading
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+from datebase import Connect, Type_partner, Legal_address, Product_type, Material_type
+
+
+class ReferenceCache:
+    def __init__(self, model, columns, label):
+        self.model = model  # Модель справочника
+        self.columns = columns  # Загружаемые колонки (первая - id)
+        self.label = label  # Функция получения текста строки для выпадающих списков
+        self.rows = None  # id -> строка справочника (None - не загружен)
+        self.generation = 0  # Увеличивается при каждом сбросе кэша
+        # Справочник используется из фоновых потоков; блокировка не удерживается во время запроса (см. sales_totals.py)
+        self.lock = threading.Lock()
+
+    def load(self, session=None):
+        # Строки справочника по id; при первом обращении загружаются одним запросом
+        with self.lock:
+            rows, generation = self.rows, self.generation
+        if rows is not None:
+            return rows
+        query = select(*self.columns).order_by(self.columns[0])
+        if session is not None:
+            result = session.execute(query).all()
+        else:
+            with Connect.session_scope() as own_session:
+                result = own_session.execute(query).all()
+        rows = {row[0]: row for row in result}
+        with self.lock:
+            if generation == self.generation:  # Справочник не изменился, пока выполнялся запрос
+                self.rows = rows
+        return rows
+
+    def get(self, item_id, session=None):
+        # Строка справочника по id (None, если такой строки нет)
+        return self.load(session).get(item_id)
+
+    def choices(self, session=None):
+        # Пары (id, текст) для выпадающего списка в порядке id
+        return [(item_id, self.label(row)) for item_id, row in self.load(session).items()]
+
+    def invalidate(self):
+        with self.lock:
+            self.rows = None
+            self.generation += 1
+
+
+# Общие для процесса справочники
+partner_types = ReferenceCache(Type_partner, [Type_partner.id, Type_partner.наименование], lambda row: row.наименование)
+legal_addresses = ReferenceCache(
+    Legal_address, [Legal_address.id, Legal_address.город, Legal_address.улица, Legal_address.дом],
+    lambda row: f"{row.город}, {row.улица}, {row.дом}"
+)
+product_types = ReferenceCache(
+    Product_type, [Product_type.id, Product_type.наименование, Product_type.коэф_типа_продукции], lambda row: row.наименование
+)
+material_types = ReferenceCache(
+    Material_type, [Material_type.id, Material_type.наименование, Material_type.процент_брака], lambda row: row.наименование
+)
+
+CACHES = {cache.model.__table__: cache for cache in (partner_types, legal_addresses, product_types, material_types)}
+
+
+@event.listens_for(Engine, "after_execute")
+def on_after_execute(connection, clauseelement, multiparams, params, execution_options, result):
+    # Изменение справочника сбрасывает его кэш сразу и еще раз при фиксации транзакции,
+    # чтобы не остался справочник, загруженный другим потоком до фиксации
+    if isinstance(clauseelement, UpdateBase) and clauseelement.table in CACHES:
+        CACHES[clauseelement.table].invalidate()
+        connection.info.setdefault("changed_references", set()).add(clauseelement.table)
+
+
+@event.listens_for(Engine, "commit")
+def on_commit(connection):
+    for table in connection.info.pop("changed_references", ()):
+        CACHES[table].invalidate()
+
+
+@event.listens_for(Engine, "rollback")
+def on_rollback(connection):
+    for table in connection.info.pop("changed_references", ()):
+        CACHES[table].invalidate()
@@ -0,0 +1,433 @@
+# Локальная реплика для чтения: копия таблиц типов партнеров, партнеров, продукции, истории реализации
+# и итогов продаж в файле SQLite на компьютере пользователя. Запросы, которые только читают эти таблицы,
+# выполняются по реплике со скоростью локального диска, в том числе когда сервер недоступен; запись и все
+# остальные запросы идут на основной сервер (RoutingSession). После записи в таблицы реплики сессия до конца
+# транзакции читает с сервера, а после фиксации фоновый поток сразу синхронизирует реплику; до окончания этой
+# синхронизации все сессии читают с сервера, поэтому свои изменения видны сразу, а фиксация не ждет синхронизации.
+#
+# Изменения отслеживаются на сервере PostgreSQL: триггеры уровня оператора записывают ключи измененных строк
+# в таблицу "журнал_изменений" вместе с номером транзакции. Реплика хранит границу - номер самой старой
+# транзакции, которая еще выполнялась при прошлой синхронизации. Все транзакции с меньшими номерами к этому
+# моменту завершились, поэтому при следующей синхронизации читаются записи журнала от старой до новой границы,
+# и транзакция, зафиксированная позже транзакции с большим номером записи журнала, не теряется.
+# Для каждого измененного ключа строка перечитывается с сервера целиком (или удаляется из реплики, если ее нет).
+#
+# Синхронизация выполняется в фоновом потоке раз в PRAKTIKA_REPLICA_INTERVAL секунд. Первая синхронизация
+# копирует таблицы целиком; до ее окончания чтение идет с сервера. Записи журнала старше RETENTION_DAYS
+# удаляются, поэтому реплика, которая не синхронизировалась дольше RESYNC_DAYS, копируется заново.
+# TRUNCATE в журнал не попадает: после него реплики копируются заново командой sync --full.
+#
+# Включение: PRAKTIKA_REPLICA=путь/к/replica.db или Connect.configure(replica="...").
+# Обслуживание: python replica.py install | sync [--full] | status
+import argparse
+import datetime
+import threading
+import time
+from sqlalchemy import MetaData, Table, Column, Index, Integer, BigInteger, DateTime, create_engine, event, inspect, select, insert, delete, text, tuple_, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select, visitors
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import TableClause
+from sqlalchemy.sql.dml import UpdateBase
+from datebase import Connect, Change_log, Type_partner, Partner, Products, Partner_sales_totals, history_implementation
+from sales_totals import totals_cache
+from reference_data import CACHES
+
+LOG = Change_log.__tablename__
+# Таблицы реплики в порядке копирования
+SOURCE_TABLES = [Type_partner.__table__, Partner.__table__, Products.__table__, history_implementation, Partner_sales_totals.__table__]
+REPLICATED = frozenset(table.name for table in SOURCE_TABLES)
+REPLICA_VERSION = 1  # Увеличивается при изменении колонок таблиц реплики: реплика создается заново
+RETENTION_DAYS = 7  # Срок хранения записей журнала
+RESYNC_DAYS = 6  # Реплика, не синхронизированная дольше, копируется заново (с запасом до очистки журнала)
+PRUNE_INTERVAL = 3600  # Период очистки журнала, с
+BATCH = 5000  # Строк в одной пакетной вставке и ключей в одной порции изменений
+REPLICA_KEY = "replica"  # Реплика сессии (session.info)
+BIND_KEY = "replica_bind"  # Движок, которым сессия читает реплику (session.info)
+WRITTEN_KEY = "replica_written"  # Сессия изменила таблицы реплики в текущей транзакции (session.info)
+SESSION_INFO_KEY = "replica_session_info"  # session.info сессии, выполняющей транзакцию на соединении (connection.info)
+
+# Таблицы файла реплики: те же колонки и индексы, но без внешних ключей (связанных таблиц в реплике нет)
+metadata = MetaData()
+tables = {}
+for source in SOURCE_TABLES:
+    table = Table(source.name, metadata, *[Column(column.name, column.type, primary_key=column.primary_key) for column in source.columns])
+    for index in source.indexes:
+        Index(index.name, *[table.c[column.name] for column in index.columns])
+    tables[source.name] = table
+
+state = Table(
+    "состояние_реплики", metadata,
+    Column("id", Integer, primary_key=True),  # Единственная строка с id = 1
+    Column("версия", Integer, nullable=False),  # REPLICA_VERSION, с которой создан файл
+    Column("граница", BigInteger, nullable=False),  # Номер транзакции, с которой начнется следующая синхронизация
+    Column("синхронизирована", DateTime, nullable=False),  # Время последней синхронизации
+)
+
+# Номер самой старой выполняющейся транзакции: все транзакции с меньшими номерами завершены
+BOUNDARY = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+# Триггер журнала: аргументы триггера - колонки первичного ключа таблицы
+LOG_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION записать_изменения() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO {LOG} (таблица, ключ, транзакция)
+            SELECT DISTINCT TG_TABLE_NAME, (SELECT jsonb_object_agg(поле, to_jsonb(строка) -> поле) FROM unnest(TG_ARGV) AS поле)::text,
+                   pg_current_xact_id()::text::bigint
+            FROM старые_строки AS строка;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {LOG} (таблица, ключ, транзакция)
+            SELECT DISTINCT TG_TABLE_NAME, (SELECT jsonb_object_agg(поле, to_jsonb(строка) -> поле) FROM unnest(TG_ARGV) AS поле)::text,
+                   pg_current_xact_id()::text::bigint
+            FROM новые_строки AS строка;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def trigger_statements(table):
+    # Триггеры журнала одной таблицы
+    key = ", ".join(f"'{column.name}'" for column in table.primary_key.columns)
+    return [
+        f"DROP TRIGGER IF EXISTS журнал_реплики_вставка ON {table.name}",
+        f"DROP TRIGGER IF EXISTS журнал_реплики_изменение ON {table.name}",
+        f"DROP TRIGGER IF EXISTS журнал_реплики_удаление ON {table.name}",
+        f"""CREATE TRIGGER журнал_реплики_вставка AFTER INSERT ON {table.name}
+        REFERENCING NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION записать_изменения({key})""",
+        f"""CREATE TRIGGER журнал_реплики_изменение AFTER UPDATE ON {table.name}
+        REFERENCING OLD TABLE AS старые_строки NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION записать_изменения({key})""",
+        f"""CREATE TRIGGER журнал_реплики_удаление AFTER DELETE ON {table.name}
+        REFERENCING OLD TABLE AS старые_строки FOR EACH STATEMENT EXECUTE FUNCTION записать_изменения({key})""",
+    ]
+
+
+def install_triggers(connection, sources=SOURCE_TABLES):
+    # Установка (или переустановка) триггеров журнала; журнал ведется только в PostgreSQL
+    if connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql(LOG_FUNCTION)
+    for table in sources:
+        for statement in trigger_statements(table):
+            connection.exec_driver_sql(statement)
+
+
+def on_source_created(target, connection, **kw):
+    # Новая таблица реплики сразу получает триггеры журнала; если журнала еще нет, триггеры поставит его создание
+    if inspect(connection).has_table(LOG):
+        install_triggers(connection, [target])
+
+
+for source in SOURCE_TABLES:
+    event.listen(source, "after_create", on_source_created)
+
+
+@event.listens_for(Change_log.__table__, "after_create")
+def on_log_created(target, connection, **kw):
+    # Журнал добавлен в существующую базу данных: триггеры получают уже созданные таблицы
+    install_triggers(connection, [table for table in SOURCE_TABLES if inspect(connection).has_table(table.name)])
+
+
+def invalidate_caches(names):
+    # Кэши процесса загружаются и из реплики, а их обработчики сброса видят только изменения таблиц основного
+    # сервера; поэтому после синхронизации кэши таблиц, строки которых изменились, сбрасываются здесь
+    if names & {history_implementation.name, Partner_sales_totals.__tablename__}:
+        totals_cache.invalidate()
+    for table, cache in CACHES.items():
+        if table.name in names:
+            cache.invalidate()
+
+
+def reads_replicated(clause):
+    # Запрос только читает таблицы реплики: SELECT без FOR UPDATE и без текстовых фрагментов SQL
+    if not isinstance(clause, Select) or clause._for_update_arg is not None:
+        return False
+    names = set()
+    for element in visitors.iterate(clause):
+        if isinstance(element, TextClause):
+            return False
+        if isinstance(element, TableClause):
+            names.add(element.name)
+    return bool(names) and names <= REPLICATED
+
+
+def writes_replicated(clause):
+    # Запрос может изменить таблицы реплики: вставка, изменение или удаление их строк, а также текстовый SQL,
+    # кроме SELECT (по тексту запроса таблицы не определить)
+    if isinstance(clause, UpdateBase):
+        return clause.table.name in REPLICATED
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith("SELECT")
+    return False
+
+
+# Сессия, читающая таблицы реплики из локального файла; остальные запросы и запись идут на сервер
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get(REPLICA_KEY)
+        if (replica is not None and replica.ready and replica.fresh and not self._flushing and not self.info.get(WRITTEN_KEY)
+                and reads_replicated(clause)):
+            return self.info[BIND_KEY]
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def enable_wal(engine):
+    # Чтение реплики не блокируется синхронизацией, которая пишет в тот же файл
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+# Файл реплики и его синхронизация с основным сервером
+class Replica:
+    def __init__(self, path, primary):
+        self.path = path
+        self.primary = primary  # Движок основного сервера
+        self.engine = create_engine(f"sqlite:///{path}")
+        enable_wal(self.engine)
+        self.async_engine = None  # Движок для асинхронных сессий (async_db.py), создается по запросу
+        self.error = None  # Ошибка последней синхронизации
+        self.pruned = 0  # Время последней очистки журнала (time.monotonic)
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()  # Запрос внеочередной синхронизации фоновому потоку
+        self.lock = threading.Lock()  # Синхронизации выполняются по очереди
+        self.requests_lock = threading.Lock()
+        self.requested = 0  # Номер последнего запроса синхронизации после своей записи
+        self.synced = 0  # Номер запроса, который учтен завершенной синхронизацией
+        if Connect.settings()["query_stats"]:
+            import query_stats  # Статистика запросов для отладки
+            query_stats.install(self.engine)
+        self.ready = self.open()  # Можно ли читать из реплики (хотя бы одна синхронизация завершена)
+
+    def open(self):
+        # Проверка файла реплики; файл другой версии создается заново
+        with self.engine.begin() as connection:
+            row = connection.execute(select(state)).first() if inspect(connection).has_table(state.name) else None
+            if row is None or row.версия != REPLICA_VERSION:
+                metadata.drop_all(connection)
+                metadata.create_all(connection)
+                return False
+        return True
+
+    def session_factory(self):
+        return sessionmaker(bind=self.primary, class_=RoutingSession, info={REPLICA_KEY: self, BIND_KEY: self.engine})
+
+    def async_session_factory(self, primary):
+        # Фабрика асинхронных сессий: реплика читается через aiosqlite
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        if self.async_engine is None:
+            self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{self.path}")
+            enable_wal(self.async_engine.sync_engine)
+        return async_sessionmaker(primary, sync_session_class=RoutingSession, info={REPLICA_KEY: self, BIND_KEY: self.async_engine.sync_engine})
+
+    def start(self, interval):
+        # Фоновая синхронизация; при interval <= 0 реплика синхронизируется только после своих изменений и командой sync
+        threading.Thread(target=self.run, args=(interval,), name="replica-sync", daemon=True).start()
+
+    def run(self, interval):
+        timeout = interval if interval > 0 else None
+        if timeout is None:
+            self.wakeup.wait()
+        while not self.stopped.is_set():
+            self.wakeup.clear()
+            self.try_sync()
+            self.wakeup.wait(timeout)
+
+    def close(self, close=True):
+        self.stopped.set()
+        self.wakeup.set()
+        self.engine.dispose(close=close)
+
+    def request_sync(self):
+        # Вызывается после фиксации своих изменений: синхронизацию выполнит фоновый поток,
+        # до ее окончания чтение идет с сервера (fresh)
+        with self.requests_lock:
+            self.requested += 1
+        self.wakeup.set()
+
+    @property
+    def fresh(self):
+        # Учтены ли в реплике все свои изменения
+        return self.synced >= self.requested
+
+    def try_sync(self):
+        # Синхронизация без исключений: при недоступном сервере чтение продолжается по реплике
+        requested = self.requested
+        try:
+            self.sync()
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+        # После ошибки чтение тоже возвращается к реплике: сервер, скорее всего, недоступен
+        self.synced = max(self.synced, requested)
+
+    def sync(self, full=False):
+        # Синхронизация с сервером; возвращает количество скопированных или обновленных строк
+        if self.primary.dialect.name != "postgresql":
+            raise RuntimeError("Журнал изменений для локальной реплики ведется только в PostgreSQL")
+        with self.lock:
+            with self.engine.connect() as connection:
+                row = connection.execute(select(state)).first()
+            stale = row is None or row.синхронизирована < datetime.datetime.now() - datetime.timedelta(days=RESYNC_DAYS)
+            count = self.copy() if full or stale else self.apply(row.граница)
+            self.ready = True
+            if time.monotonic() - self.pruned > PRUNE_INTERVAL:
+                self.prune()
+            return count
+
+    def copy(self):
+        # Полное копирование таблиц; граница берется до копирования, поэтому изменения, зафиксированные
+        # во время копирования, будут применены следующей синхронизацией повторно
+        count = 0
+        with self.primary.connect() as source, self.engine.begin() as target:
+            boundary = source.execute(text(BOUNDARY)).scalar()
+            for table in SOURCE_TABLES:
+                target.execute(delete(tables[table.name]))
+                result = source.execution_options(stream_results=True, yield_per=BATCH).execute(select(table))
+                for rows in result.partitions():
+                    target.execute(insert(tables[table.name]), [dict(row._mapping) for row in rows])
+                    count += len(rows)
+            self.save_state(target, boundary)
+        invalidate_caches(REPLICATED)
+        return count
+
+    def apply(self, boundary):
+        # Строки, ключи которых записаны в журнал транзакциями от прошлой до новой границы
+        count, changed = 0, set()
+        with self.primary.connect() as source, self.engine.begin() as target:
+            new_boundary = source.execute(text(BOUNDARY)).scalar()
+            if new_boundary > boundary:
+                for table in SOURCE_TABLES:
+                    rows = self.apply_table(source, target, table, boundary, new_boundary)
+                    if rows:
+                        changed.add(table.name)
+                    count += rows
+            self.save_state(target, max(boundary, new_boundary))
+        invalidate_caches(changed)  # После фиксации: следующая загрузка кэша прочитает новые строки
+        return count
+
+    def apply_table(self, source, target, table, start, end):
+        # Одним потоковым запросом: измененные ключи таблицы и текущие строки с этими ключами (NULL - строка удалена).
+        # В реплике строки с этими ключами удаляются и вставляются заново
+        key = [column.name for column in table.primary_key.columns]
+        columns = [column.name for column in table.columns]
+        query = text(
+            f"SELECT {', '.join(f'изменение.{name}' for name in key)}, строка.{key[0]} IS NOT NULL AS есть, "
+            f"{', '.join(f'строка.{name}' for name in columns)} "
+            f"FROM (SELECT DISTINCT {', '.join(f'запись.{name}' for name in key)} FROM {LOG} "
+            f"CROSS JOIN LATERAL jsonb_populate_record(NULL::{table.name}, {LOG}.ключ::jsonb) AS запись "
+            f"WHERE {LOG}.таблица = :table AND {LOG}.транзакция >= :start AND {LOG}.транзакция < :end) AS изменение "
+            f"LEFT JOIN {table.name} AS строка ON {' AND '.join(f'строка.{name} = изменение.{name}' for name in key)}"
+        )
+        replica_table = tables[table.name]
+        key_columns = [replica_table.c[name] for name in key]
+        count = 0
+        result = source.execution_options(stream_results=True, yield_per=BATCH).execute(query, {"table": table.name, "start": start, "end": end})
+        for rows in result.partitions():
+            keys = [tuple(row[:len(key)]) for row in rows]
+            if len(key_columns) == 1:
+                target.execute(delete(replica_table).where(key_columns[0].in_([value for value, in keys])))
+            else:
+                target.execute(delete(replica_table).where(tuple_(*key_columns).in_(keys)))
+            present = [dict(zip(columns, row[len(key) + 1:])) for row in rows if row[len(key)]]
+            if present:
+                target.execute(insert(replica_table), present)
+            count += len(rows)
+        return count
+
+    def save_state(self, connection, boundary):
+        connection.execute(delete(state))
+        connection.execute(insert(state).values(id=1, версия=REPLICA_VERSION, граница=boundary, синхронизирована=datetime.datetime.now()))
+
+    def prune(self):
+        # Удаление записей журнала старше RETENTION_DAYS (выполняет любая реплика не чаще раза в PRUNE_INTERVAL)
+        with self.primary.begin() as connection:
+            connection.execute(text(f"DELETE FROM {LOG} WHERE время < now() - make_interval(days => :days)"), {"days": RETENTION_DAYS})
+        self.pruned = time.monotonic()
+
+    def status(self):
+        # Состояние реплики: граница, время синхронизации и количество строк по таблицам
+        with self.engine.connect() as connection:
+            row = connection.execute(select(state)).first()
+            counts = {name: connection.execute(select(func.count()).select_from(table)).scalar() for name, table in tables.items()}
+        return row, counts
+
+
+@event.listens_for(Session, "after_flush")
+def on_flush(session, flush_context):
+    # Сессия изменила таблицы реплики через ORM: до конца транзакции чтение идет с сервера
+    if REPLICA_KEY in session.info and any(
+        table.name in REPLICATED for item in session.new | session.dirty | session.deleted for table in inspect(item).mapper.tables
+    ):
+        session.info[WRITTEN_KEY] = True
+
+
+@event.listens_for(Session, "after_begin")
+def on_begin(session, transaction, connection):
+    # Соединение запоминает сессию: запись замечается и у запросов, выполненных через session.connection()
+    if REPLICA_KEY in session.info:
+        connection.info[SESSION_INFO_KEY] = session.info
+
+
+@event.listens_for(Engine, "after_execute")
+def on_execute(connection, clauseelement, multiparams, params, execution_options, result):
+    # То же для вставки, изменения и удаления запросами сессии (ORM, Core, text())
+    info = connection.info.get(SESSION_INFO_KEY)
+    if info is not None and writes_replicated(clauseelement):
+        info[WRITTEN_KEY] = True
+
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def on_connection_end(connection):
+    connection.info.pop(SESSION_INFO_KEY, None)
+
+
+@event.listens_for(Session, "after_commit")
+def on_commit(session):
+    # Свои изменения попадают в реплику сразу после фиксации: синхронизацию выполняет фоновый поток
+    if session.info.pop(WRITTEN_KEY, False) and session.info[REPLICA_KEY].ready:
+        session.info[REPLICA_KEY].request_sync()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def on_rollback(session, previous_transaction):
+    session.info.pop(WRITTEN_KEY, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание локальной реплики для чтения")
+    parser.add_argument("command", choices=["install", "sync", "status"],
+                        help="install - установить журнал изменений на сервере, sync - синхронизировать реплику, status - состояние реплики")
+    parser.add_argument("--path", help="Файл реплики (по умолчанию PRAKTIKA_REPLICA)")
+    parser.add_argument("--full", action="store_true", help="Скопировать таблицы заново")
+    args = parser.parse_args()
+    if args.command == "install":
+        with Connect.get_engine().begin() as connection:
+            Change_log.__table__.create(connection, checkfirst=True)
+            install_triggers(connection)
+        print("Журнал изменений установлен")
+    else:
+        path = args.path or Connect.settings()["replica"]
+        if not path:
+            parser.error("не указан файл реплики: --path или PRAKTIKA_REPLICA")
+        Connect.configure(replica=path, replica_interval=0)  # Синхронизация выполняется только командой
+        replica = Connect.replica()
+        if args.command == "sync":
+            started = time.perf_counter()
+            count = replica.sync(full=args.full)
+            print(f"Строк синхронизировано: {count}, {time.perf_counter() - started:.3f} с")
+        row, counts = replica.status()
+        if row is None:
+            print("Реплика еще не синхронизирована")
+        else:
+            print(f"Граница: {row.граница}, синхронизирована: {row.синхронизирована:%Y-%m-%d %H:%M:%S}")
+        for name, count in counts.items():
+            print(f"{name}: {count}")
@@ -0,0 +1,236 @@
+# Генерация табличных PDF-отчетов по партнерам, истории реализации и расчету материалов.
+# Строки отчета берутся из итератора (курсора базы данных), страницы формируются автоматически.
+# reportlab держит в памяти все страницы документа до сохранения, поэтому большой отчет разбивается
+# на тома: каждые pages_per_volume страниц файл сохраняется на диск и начинается следующий том,
+# так что расход памяти не зависит от количества строк. Тома прежнего, более длинного отчета с тем же
+# именем удаляются перед записью, чтобы рядом с новым отчетом не оставались чужие страницы.
+import os
+import threading
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase import pdfmetrics
+from datebase import Connect, Partner, Type_partner, Products, history_implementation
+from sales_totals import totals_cache
+from discount import calculate_discount
+from material_calculation import MaterialCalculator, load_order_book
+
+FONT_NAME = "SegoeUI"  # Шрифт с поддержкой кириллицы
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SegoeUIRegular.ttf")
+STREAM_BATCH = 1000  # Количество строк, читаемых из курсора за один раз
+
+_font_lock = threading.Lock()
+_font_registered = False
+
+
+def register_fonts():
+    # Шрифт разбирается один раз за процесс
+    global _font_registered
+    with _font_lock:
+        if not _font_registered:
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_FILE))
+            _font_registered = True
+
+
+class TableReport:
+    PAGE_WIDTH, PAGE_HEIGHT = letter
+    MARGIN = 40  # Поля страницы
+    TITLE_SIZE = 16  # Размер шрифта заголовка
+    FONT_SIZE = 9  # Размер шрифта таблицы
+    LINE_HEIGHT = 13  # Высота строки таблицы
+
+    def __init__(self, file_path, title, columns, widths=None, pages_per_volume=500, invariant=False):
+        register_fonts()
+        self.file_path = file_path  # Путь к первому тому отчета
+        self.title = title  # Заголовок отчета
+        self.columns = columns  # Названия колонок
+        self.pages_per_volume = pages_per_volume  # Количество страниц в одном файле
+        self.invariant = invariant  # Без даты создания в файле, чтобы одинаковые данные давали одинаковый файл
+
+        # Ширина колонок в долях ширины страницы (по умолчанию поровну)
+        widths = widths or [1] * len(columns)
+        table_width = self.PAGE_WIDTH - 2 * self.MARGIN
+        self.column_x = []  # Левая граница каждой колонки
+        self.column_width = []  # Ширина каждой колонки
+        x = self.MARGIN
+        for width in widths:
+            self.column_x.append(x)
+            self.column_width.append(table_width * width / sum(widths) - 4)
+            x += table_width * width / sum(widths)
+        # Строки не длиннее этого количества символов заведомо помещаются в самую узкую колонку без измерения
+        self.safe_chars = int(min(self.column_width) / pdfmetrics.stringWidth("Ш", FONT_NAME, self.FONT_SIZE))
+
+        self.files = []  # Сохраненные тома
+        self.canvas = None
+        self.volume_file = None  # Файл текущего тома
+        self.text = None  # Текстовый объект текущей страницы
+        self.page = 0  # Номер страницы в отчете
+        self.volume_pages = 0  # Количество страниц в текущем томе
+        self.y = 0  # Текущая позиция по вертикали
+
+    def volume_path(self, number):
+        # Первый том - file_path, следующие - с номером тома в имени
+        if number == 1:
+            return self.file_path
+        base, extension = os.path.splitext(self.file_path)
+        return f"{base}_{number}{extension}"
+
+    def remove_old_volumes(self):
+        # Тома с номерами подряд, начиная со второго (первый том перезаписывается)
+        number = 2
+        while os.path.exists(self.volume_path(number)):
+            os.remove(self.volume_path(number))
+            number += 1
+
+    def start_page(self):
+        if self.canvas is None:
+            self.volume_file = self.volume_path(len(self.files) + 1)
+            self.canvas = canvas.Canvas(self.volume_file, pagesize=letter, pageCompression=1, invariant=self.invariant)
+            self.volume_pages = 0
+        self.page += 1
+        self.volume_pages += 1
+        self.y = self.PAGE_HEIGHT - self.MARGIN
+
+        # Заголовок отчета на первой странице
+        if self.page == 1:
+            self.canvas.setFont(FONT_NAME, self.TITLE_SIZE)
+            self.canvas.drawCentredString(self.PAGE_WIDTH / 2, self.y - self.TITLE_SIZE, self.title)
+            self.y -= self.TITLE_SIZE * 2
+
+        # Весь текст таблицы страницы выводится одним текстовым объектом - это намного быстрее drawString
+        self.text = self.canvas.beginText()
+        self.text.setFont(FONT_NAME, self.FONT_SIZE)
+
+        # Заголовки колонок повторяются на каждой странице
+        self.draw_row(self.columns)
+        self.canvas.line(self.MARGIN, self.y + 3, self.PAGE_WIDTH - self.MARGIN, self.y + 3)
+
+    def finish_page(self):
+        # Номер страницы внизу и переход к следующей странице или тому
+        self.canvas.drawText(self.text)
+        self.canvas.setFont(FONT_NAME, self.FONT_SIZE)
+        self.canvas.drawRightString(self.PAGE_WIDTH - self.MARGIN, self.MARGIN / 2, f"Страница {self.page}")
+        self.canvas.showPage()
+        if self.volume_pages >= self.pages_per_volume:
+            self.save_volume()
+
+    def save_volume(self):
+        # Том записывается на диск и освобождается из памяти
+        self.canvas.save()
+        self.files.append(self.volume_file)
+        self.canvas = None
+
+    def draw_row(self, values):
+        for x, width, value in zip(self.column_x, self.column_width, values):
+            text = "" if value is None else str(value)
+            if len(text) > self.safe_chars:
+                text = self.fit(text, width)
+            self.text.setTextOrigin(x, self.y - self.FONT_SIZE)
+            self.text.textOut(text)
+        self.y -= self.LINE_HEIGHT
+
+    def fit(self, text, width):
+        # Обрезаем текст, не помещающийся в колонку
+        text_width = pdfmetrics.stringWidth(text, FONT_NAME, self.FONT_SIZE)
+        if text_width <= width:
+            return text
+        text = text[:int(len(text) * width / text_width)]
+        while text and pdfmetrics.stringWidth(text + "…", FONT_NAME, self.FONT_SIZE) > width:
+            text = text[:-1]
+        return text + "…"
+
+    def iter_write(self, rows):
+        # Вывод всех строк итератора; после каждой страницы отдает ее номер.
+        # Если генератор закрыт раньше времени (отмена), несохраненный том не записывается
+        self.remove_old_volumes()
+        count = 0
+        self.start_page()
+        for row in rows:
+            if self.y - self.LINE_HEIGHT < self.MARGIN:
+                self.finish_page()
+                yield self.page
+                self.start_page()
+            self.draw_row(row)
+            count += 1
+        if count == 0:
+            self.draw_row(["Нет данных"])
+        self.finish_page()
+        if self.canvas is not None:
+            self.save_volume()
+        yield self.page
+
+    def write(self, rows):
+        # Вывод всех строк итератора; возвращает список созданных файлов
+        for _ in self.iter_write(rows):
+            pass
+        return self.files
+
+
+def stream(session, statement):
+    # Потоковое чтение результата запроса с серверного курсора
+    return session.execute(statement, execution_options={"stream_results": True, "yield_per": STREAM_BATCH})
+
+
+def partner_rows(session):
+    # Партнеры со скидками; итоги продаж читаются пачками по STREAM_BATCH партнеров
+    statement = session.query(
+        Partner.id, Partner.наименование, Type_partner.наименование, Partner.инн, Partner.телефон, Partner.рейтинг
+    ).outerjoin(Type_partner, Partner.id_тип == Type_partner.id).order_by(Partner.id).statement
+    for batch in stream(session, statement).partitions():
+        totals = totals_cache.get_many(session, [row[0] for row in batch])
+        for partner_id, name, type_name, inn, phone, rating in batch:
+            yield name, type_name, inn, phone, rating, f"{calculate_discount(totals.get(partner_id, 0))}%"
+
+
+def sales_rows(session):
+    # История реализации с названиями партнеров и продукции
+    statement = session.query(
+        Partner.наименование, Products.наименование, history_implementation.c.количество, history_implementation.c.дата_продажи
+    ).select_from(history_implementation).join(Partner, history_implementation.c.id_партнер == Partner.id).join(
+        Products, history_implementation.c.id_продукция == Products.id
+    ).order_by(history_implementation.c.дата_продажи).statement
+    for row in stream(session, statement):
+        yield tuple(row)
+
+
+def material_rows(session):
+    # Расчет количества материала по всем строкам заявок
+    calculator = MaterialCalculator(session)
+    result = calculator.calculate(*load_order_book(session))
+    for name, required, stock, shortfall in zip(result["material_name"], result["required"], result["stock"], result["shortfall"]):
+        yield name, f"{required:.0f}", f"{stock:.0f}", f"{shortfall:.0f}"
+
+
+TABLES = {  # Имя функции отчета -> (файл по умолчанию, заголовок, колонки, доли ширины колонок, строки)
+    "partners_report": ("partners_report.pdf", "Отчет по партнерам", ["Наименование", "Тип", "ИНН", "Телефон", "Рейтинг", "Скидка"], [4, 1, 2, 2, 1, 1], partner_rows),
+    "sales_report": ("sales_report.pdf", "Отчет по реализации продукции", ["Партнер", "Продукция", "Количество", "Дата продажи"], [3, 5, 1, 1], sales_rows),
+    "material_report": ("material_calculation_report.pdf", "Отчет по количеству материала", ["Материал", "Требуется", "На складе", "Не хватает"], [4, 1, 1, 1], material_rows),
+}
+
+
+def iter_report(session, report_name, file_path=None):
+    # Отчет для фоновой задачи: после каждой страницы отдает (номер страницы, сохраненные тома)
+    default_path, title, columns, widths, rows = TABLES[report_name]
+    report = TableReport(file_path or default_path, title, columns, widths)
+    for page in report.iter_write(rows(session)):
+        yield page, list(report.files)
+
+
+def write_report(report_name, file_path):
+    with Connect.session_scope() as session:
+        files = []
+        for _, files in iter_report(session, report_name, file_path):
+            pass
+        return files
+
+
+def partners_report(file_path="partners_report.pdf"):
+    return write_report("partners_report", file_path)
+
+
+def sales_report(file_path="sales_report.pdf"):
+    return write_report("sales_report", file_path)
+
+
+def material_report(file_path="material_calculation_report.pdf"):
+    return write_report("material_report", file_path)
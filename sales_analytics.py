@@ -0,0 +1,192 @@
+# Аналитика продаж: итоги по партнеру, продукции и месяцу и срезы по ним.
+# Таблица "итоги_продаж_по_месяцам" обновляется триггерами при любой вставке, изменении или удалении строк
+# истории реализации, как и итоги продаж партнеров (sales_totals.py). Срезы по типу партнера, типу продукции,
+# партнеру, продукции и месяцу строятся по этой таблице: в ней не больше одной строки на партнера, продукцию
+# и месяц, поэтому время ответа не растет вместе с историей реализации.
+# Триггеры устанавливаются автоматически при создании таблиц; для существующей базы данных
+# и для восстановления используется команда: python sales_analytics.py install | rebuild
+import argparse
+from sqlalchemy import event, inspect, select, func, text
+from datebase import Connect, Monthly_sales_totals, history_implementation, Partner, Type_partner, Products, Product_type
+
+MONTHLY = Monthly_sales_totals.__tablename__
+HISTORY = history_implementation.name
+
+# Первый день месяца даты продажи
+MONTH_EXPRESSIONS = {
+    "postgresql": "date_trunc('month', {column})::date",
+    "sqlite": "date({column}, 'start of month')",
+}
+
+# PostgreSQL: триггеры уровня оператора с таблицами переходов - одна агрегирующая команда на весь пакет строк
+POSTGRESQL_TRIGGERS = [
+    f"""
+    CREATE OR REPLACE FUNCTION обновить_итоги_по_месяцам() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE {MONTHLY} AS итоги SET количество = итоги.количество - изменение.количество
+            FROM (SELECT id_партнер, id_продукция, date_trunc('month', дата_продажи)::date AS месяц, SUM(COALESCE(количество, 0)) AS количество
+                  FROM старые_строки GROUP BY 1, 2, 3) AS изменение
+            WHERE итоги.id_партнер = изменение.id_партнер AND итоги.id_продукция = изменение.id_продукция AND итоги.месяц = изменение.месяц;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {MONTHLY} (id_партнер, id_продукция, месяц, количество)
+            SELECT id_партнер, id_продукция, date_trunc('month', дата_продажи)::date, SUM(COALESCE(количество, 0))
+            FROM новые_строки GROUP BY 1, 2, 3
+            ON CONFLICT (id_партнер, id_продукция, месяц) DO UPDATE SET количество = {MONTHLY}.количество + EXCLUDED.количество;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS итоги_месяцев_вставка ON {HISTORY}",
+    f"DROP TRIGGER IF EXISTS итоги_месяцев_изменение ON {HISTORY}",
+    f"DROP TRIGGER IF EXISTS итоги_месяцев_удаление ON {HISTORY}",
+    f"""CREATE TRIGGER итоги_месяцев_вставка AFTER INSERT ON {HISTORY}
+    REFERENCING NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_по_месяцам()""",
+    f"""CREATE TRIGGER итоги_месяцев_изменение AFTER UPDATE ON {HISTORY}
+    REFERENCING OLD TABLE AS старые_строки NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_по_месяцам()""",
+    f"""CREATE TRIGGER итоги_месяцев_удаление AFTER DELETE ON {HISTORY}
+    REFERENCING OLD TABLE AS старые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_по_месяцам()""",
+]
+
+# SQLite: триггеры уровня строки; строки без партнера, продукции или даты в итоги не попадают
+SQLITE_ADD = f"""
+    INSERT INTO {MONTHLY} (id_партнер, id_продукция, месяц, количество)
+    SELECT NEW.id_партнер, NEW.id_продукция, date(NEW.дата_продажи, 'start of month'), COALESCE(NEW.количество, 0)
+    WHERE NEW.id_партнер IS NOT NULL AND NEW.id_продукция IS NOT NULL AND NEW.дата_продажи IS NOT NULL
+    ON CONFLICT (id_партнер, id_продукция, месяц) DO UPDATE SET количество = количество + excluded.количество;"""
+SQLITE_SUBTRACT = f"""
+    UPDATE {MONTHLY} SET количество = количество - COALESCE(OLD.количество, 0)
+    WHERE id_партнер = OLD.id_партнер AND id_продукция = OLD.id_продукция AND месяц = date(OLD.дата_продажи, 'start of month');"""
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS итоги_месяцев_вставка",
+    "DROP TRIGGER IF EXISTS итоги_месяцев_изменение",
+    "DROP TRIGGER IF EXISTS итоги_месяцев_удаление",
+    f"CREATE TRIGGER итоги_месяцев_вставка AFTER INSERT ON {HISTORY} BEGIN {SQLITE_ADD} END",
+    f"CREATE TRIGGER итоги_месяцев_изменение AFTER UPDATE ON {HISTORY} BEGIN {SQLITE_SUBTRACT} {SQLITE_ADD} END",
+    f"CREATE TRIGGER итоги_месяцев_удаление AFTER DELETE ON {HISTORY} BEGIN {SQLITE_SUBTRACT} END",
+]
+
+
+def install_triggers(connection):
+    # Установка (или переустановка) триггеров, поддерживающих итоги по месяцам
+    statements = POSTGRESQL_TRIGGERS if connection.dialect.name == "postgresql" else SQLITE_TRIGGERS
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_monthly_totals(connection):
+    # Полный пересчет итогов по месяцам по истории реализации
+    month = MONTH_EXPRESSIONS[connection.dialect.name].format(column="дата_продажи")
+    connection.execute(text(f"DELETE FROM {MONTHLY}"))
+    connection.execute(text(
+        f"INSERT INTO {MONTHLY} (id_партнер, id_продукция, месяц, количество) "
+        f"SELECT id_партнер, id_продукция, {month}, SUM(COALESCE(количество, 0)) FROM {HISTORY} "
+        f"WHERE id_партнер IS NOT NULL AND id_продукция IS NOT NULL AND дата_продажи IS NOT NULL "
+        f"GROUP BY id_партнер, id_продукция, {month}"
+    ))
+
+
+@event.listens_for(history_implementation, "after_create")
+def on_history_created(target, connection, **kw):
+    # Новая таблица истории реализации сразу получает триггеры
+    install_triggers(connection)
+
+
+@event.listens_for(Monthly_sales_totals.__table__, "after_create")
+def on_monthly_created(target, connection, **kw):
+    # Таблица итогов добавлена в существующую базу данных: ставим триггеры и заполняем итоги по истории
+    if inspect(connection).has_table(HISTORY):
+        install_triggers(connection)
+        rebuild_monthly_totals(connection)
+
+
+# Измерения срезов: заголовок, колонка ключа и колонка названия
+DIMENSIONS = {
+    "partner_type": ("Тип партнера", Type_partner.id, Type_partner.наименование),
+    "partner": ("Партнер", Partner.id, Partner.наименование),
+    "product_type": ("Тип продукции", Product_type.id, Product_type.наименование),
+    "product": ("Продукция", Products.id, Products.наименование),
+    "month": ("Месяц", Monthly_sales_totals.месяц, Monthly_sales_totals.месяц),
+}
+
+# Показатели: количество и стоимость по минимальной стоимости продукции
+MEASURES = {
+    "количество": ("Количество", func.sum(Monthly_sales_totals.количество)),
+    "стоимость": ("Стоимость", func.sum(Monthly_sales_totals.количество * func.coalesce(Products.мин_стоимость, 0))),
+}
+
+# Следующее измерение при переходе к подробностям строки
+DRILL_DOWN = {
+    "partner_type": "partner",
+    "partner": "product",
+    "product_type": "product",
+    "product": "month",
+}
+
+
+# Сводная таблица: строки и столбцы - значения измерений, ячейки - значения показателя
+class Pivot:
+    def __init__(self, rows, columns, cells):
+        self.rows = rows  # [(ключ, название)] в порядке убывания итога строки
+        self.columns = columns  # [(ключ, название)]; без измерения столбцов - один столбец с ключом None
+        self.cells = cells  # (ключ строки, ключ столбца) -> значение
+        self.row_totals = {}
+        self.column_totals = {}
+        for (row, column), value in cells.items():
+            self.row_totals[row] = self.row_totals.get(row, 0) + value
+            self.column_totals[column] = self.column_totals.get(column, 0) + value
+        self.total = sum(self.row_totals.values())
+        self.rows.sort(key=lambda item: self.row_totals.get(item[0], 0), reverse=True)
+
+    def value(self, row, column):
+        return self.cells.get((row, column), 0)
+
+
+def slice_query(rows, columns=None, measure="количество", date_from=None, date_to=None, filters=None):
+    # Запрос среза по итогам месяцев; период - полуоткрытый интервал дат, filters - {измерение: ключ}
+    dimensions = [rows] + ([columns] if columns else [])
+    selected = []
+    for name in dimensions:
+        _, key, label = DIMENSIONS[name]
+        selected += [key.label(f"{name}_key"), label.label(f"{name}_label")]
+    query = select(*selected, MEASURES[measure][1].label("value")).select_from(Monthly_sales_totals) \
+        .join(Partner, Monthly_sales_totals.id_партнер == Partner.id) \
+        .join(Products, Monthly_sales_totals.id_продукция == Products.id) \
+        .outerjoin(Type_partner, Partner.id_тип == Type_partner.id) \
+        .outerjoin(Product_type, Products.id_тип == Product_type.id)
+    # Месяц входит в период, если период захватывает хотя бы его первый день
+    if date_from is not None:
+        query = query.where(Monthly_sales_totals.месяц >= date_from.replace(day=1))
+    if date_to is not None:
+        query = query.where(Monthly_sales_totals.месяц < date_to)
+    for name, key in (filters or {}).items():
+        query = query.where(DIMENSIONS[name][1] == key)
+    groups = [column for name in dimensions for column in DIMENSIONS[name][1:]]
+    return query.group_by(*groups)
+
+
+def pivot(session, rows, columns=None, measure="количество", date_from=None, date_to=None, filters=None):
+    # Сводная таблица по срезу итогов месяцев
+    row_labels, column_labels, cells = {}, {}, {}
+    for record in session.execute(slice_query(rows, columns, measure, date_from, date_to, filters)):
+        row_key = record[0]
+        column_key = record[2] if columns else None
+        row_labels[row_key] = record[1]
+        column_labels[column_key] = record[3] if columns else MEASURES[measure][0]
+        cells[(row_key, column_key)] = cells.get((row_key, column_key), 0) + (record.value or 0)
+    # Месяцы идут по порядку, остальные столбцы - по названию
+    ordered_columns = sorted(column_labels.items(), key=lambda item: (item[0] is None, item[0] if columns == "month" else str(item[1])))
+    return Pivot(list(row_labels.items()), ordered_columns, cells)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы итогов продаж по месяцам")
+    parser.add_argument("command", choices=["install", "rebuild"], help="install - установить триггеры и пересчитать итоги, rebuild - только пересчитать итоги")
+    args = parser.parse_args()
+    with Connect.get_engine().begin() as connection:
+        if args.command == "install":
+            install_triggers(connection)
+        rebuild_monthly_totals(connection)
+    print("Итоги продаж по месяцам пересчитаны")
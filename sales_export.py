@@ -0,0 +1,186 @@
+# Выгрузка истории реализации для аналитики: строки истории с партнером и продукцией в Parquet или CSV.
+# Данные читаются по месяцам (в PostgreSQL каждый месяц - своя секция истории) серверным курсором порциями
+# по BATCH_ROWS строк; каждая порция превращается в RecordBatch Apache Arrow и записывается в файл
+# (для Parquet - группами строк по ROW_GROUP_ROWS), поэтому расход памяти не зависит от количества строк.
+#   parquet - набор данных с секциями по месяцу продажи: папка/месяц=2024-06/part-0.parquet
+#   csv     - файлы по CSV_FILE_ROWS строк: папка/sales_00001.csv
+# Файл появляется под своим именем только после записи целиком, поэтому прерванная выгрузка
+# не оставляет недописанных файлов.
+#
+# Запуск: python sales_export.py папка [--format parquet|csv] [--date-from 2024-01-01] [--date-to 2025-01-01]
+# Зависимости: pip install pyarrow
+import argparse
+import datetime
+import os
+import time
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import select, func
+from datebase import Connect, Partner, Products, history_implementation
+from sales_history import month_range, months, period_conditions
+
+BATCH_ROWS = 10000  # Строк в одной порции курсора и одном RecordBatch (объекты строк Python занимают много памяти)
+ROW_GROUP_ROWS = 250000  # Строк в одной группе строк Parquet (порции копятся в компактном виде Arrow)
+CSV_FILE_ROWS = 1000000  # Строк в одном файле CSV
+NO_DATE = "нет"  # Секция для строк без даты продажи
+FORMATS = ("parquet", "csv")
+
+# Колонки выгрузки: схема Arrow и выражения запроса
+SCHEMA = pa.schema([
+    ("дата_продажи", pa.date32()),
+    ("id_партнер", pa.int32()),
+    ("партнер", pa.string()),
+    ("инн", pa.string()),
+    ("id_продукция", pa.int32()),
+    ("продукция", pa.string()),
+    ("количество", pa.int32()),
+    ("мин_стоимость", pa.float64()),
+])
+COLUMNS = [
+    history_implementation.c.дата_продажи,
+    history_implementation.c.id_партнер,
+    Partner.наименование,
+    Partner.инн,
+    history_implementation.c.id_продукция,
+    Products.наименование,
+    history_implementation.c.количество,
+    Products.мин_стоимость,
+]
+
+
+def sales_query(*conditions):
+    # Соединение истории реализации с партнерами и продукцией; строки без партнера или продукции тоже выгружаются
+    return select(*COLUMNS).select_from(history_implementation).outerjoin(
+        Partner, history_implementation.c.id_партнер == Partner.id
+    ).outerjoin(Products, history_implementation.c.id_продукция == Products.id).where(*conditions)
+
+
+def export_months(session, date_from=None, date_to=None):
+    # Месяцы периода, в которых есть продажи (границы - по индексу даты продажи); None - строки без даты
+    first, last = session.execute(
+        select(func.min(history_implementation.c.дата_продажи), func.max(history_implementation.c.дата_продажи)).where(*period_conditions(date_from, date_to))
+    ).one()
+    result = list(months(first, last + datetime.timedelta(days=1))) if first is not None else []
+    if date_from is None and date_to is None:
+        result.append(None)
+    return result
+
+
+def record_batches(session, date_from=None, date_to=None):
+    # (месяц, RecordBatch) по месяцам периода; месяц - (год, месяц) или None для строк без даты
+    for month in export_months(session, date_from, date_to):
+        if month is None:
+            conditions = [history_implementation.c.дата_продажи.is_(None)]
+        else:
+            start, end = month_range(*month)
+            conditions = period_conditions(max(start, date_from) if date_from else start, min(end, date_to) if date_to else end)
+        # Запрос выполняется соединением сессии без обработки строк ORM; соединение выбирается по запросу,
+        # поэтому при включенной локальной реплике (replica.py) история читается из нее
+        query = sales_query(*conditions)
+        connection = session.connection(bind_arguments={"clause": query})
+        result = connection.execution_options(stream_results=True, yield_per=BATCH_ROWS).execute(query)
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            yield month, pa.RecordBatch.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)], schema=SCHEMA)
+
+
+# Файл, который получает свое имя после записи целиком; порции записываются группами не меньше group_rows строк
+class OutputFile:
+    def __init__(self, path, open_writer, group_rows=0):
+        self.path = path
+        self.temporary = path + ".part"
+        self.writer = open_writer(self.temporary)
+        self.group_rows = group_rows
+        self.pending = []  # Порции следующей группы
+        self.pending_rows = 0
+        self.rows = 0
+
+    def write(self, batch):
+        self.pending.append(batch)
+        self.pending_rows += batch.num_rows
+        self.rows += batch.num_rows
+        if self.pending_rows >= self.group_rows:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(pa.Table.from_batches(self.pending))
+            self.pending, self.pending_rows = [], 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.temporary, self.path)
+
+    def discard(self):
+        self.writer.close()
+        os.remove(self.temporary)
+
+
+def month_directory(month):
+    return "месяц=" + (f"{month[0]}-{month[1]:02d}" if month else NO_DATE)
+
+
+def iter_export(session, output_dir, file_format="parquet", date_from=None, date_to=None):
+    # Выгрузка; после каждой записанной порции отдает (выгружено строк, готовые файлы).
+    # Если генератор закрыт раньше времени (отмена), недописанный файл удаляется
+    if file_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат {file_format}")
+    os.makedirs(output_dir, exist_ok=True)
+    files, total, current = [], 0, None
+    try:
+        for month, batch in record_batches(session, date_from, date_to):
+            if file_format == "parquet":
+                # Строки месяцев идут подряд: открыт всегда только файл текущего месяца
+                path = os.path.join(output_dir, month_directory(month), "part-0.parquet")
+                if current is not None and current.path != path:
+                    current.close()
+                    files.append(current.path)
+                    current = None
+                if current is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    current = OutputFile(path, lambda temporary: pq.ParquetWriter(temporary, SCHEMA, compression="zstd"), ROW_GROUP_ROWS)
+            else:
+                if current is not None and current.rows >= CSV_FILE_ROWS:
+                    current.close()
+                    files.append(current.path)
+                    current = None
+                if current is None:
+                    path = os.path.join(output_dir, f"sales_{len(files) + 1:05d}.csv")
+                    current = OutputFile(path, lambda temporary: pa_csv.CSVWriter(temporary, SCHEMA))
+            current.write(batch)
+            total += batch.num_rows
+            yield total, list(files)
+        if current is not None:
+            current.close()
+            files.append(current.path)
+            current = None
+        yield total, files
+    finally:
+        if current is not None:
+            current.discard()
+
+
+def export_sales(output_dir, file_format="parquet", date_from=None, date_to=None, progress=None):
+    # Выгрузка целиком; progress(выгружено строк) вызывается после каждой порции. Возвращает (строк, файлы)
+    total, files = 0, []
+    with Connect.session_scope() as session:
+        for total, files in iter_export(session, output_dir, file_format, date_from, date_to):
+            if progress:
+                progress(total)
+    return total, files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка истории реализации в Parquet или CSV")
+    parser.add_argument("output", help="Папка выгрузки")
+    parser.add_argument("--format", choices=FORMATS, default="parquet", help="parquet - секции по месяцам, csv - файлы по CSV_FILE_ROWS строк")
+    parser.add_argument("--date-from", type=datetime.date.fromisoformat, help="Первый день периода (ГГГГ-ММ-ДД)")
+    parser.add_argument("--date-to", type=datetime.date.fromisoformat, help="День после окончания периода (ГГГГ-ММ-ДД)")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    total, files = export_sales(args.output, args.format, args.date_from, args.date_to,
+                                progress=lambda rows: print(f"\rВыгружено строк: {rows}", end="", flush=True))
+    seconds = time.perf_counter() - started
+    print(f"\nФайлов: {len(files)}, строк: {total}, {seconds:.1f} с, {total / seconds if seconds else 0:.0f} строк/с")
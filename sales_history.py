@@ -0,0 +1,228 @@
+# История реализации за период: секционирование по месяцам, индекс по дате продажи и запросы за период.
+# В PostgreSQL таблица история_реализации секционирована по диапазонам даты продажи: одна секция на месяц
+# и секция по умолчанию для дат, для которых секция еще не создана. Запрос за период с условием
+# на дату продажи читает только секции этого периода. Во всех СУБД по дате продажи построен индекс.
+# Период задается полуоткрытым интервалом: дата начала входит в период, дата окончания - нет.
+# Секции текущего и MONTHS_AHEAD следующих месяцев создаются при каждом запуске приложения (Connect.ensure_schema),
+# поэтому новые продажи не попадают в секцию по умолчанию.
+#
+# Обслуживание:
+#   python sales_history.py partition               - перевести существующую таблицу на секции (PostgreSQL)
+#   python sales_history.py create 2024-01 2025-12  - создать секции месяцев
+#   python sales_history.py index                   - создать индекс по дате продажи (любая СУБД)
+import argparse
+import datetime
+from sqlalchemy import event, inspect, select, func, text
+from datebase import Connect, history_implementation
+from sales_totals import rebuild_totals
+from sales_analytics import rebuild_monthly_totals
+
+HISTORY = history_implementation.name
+DEFAULT_PARTITION = HISTORY + "_прочие"  # Секция по умолчанию
+OLD_TABLE = HISTORY + "_старая"  # Временное имя таблицы при переводе на секции (имена в PostgreSQL - до 63 байт)
+MONTHS_AHEAD = 3  # Количество месяцев вперед, для которых секции создаются заранее
+
+
+def month_range(year, month):
+    # Первый день месяца и первый день следующего месяца
+    start = datetime.date(year, month, 1)
+    end = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def months(date_from, date_to):
+    # Месяцы (год, месяц), пересекающиеся с периодом [date_from, date_to)
+    year, month = date_from.year, date_from.month
+    while datetime.date(year, month, 1) < date_to:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def period_conditions(date_from=None, date_to=None):
+    # Условия на дату продажи; колонка сравнивается без функций, чтобы работали индекс и отбор секций
+    conditions = []
+    if date_from is not None:
+        conditions.append(history_implementation.c.дата_продажи >= date_from)
+    if date_to is not None:
+        conditions.append(history_implementation.c.дата_продажи < date_to)
+    return conditions
+
+
+def sales_in_period(date_from=None, date_to=None, partner_ids=None):
+    # Запрос строк истории реализации за период, при необходимости - только для указанных партнеров
+    query = select(history_implementation).where(*period_conditions(date_from, date_to))
+    if partner_ids is not None:
+        query = query.where(history_implementation.c.id_партнер.in_(partner_ids))
+    return query
+
+
+def period_totals(session, date_from=None, date_to=None, partner_ids=None):
+    # Суммарное количество продаж каждого партнера за период (например, для пересчета скидок за месяц)
+    query = select(
+        history_implementation.c.id_партнер, func.sum(history_implementation.c.количество)
+    ).where(*period_conditions(date_from, date_to)).group_by(history_implementation.c.id_партнер)
+    if partner_ids is not None:
+        query = query.where(history_implementation.c.id_партнер.in_(partner_ids))
+    return {partner_id: total or 0 for partner_id, total in session.execute(query)}
+
+
+def quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def is_partitioned(connection):
+    # Секционирована ли таблица истории реализации
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": quote(connection, HISTORY)}
+    ).scalar()
+
+
+def table_exists(connection, name):
+    return connection.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": quote(connection, name)}).scalar()
+
+
+def partition_name(year, month):
+    return f"{HISTORY}_{year}_{month:02d}"
+
+
+def create_partition(connection, year, month):
+    # Секция одного месяца. Строки этого месяца, уже попавшие в секцию по умолчанию, переносятся в новую секцию
+    # до ее подключения (иначе PostgreSQL не позволит создать секцию). Возвращает False, если секция уже есть
+    name = partition_name(year, month)
+    if table_exists(connection, name):
+        return False
+    start, end = month_range(year, month)
+    connection.execute(text(f"CREATE TABLE {quote(connection, name)} (LIKE {quote(connection, HISTORY)} INCLUDING DEFAULTS)"))
+    if table_exists(connection, DEFAULT_PARTITION):
+        # Перенос выполняется напрямую между секциями, поэтому триггеры итогов продаж не срабатывают
+        connection.execute(text(
+            f"WITH перенос AS (DELETE FROM {quote(connection, DEFAULT_PARTITION)} "
+            f"WHERE дата_продажи >= :start AND дата_продажи < :end RETURNING *) "
+            f"INSERT INTO {quote(connection, name)} SELECT * FROM перенос"
+        ), {"start": start, "end": end})
+    connection.execute(text(
+        f"ALTER TABLE {quote(connection, HISTORY)} ATTACH PARTITION {quote(connection, name)} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    return True
+
+
+def create_partitions(connection, date_from, date_to):
+    # Секции всех месяцев периода [date_from, date_to); возвращает имена созданных секций
+    if not is_partitioned(connection):
+        raise RuntimeError(f"Таблица {HISTORY} не секционирована; выполните: python sales_history.py partition")
+    return [partition_name(year, month) for year, month in months(date_from, date_to) if create_partition(connection, year, month)]
+
+
+def upcoming_period():
+    # Текущий месяц и MONTHS_AHEAD следующих: [первый день текущего месяца, первый день после последнего)
+    start = datetime.date.today().replace(day=1)
+    end = start
+    for _ in range(MONTHS_AHEAD + 1):
+        end = month_range(end.year, end.month)[1]
+    return start, end
+
+
+def create_upcoming_partitions(connection):
+    # Секции текущего месяца и нескольких следующих
+    return create_partitions(connection, *upcoming_period())
+
+
+def ensure_upcoming_partitions(engine):
+    # Вызывается при запуске приложения: обычно один запрос проверки последней секции; недостающие секции
+    # создаются под рекомендательной блокировкой, чтобы одновременно запущенные клиенты не создавали их дважды
+    if engine.dialect.name != "postgresql":
+        return []
+    last = upcoming_period()[1] - datetime.timedelta(days=1)
+    with engine.connect() as connection:
+        if table_exists(connection, partition_name(last.year, last.month)) or not is_partitioned(connection):
+            return []
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": DEFAULT_PARTITION})
+        return create_upcoming_partitions(connection)
+
+
+@event.listens_for(history_implementation, "after_create")
+def on_history_created(target, connection, **kw):
+    # Новая секционированная таблица сразу получает секцию по умолчанию и секции ближайших месяцев
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {quote(connection, DEFAULT_PARTITION)} PARTITION OF {quote(connection, HISTORY)} DEFAULT"))
+        create_upcoming_partitions(connection)
+
+
+def create_date_index(engine):
+    # Индекс по дате продажи для базы данных, созданной без него
+    for index in history_implementation.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def partition_existing(engine):
+    # Перевод существующей несекционированной таблицы на секции по месяцам (PostgreSQL)
+    with engine.begin() as connection:
+        if connection.dialect.name != "postgresql":
+            raise RuntimeError("Секционирование поддерживается только для PostgreSQL")
+        if is_partitioned(connection):
+            print(f"Таблица {HISTORY} уже секционирована")
+            return
+        if not inspect(connection).has_table(HISTORY):
+            history_implementation.create(connection)
+            return
+
+        empty_dates = connection.execute(text(f"SELECT COUNT(*) FROM {quote(connection, HISTORY)} WHERE дата_продажи IS NULL")).scalar()
+        if empty_dates:
+            raise RuntimeError(f"В {HISTORY} есть строки без даты продажи ({empty_dates}); дата продажи входит в ключ секционированной таблицы")
+
+        # Старая таблица переименовывается вместе с именами ее индексов, чтобы новая таблица получила стандартные имена
+        primary_key = inspect(connection).get_pk_constraint(HISTORY)["name"]
+        connection.execute(text(f"ALTER TABLE {quote(connection, HISTORY)} RENAME TO {quote(connection, OLD_TABLE)}"))
+        if primary_key:
+            connection.execute(text(f"ALTER TABLE {quote(connection, OLD_TABLE)} RENAME CONSTRAINT {quote(connection, primary_key)} TO {quote(connection, OLD_TABLE + '_pkey')}"))
+        for index in history_implementation.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {quote(connection, index.name)}"))
+
+        history_implementation.create(connection)  # Секционированная таблица, ее триггеры и секции ближайших месяцев
+        first, last = connection.execute(text(f"SELECT MIN(дата_продажи), MAX(дата_продажи) FROM {quote(connection, OLD_TABLE)}")).one()
+        if first is not None:
+            created = create_partitions(connection, first, last + datetime.timedelta(days=1))
+            print(f"Создано секций: {len(created)}")
+
+        columns = ", ".join(quote(connection, column.name) for column in history_implementation.columns)
+        moved = connection.execute(text(
+            f"INSERT INTO {quote(connection, HISTORY)} ({columns}) SELECT {columns} FROM {quote(connection, OLD_TABLE)}"
+        )).rowcount
+        connection.execute(text(f"DROP TABLE {quote(connection, OLD_TABLE)}"))
+        # Триггеры новой таблицы уже добавили перенесенные строки к итогам, поэтому итоги пересчитываются заново
+        rebuild_totals(connection)
+        rebuild_monthly_totals(connection)
+        print(f"Перенесено строк: {moved}")
+
+
+def parse_month(value):
+    # Месяц в формате ГГГГ-ММ
+    year, month = value.split("-")
+    return int(year), int(month)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Секционирование и индексы истории реализации")
+    parser.add_argument("command", choices=["partition", "create", "index"], help="partition - перевести таблицу на секции, create - создать секции месяцев, index - создать индекс по дате продажи")
+    parser.add_argument("months", nargs="*", help="для create: первый и последний месяц в формате ГГГГ-ММ")
+    args = parser.parse_args()
+
+    Connect.configure(create_schema=False)  # Схема изменяется только этой командой
+    engine = Connect.get_engine()
+    if args.command == "partition":
+        partition_existing(engine)
+    elif args.command == "index":
+        create_date_index(engine)
+        print("Индекс по дате продажи создан")
+    else:
+        if len(args.months) != 2:
+            parser.error("укажите первый и последний месяц: 2024-01 2025-12")
+        first, last = parse_month(args.months[0]), parse_month(args.months[1])
+        with engine.begin() as connection:
+            created = create_partitions(connection, month_range(*first)[0], month_range(*last)[1])
+        print(f"Создано секций: {len(created)}")
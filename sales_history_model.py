@@ -0,0 +1,213 @@
+import datetime
+import threading
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from sqlalchemy import select
+from datebase import history_implementation, Products, Partner  # Модели для работы с базой данных
+from workers import create_task_group  # Фоновое выполнение запросов
+from sales_history import period_conditions  # Условия выборки за период
+import query_stats  # Действия интерфейса для статистики запросов
+
+BLOCK_SIZE = 500  # Количество строк, загружаемых за один раз при прокрутке
+
+
+def contains_pattern(value):
+    # Шаблон LIKE "содержит" для текста пользователя: %, _ и \ ищутся как обычные символы (ESCAPE '\')
+    return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+# Курсор одного запроса модели (поколение): своя сессия и открытый потоковый результат.
+# Блоки читаются в фоновом потоке строго по очереди (следующий запрашивается после получения предыдущего).
+# При смене фильтров или сортировки поколение заменяется новым без ожидания: курсор и сессию старого
+# освобождает тот, кто заканчивает последним, - его выполняющееся чтение или фоновая задача освобождения.
+class HistoryCursor:
+    def __init__(self, session, query):
+        self.session = session  # Сессия поколения
+        self.query = query  # Запрос с фильтрами и сортировкой на момент создания
+        self.result = None  # Открытый потоковый результат запроса
+        self.reading = False  # Выполняется чтение блока
+        self.retired = False  # Поколение заменено новым запросом
+        self.lock = threading.Lock()
+
+    def fetch_block(self, session, block_size):
+        # Выполняется в фоновом потоке: при первом обращении открывает курсор, затем читает следующий блок
+        try:
+            if self.result is None:
+                # Серверный курсор: строки передаются клиенту блоками, а не все сразу
+                self.result = session.execute(self.query, execution_options={"stream_results": True, "yield_per": block_size})
+            block = self.result.fetchmany(block_size)
+            if len(block) < block_size:
+                self.close_result()  # Курсор исчерпан
+        except Exception:
+            self.result = None
+            session.rollback()  # Прерванная транзакция не должна мешать следующим запросам сессии
+            raise
+        finally:
+            with self.lock:
+                self.reading = False
+                retired = self.retired
+            if retired:
+                self.release(session)  # Поколение заменили во время чтения
+        yield block
+
+    def retire(self):
+        # Вызывается из потока интерфейса; True - чтение не выполняется и освободить курсор должен вызывающий код
+        with self.lock:
+            self.retired = True
+            return not self.reading
+
+    def release_job(self, session):
+        # Фоновая задача освобождения курсора и соединения
+        self.release(session)
+        yield from ()
+
+    def release(self, session):
+        self.close_result()
+        session.close()
+
+    def close_result(self):
+        # Освобождаем серверный курсор
+        if self.result is not None:
+            self.result.close()
+            self.result = None
+
+
+# Модель таблицы истории реализации, которая читает строки из серверного курсора блоками по мере прокрутки.
+# Поток интерфейса никогда не ждет чтения: блоки старого запроса после смены фильтров отбрасываются.
+class SalesHistoryModel(QAbstractTableModel):
+    HEADERS = ["Партнер", "Продукция", "Количество", "Дата продажи"]  # Заголовки колонок
+
+    def __init__(self, block_size=BLOCK_SIZE, parent=None):
+        super().__init__(parent)
+        self.tasks = create_task_group(self)  # Фоновые задачи чтения блоков
+        self.block_size = block_size  # Размер блока
+        self.rows = []  # Уже загруженные строки
+        self.cursor = None  # Курсор текущего запроса (создается при первом чтении)
+        self.exhausted = False  # Все строки прочитаны
+        self.loading = False  # Читается ли сейчас блок
+        self.sort_column = None  # Колонка сортировки
+        self.sort_order = Qt.AscendingOrder  # Направление сортировки
+        self.filters = {}  # Фильтры: партнер, продукция, период
+
+    # Колонки запроса, соответствующие колонкам таблицы (используются для сортировки в SQL)
+    def sort_columns(self):
+        return [
+            Partner.наименование,
+            Products.наименование,
+            history_implementation.c.количество,
+            history_implementation.c.дата_продажи,
+        ]
+
+    def build_query(self):
+        # Запрос с соединением трех таблиц; фильтры и сортировка выполняются базой данных
+        query = select(
+            Partner.наименование.label('partner_name'),  # Название партнера
+            Products.наименование.label('product_name'),  # Название продукции
+            history_implementation.c.количество,  # Количество продукции
+            history_implementation.c.дата_продажи  # Дата продажи
+        ).select_from(history_implementation).join(Partner, history_implementation.c.id_партнер == Partner.id).join(Products, history_implementation.c.id_продукция == Products.id)
+
+        if self.filters.get("partner"):
+            query = query.where(Partner.наименование.ilike(contains_pattern(self.filters["partner"]), escape="\\"))
+        if self.filters.get("product"):
+            query = query.where(Products.наименование.ilike(contains_pattern(self.filters["product"]), escape="\\"))
+        # Период включает последний выбранный день; при секционировании читаются только секции периода
+        date_to = self.filters.get("date_to")
+        query = query.where(*period_conditions(self.filters.get("date_from"), date_to + datetime.timedelta(days=1) if date_to else None))
+
+        if self.sort_column is not None:
+            column = self.sort_columns()[self.sort_column]
+            query = query.order_by(column.desc() if self.sort_order == Qt.DescendingOrder else column.asc())
+
+        return query
+
+    def stop(self):
+        # Отменяем чтение текущего запроса без ожидания; курсор освобождается в фоновом потоке
+        cursor, self.cursor = self.cursor, None
+        self.loading = False
+        self.tasks.cancel_all()
+        if cursor is not None and cursor.retire():
+            self.tasks.start(cursor.release_job, session=cursor.session)
+
+    def close(self):
+        # Освобождаем курсор и соединение (при закрытии окна)
+        self.stop()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        record = self.rows[index.row()]
+        column = index.column()
+        if column == 0:
+            return record.partner_name or "Неизвестно"  # Если имя партнера отсутствует, выводим "Неизвестно"
+        if column == 1:
+            return record.product_name or "Неизвестно"  # Если имя продукции отсутствует, выводим "Неизвестно"
+        if column == 2:
+            return str(record.количество)
+        return str(record.дата_продажи)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted or self.loading:
+            return
+        # Следующий блок из курсора читается в фоновом потоке
+        if self.cursor is None:
+            self.cursor = HistoryCursor(self.tasks.create_session(), self.build_query())
+        cursor = self.cursor
+        cursor.reading = True
+        self.loading = True
+        with query_stats.action("Прокрутка реализации продукции"):
+            self.tasks.start(
+                cursor.fetch_block, self.block_size, session=cursor.session,
+                on_chunk=lambda block: self.append_block(block, cursor), on_failed=lambda message: self.on_fetch_failed(message, cursor)
+            )
+
+    def append_block(self, block, cursor):
+        # Строки появляются в таблице по мере чтения блоков; блоки замененного запроса отбрасываются
+        if cursor is not self.cursor:
+            return
+        self.loading = False
+        self.exhausted = len(block) < self.block_size
+        if not block:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(block) - 1)
+        self.rows.extend(block)
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # Сортировка выполняется в SQL: запрос открывается заново с нужным ORDER BY
+        self.sort_column = column if column >= 0 else None
+        self.sort_order = order
+        self.reload()
+
+    def set_filters(self, partner=None, product=None, date_from=None, date_to=None):
+        # Фильтрация выполняется в SQL
+        self.filters = {"partner": partner, "product": product, "date_from": date_from, "date_to": date_to}
+        self.reload()
+
+    def on_fetch_failed(self, message, cursor):
+        # При ошибке прекращаем чтение, чтобы не повторять неудачный запрос при каждой прокрутке
+        # (сессия уже откачена в фоновом потоке; новый запрос откроется после смены фильтров или сортировки)
+        if cursor is self.cursor:
+            self.loading = False
+            self.exhausted = True
+
+    def reload(self):
+        # Новый курсор с текущими фильтрами и сортировкой откроется при следующем fetchMore
+        self.stop()
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
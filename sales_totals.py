@@ -0,0 +1,172 @@
+# Итоговые продажи партнеров: таблица "итоги_продаж_партнера" и кэш в памяти процесса.
+# Таблица обновляется триггерами при любой вставке, изменении или удалении строк истории реализации,
+# поэтому скидка партнера определяется чтением одной строки, независимо от объема истории.
+# Триггеры устанавливаются автоматически при создании таблиц; для существующей базы данных
+# и для восстановления используется команда: python sales_totals.py install | rebuild
+import argparse
+import threading
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+from datebase import Connect, Partner_sales_totals, history_implementation
+
+TOTALS = Partner_sales_totals.__tablename__
+HISTORY = history_implementation.name
+
+# PostgreSQL: триггеры уровня оператора с таблицами переходов - одна агрегирующая команда на весь пакет строк
+POSTGRESQL_TRIGGERS = [
+    f"""
+    CREATE OR REPLACE FUNCTION обновить_итоги_продаж() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE {TOTALS} AS итоги SET количество = итоги.количество - изменение.количество
+            FROM (SELECT id_партнер, SUM(COALESCE(количество, 0)) AS количество FROM старые_строки GROUP BY id_партнер) AS изменение
+            WHERE итоги.id_партнер = изменение.id_партнер;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {TOTALS} (id_партнер, количество)
+            SELECT id_партнер, SUM(COALESCE(количество, 0)) FROM новые_строки GROUP BY id_партнер
+            ON CONFLICT (id_партнер) DO UPDATE SET количество = {TOTALS}.количество + EXCLUDED.количество;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    f"DROP TRIGGER IF EXISTS итоги_продаж_вставка ON {HISTORY}",
+    f"DROP TRIGGER IF EXISTS итоги_продаж_изменение ON {HISTORY}",
+    f"DROP TRIGGER IF EXISTS итоги_продаж_удаление ON {HISTORY}",
+    f"""CREATE TRIGGER итоги_продаж_вставка AFTER INSERT ON {HISTORY}
+    REFERENCING NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_продаж()""",
+    f"""CREATE TRIGGER итоги_продаж_изменение AFTER UPDATE ON {HISTORY}
+    REFERENCING OLD TABLE AS старые_строки NEW TABLE AS новые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_продаж()""",
+    f"""CREATE TRIGGER итоги_продаж_удаление AFTER DELETE ON {HISTORY}
+    REFERENCING OLD TABLE AS старые_строки FOR EACH STATEMENT EXECUTE FUNCTION обновить_итоги_продаж()""",
+]
+
+# SQLite: триггеры уровня строки
+SQLITE_ADD = f"""
+    INSERT INTO {TOTALS} (id_партнер, количество) VALUES (NEW.id_партнер, COALESCE(NEW.количество, 0))
+    ON CONFLICT (id_партнер) DO UPDATE SET количество = количество + excluded.количество;"""
+SQLITE_SUBTRACT = f"""
+    UPDATE {TOTALS} SET количество = количество - COALESCE(OLD.количество, 0) WHERE id_партнер = OLD.id_партнер;"""
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS итоги_продаж_вставка",
+    "DROP TRIGGER IF EXISTS итоги_продаж_изменение",
+    "DROP TRIGGER IF EXISTS итоги_продаж_удаление",
+    f"CREATE TRIGGER итоги_продаж_вставка AFTER INSERT ON {HISTORY} BEGIN {SQLITE_ADD} END",
+    f"CREATE TRIGGER итоги_продаж_изменение AFTER UPDATE ON {HISTORY} BEGIN {SQLITE_SUBTRACT} {SQLITE_ADD} END",
+    f"CREATE TRIGGER итоги_продаж_удаление AFTER DELETE ON {HISTORY} BEGIN {SQLITE_SUBTRACT} END",
+]
+
+
+def install_triggers(connection):
+    # Установка (или переустановка) триггеров, поддерживающих итоги продаж
+    statements = POSTGRESQL_TRIGGERS if connection.dialect.name == "postgresql" else SQLITE_TRIGGERS
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_totals(connection):
+    # Полный пересчет итогов по истории реализации (для восстановления после сбоя или ручной правки)
+    connection.execute(text(f"DELETE FROM {TOTALS}"))
+    connection.execute(text(
+        f"INSERT INTO {TOTALS} (id_партнер, количество) "
+        f"SELECT id_партнер, SUM(COALESCE(количество, 0)) FROM {HISTORY} GROUP BY id_партнер"
+    ))
+    totals_cache.invalidate()
+
+
+@event.listens_for(history_implementation, "after_create")
+def on_history_created(target, connection, **kw):
+    # Новая таблица истории реализации сразу получает триггеры
+    install_triggers(connection)
+
+
+@event.listens_for(Partner_sales_totals.__table__, "after_create")
+def on_totals_created(target, connection, **kw):
+    # Таблица итогов добавлена в существующую базу данных: ставим триггеры и заполняем итоги по истории
+    if inspect(connection).has_table(HISTORY):
+        install_triggers(connection)
+        rebuild_totals(connection)
+
+
+# Кэш итогов продаж в памяти процесса; строки читаются из таблицы итогов по первичному ключу
+class SalesTotalsCache:
+    def __init__(self):
+        self.totals = {}  # id партнера -> количество
+        self.complete = False  # Загружены ли итоги всех партнеров
+        self.generation = 0  # Увеличивается при каждом сбросе кэша
+        # Кэш используется из фоновых потоков. Блокировка не удерживается во время запроса, поэтому кэш можно
+        # использовать и из асинхронных задач, выполняющихся по очереди в одном потоке (async_db.py)
+        self.lock = threading.Lock()
+
+    def get_many(self, session, partner_ids=None):
+        # Итоги для списка партнеров (без списка - для всех партнеров с продажами)
+        with self.lock:
+            generation = self.generation
+            if partner_ids is None:
+                if self.complete:
+                    return {partner_id: total for partner_id, total in self.totals.items() if total}
+            else:
+                cached = {partner_id: self.totals[partner_id] for partner_id in partner_ids if partner_id in self.totals}
+                missing = [partner_id for partner_id in partner_ids if partner_id not in cached]
+                if not missing or self.complete:
+                    return {partner_id: cached.get(partner_id, 0) for partner_id in partner_ids}
+        query = select(Partner_sales_totals.id_партнер, Partner_sales_totals.количество)
+        if partner_ids is not None:
+            query = query.where(Partner_sales_totals.id_партнер.in_(missing))
+        loaded = dict(session.execute(query).all())
+        with self.lock:
+            # Результат запоминается, только если кэш не сбросили, пока выполнялся запрос
+            if generation == self.generation:
+                if partner_ids is None:
+                    self.totals = dict(loaded)
+                    self.complete = True
+                else:
+                    for partner_id in missing:
+                        self.totals[partner_id] = loaded.get(partner_id, 0)
+        if partner_ids is None:
+            return {partner_id: total for partner_id, total in loaded.items() if total}
+        return {partner_id: cached[partner_id] if partner_id in cached else loaded.get(partner_id, 0) for partner_id in partner_ids}
+
+    def invalidate(self):
+        # Сброс кэша после изменения истории реализации
+        with self.lock:
+            self.totals = {}
+            self.complete = False
+            self.generation += 1
+
+
+totals_cache = SalesTotalsCache()  # Общий кэш процесса
+
+
+@event.listens_for(Engine, "after_execute")
+def on_after_execute(connection, clauseelement, multiparams, params, execution_options, result):
+    # Любая вставка, изменение или удаление строк истории через SQLAlchemy сбрасывает кэш сразу и еще раз
+    # при фиксации транзакции, чтобы не остались итоги, загруженные другим потоком до фиксации (см. reference_data.py)
+    if isinstance(clauseelement, UpdateBase) and clauseelement.table is history_implementation:
+        totals_cache.invalidate()
+        connection.info["history_changed"] = True
+
+
+@event.listens_for(Engine, "commit")
+def on_commit(connection):
+    if connection.info.pop("history_changed", False):
+        totals_cache.invalidate()
+
+
+@event.listens_for(Engine, "rollback")
+def on_rollback(connection):
+    if connection.info.pop("history_changed", False):
+        totals_cache.invalidate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы итогов продаж партнеров")
+    parser.add_argument("command", choices=["install", "rebuild"], help="install - установить триггеры и пересчитать итоги, rebuild - только пересчитать итоги")
+    args = parser.parse_args()
+    with Connect.get_engine().begin() as connection:
+        if args.command == "install":
+            install_triggers(connection)
+        rebuild_totals(connection)
+    print("Итоги продаж пересчитаны")
@@ -0,0 +1,293 @@
+# Пакетная служба без графического интерфейса: скидки партнеров и отчеты для ночных заданий и других сервисов.
+# Используются те же модели, кэш итогов продаж и функции отчетов, что и в окнах приложения, но без QApplication:
+# модуль не импортирует PySide6 и работает на сервере без дисплея. Результат возвращается в JSON.
+#
+# Командная строка:
+#   python service.py discounts 1 2 3            - скидки партнеров (без id - всех партнеров)
+#   python service.py discounts --file ids.txt   - id из файла по одному в строке ("-" - стандартный ввод)
+#   python service.py report partners|sales|material [--output reports]
+#   python service.py serve [--host 127.0.0.1] [--port 8765] [--output reports] [--pool-size 10]
+#
+# HTTP API (запросы и ответы - JSON):
+#   GET  /health
+#   GET  /discounts?ids=1,2,3                 - без ids - все партнеры
+#   POST /discounts      {"partner_ids": [1, 2, 3]}
+#        -> {"discounts": [{"partner_id", "total_sales", "discount"}, ...], "not_found": [id несуществующих партнеров]}
+#   POST /reports/<имя>  - partners, sales или material; файлы создаются в папке --output сервера
+# Каждое соединение обслуживается своим потоком, сессии берутся из общего пула соединений Connect.
+# Запросы скидок, пришедшие, пока выполняется предыдущий запрос к итогам продаж, объединяются (DiscountBatcher):
+# партнеры всех ожидающих запросов считаются одним запросом. Одновременные запросы одного отчета
+# получают результат одного построения (SingleFlight).
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from sqlalchemy import select
+from datebase import Connect, Partner
+from discount import get_partners_total_sales, calculate_discount
+
+MAX_BATCH_IDS = 10000  # Партнеров в одном запросе к итогам продаж (ограничение числа параметров запроса)
+REPORTS = {  # Отчет -> (имя функции модуля reports, имя файла)
+    "partners": ("partners_report", "partners_report.pdf"),
+    "sales": ("sales_report", "sales_report.pdf"),
+    "material": ("material_report", "material_calculation_report.pdf"),
+}
+
+
+class RequestError(ValueError):
+    # Ошибка в запросе клиента (HTTP 400 или 404)
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_ids(values):
+    # id партнеров из списка чисел или строк
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise RequestError("id партнеров должны быть целыми числами") from None
+
+
+def discount_result(partner_ids, totals, existing):
+    # Ответ в порядке запроса; партнеры, которых нет в базе данных, перечисляются отдельно
+    rows = [{"partner_id": partner_id, "total_sales": totals.get(partner_id, 0), "discount": calculate_discount(totals.get(partner_id, 0))}
+            for partner_id in partner_ids if partner_id in existing]
+    return {"discounts": rows, "not_found": [partner_id for partner_id in partner_ids if partner_id not in existing]}
+
+
+def load_totals(session, partner_ids):
+    # Итоги продаж и существующие партнеры запросами по MAX_BATCH_IDS партнеров
+    partner_ids = list(partner_ids)
+    totals, existing = {}, set()
+    for start in range(0, len(partner_ids), MAX_BATCH_IDS):
+        chunk = partner_ids[start:start + MAX_BATCH_IDS]
+        existing.update(session.execute(select(Partner.id).where(Partner.id.in_(chunk))).scalars())
+        totals.update(get_partners_total_sales(session, chunk))
+    return totals, existing
+
+
+def all_partner_ids(session):
+    return list(session.execute(select(Partner.id).order_by(Partner.id)).scalars())
+
+
+# Объединение одновременных запросов скидок: один поток выполняет запросы к итогам продаж по очереди,
+# и все запросы, накопившиеся за время предыдущего, обслуживаются следующим одним запросом.
+# Одиночный запрос не ждет: он выполняется сразу
+class DiscountBatcher:
+    def __init__(self, max_ids=MAX_BATCH_IDS):
+        self.max_ids = max_ids
+        self.queue = queue.Queue()  # (id партнеров, Future)
+        self.thread = threading.Thread(target=self.run, name="discount-batcher", daemon=True)
+        self.thread.start()
+
+    def discounts(self, partner_ids):
+        # Скидки списка партнеров (вызывается из потоков запросов)
+        future = Future()
+        self.queue.put((partner_ids, future))
+        return future.result()
+
+    def close(self):
+        self.queue.put(None)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch, ids = [item], set(item[0])
+            while len(ids) < self.max_ids:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)  # Остановка после обработки накопленных запросов
+                    break
+                batch.append(item)
+                ids.update(item[0])
+            try:
+                with Connect.session_scope() as session:
+                    totals, existing = load_totals(session, ids)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for partner_ids, future in batch:
+                future.set_result(discount_result(partner_ids, totals, existing))
+
+
+# Одновременные вызовы с одним ключом выполняются один раз и получают общий результат
+class SingleFlight:
+    def __init__(self):
+        self.running = {}  # Ключ -> Future выполняющегося вызова
+        self.lock = threading.Lock()
+
+    def run(self, key, function):
+        with self.lock:
+            future = self.running.get(key)
+            owner = future is None
+            if owner:
+                future = self.running[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(function())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.running[key]
+        return future.result()
+
+
+def discounts(partner_ids=None, batcher=None):
+    # Скидки партнеров (без списка - всех партнеров) в порядке id
+    if partner_ids is None:
+        with Connect.session_scope() as session:
+            partner_ids = all_partner_ids(session)
+            return discount_result(partner_ids, get_partners_total_sales(session), set(partner_ids))  # Итоги всех партнеров одним запросом
+    if batcher is not None:
+        return batcher.discounts(partner_ids)
+    with Connect.session_scope() as session:
+        return discount_result(partner_ids, *load_totals(session, partner_ids))
+
+
+def generate_report(name, output_dir):
+    # PDF-отчет в папку output_dir; возвращает созданные файлы (большой отчет делится на тома)
+    if name not in REPORTS:
+        raise RequestError(f"Неизвестный отчет {name}; доступны: {', '.join(REPORTS)}", 404)
+    import reports  # Генерация PDF-отчетов (reportlab загружается при первом отчете)
+    function, file_name = REPORTS[name]
+    os.makedirs(output_dir, exist_ok=True)
+    return getattr(reports, function)(os.path.join(output_dir, file_name))
+
+
+# Обработчик HTTP API; общее состояние (папка отчетов, объединение запросов) хранится в сервере
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Соединение сохраняется между запросами клиента
+    disable_nagle_algorithm = True  # Без задержки ответа на сохраненном соединении (алгоритм Нейгла и отложенный ACK)
+    server_version = "PraktikaService"
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        try:
+            body = self.read_body() if method == "POST" else {}
+            status, result = 200, self.route(method, url.path.rstrip("/"), parse_qs(url.query), body)
+        except RequestError as e:
+            status, result = e.status, {"error": str(e)}
+        except Exception as e:
+            status, result = 500, {"error": str(e)}
+        self.send_json(status, result)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise RequestError("Тело запроса должно быть JSON") from None
+        if not isinstance(body, dict):
+            raise RequestError("Тело запроса должно быть объектом JSON")
+        return body
+
+    def route(self, method, path, query, body):
+        if path == "/health" and method == "GET":
+            return {"status": "ok"}
+        if path == "/discounts":
+            if method == "GET":
+                ids = ",".join(query.get("ids", []))
+                partner_ids = parse_ids(value for value in ids.split(",") if value.strip()) if ids else None
+            else:
+                if not isinstance(body.get("partner_ids"), list):
+                    raise RequestError("Нужен список partner_ids")
+                partner_ids = parse_ids(body["partner_ids"])
+            return discounts(partner_ids, self.server.batcher)
+        if path.startswith("/reports/") and method == "POST":
+            name = path[len("/reports/"):]
+            files = self.server.reports.run(name, lambda: generate_report(name, self.server.output_dir))
+            return {"report": name, "files": [os.path.abspath(file) for file in files]}
+        raise RequestError(f"Нет метода {method} {path}", 404)
+
+    def send_json(self, status, result):
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, output_dir="reports"):
+        super().__init__(address, ServiceHandler)
+        self.output_dir = output_dir  # Папка отчетов
+        self.batcher = DiscountBatcher()
+        self.reports = SingleFlight()
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def read_ids(path):
+    # id партнеров из файла по одному в строке ("-" - стандартный ввод)
+    file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return parse_ids(line.strip() for line in file if line.strip())
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def print_json(result):
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скидки партнеров и отчеты без графического интерфейса")
+    commands = parser.add_subparsers(dest="command", required=True)
+    discounts_parser = commands.add_parser("discounts", help="скидки партнеров")
+    discounts_parser.add_argument("ids", nargs="*", type=int, help="id партнеров (без id - все партнеры)")
+    discounts_parser.add_argument("--file", help="файл с id партнеров по одному в строке (- - стандартный ввод)")
+    report_parser = commands.add_parser("report", help="PDF-отчет")
+    report_parser.add_argument("name", choices=list(REPORTS), help="отчет")
+    report_parser.add_argument("--output", default="reports", help="папка для отчета")
+    serve_parser = commands.add_parser("serve", help="локальный HTTP API")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="адрес (по умолчанию только локальные подключения)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="порт")
+    serve_parser.add_argument("--output", default="reports", help="папка для отчетов")
+    serve_parser.add_argument("--pool-size", type=int, help="размер пула соединений с базой данных")
+    args = parser.parse_args()
+
+    if args.command == "discounts":
+        partner_ids = args.ids + (read_ids(args.file) if args.file else [])
+        print_json(discounts(partner_ids or None))
+    elif args.command == "report":
+        print_json({"report": args.name, "files": [os.path.abspath(file) for file in generate_report(args.name, args.output)]})
+    else:
+        if args.pool_size:
+            Connect.configure(pool_size=args.pool_size)
+        Connect.get_engine()  # Подключение и проверка схемы до приема запросов
+        server = ServiceServer((args.host, args.port), args.output)
+        print(f"HTTP API: http://{args.host}:{server.server_address[1]}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,56 @@
+# Отчет о времени запуска приложения: отметки этапов от начала выполнения main.py
+# до первой отрисовки главного окна и появления первой страницы партнеров.
+# Отчет выводится, если задан ключ --startup-report или переменная окружения PRAKTIKA_STARTUP_REPORT=1.
+import os
+import sys
+import time
+
+STARTED = time.perf_counter()  # Модуль импортируется первым в main.py
+ENABLED = "--startup-report" in sys.argv or os.environ.get("PRAKTIKA_STARTUP_REPORT") == "1"
+
+marks = []  # (этап, время от начала)
+
+
+def mark(stage):
+    # Отметка завершения этапа запуска
+    marks.append((stage, time.perf_counter() - STARTED))
+
+
+def report():
+    # Таблица этапов: время от начала запуска и длительность этапа, мс
+    lines = [f"{'этап':32} {'от начала':>10} {'этап':>10}"]
+    previous = 0.0
+    for stage, moment in marks:
+        lines.append(f"{stage:32} {moment * 1000:10.1f} {(moment - previous) * 1000:10.1f}")
+        previous = moment
+    return "\n".join(lines)
+
+
+def watch(window):
+    # Отслеживание первой отрисовки окна и первой загруженной страницы списка партнеров
+    from PySide6.QtCore import QObject, QEvent
+
+    class FirstPaintFilter(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint:
+                watched.removeEventFilter(self)
+                mark("первая отрисовка окна")
+                finish()
+            return False
+
+    pending = {"paint", "page"}
+
+    def finish(stage=None):
+        pending.discard(stage or "paint")
+        if not pending and ENABLED:
+            print(report(), file=sys.stderr)
+
+    def on_first_page(count):
+        # Страница считается и пустой: при пустой таблице партнеров строки не добавляются
+        window.partner_model.page_loaded.disconnect(on_first_page)
+        mark("первая страница партнеров")
+        finish("page")
+
+    window.startup_filter = FirstPaintFilter(window)  # Ссылка на фильтр хранится в окне
+    window.installEventFilter(window.startup_filter)
+    window.partner_model.page_loaded.connect(on_first_page)
@@ -0,0 +1,110 @@
+# Пакетная генерация ежемесячных PDF-выписок для партнеров.
+# Партнеры делятся на пачки, пачки обрабатываются параллельно в пуле процессов:
+# у каждого процесса свой движок базы данных и заранее зарегистрированный шрифт.
+# Процессы запускаются заново (spawn), а не копированием родительского: в приложении работают фоновые потоки
+# (пул задач Qt, синхронизация реплики, прослушивание уведомлений), и копия процесса могла бы зависнуть
+# на блокировке, захваченной одним из них в момент копирования.
+# Выписки создаются без даты создания внутри файла и в фиксированном порядке строк,
+# поэтому повторный запуск на тех же данных дает побайтно одинаковые файлы.
+#
+# Запуск: python statements.py 2024 6 [--output statements] [--workers 4] [--chunk-size 50]
+import argparse
+import multiprocessing
+import os
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datebase import Connect, Partner, Products, history_implementation
+from sales_totals import totals_cache
+from discount import calculate_discount
+from reports import TableReport, register_fonts
+from sales_history import month_range, period_conditions
+
+CHUNK_SIZE = 50  # Количество партнеров в одной задаче
+
+
+def statement_path(output_dir, partner_id):
+    return os.path.join(output_dir, f"partner_{partner_id}.pdf")
+
+
+def init_worker(connect_options):
+    # Выполняется один раз в каждом процессе пула: собственный движок и шрифт
+    # Локальную реплику синхронизирует родительский процесс; схему он уже проверил при подключении
+    Connect.configure(**dict(connect_options, replica_interval=0, create_schema=False))
+    register_fonts()
+
+
+def write_statements(partner_ids, year, month, output_dir):
+    # Выписки для пачки партнеров; продажи всей пачки читаются одним запросом
+    start, end = month_range(year, month)
+    files = []
+    with Connect.session_scope() as session:
+        names = dict(session.query(Partner.id, Partner.наименование).filter(Partner.id.in_(partner_ids)))
+        totals = totals_cache.get_many(session, partner_ids)
+        sales = {partner_id: [] for partner_id in partner_ids}
+        rows = session.query(
+            history_implementation.c.id_партнер, history_implementation.c.дата_продажи, Products.наименование, history_implementation.c.количество
+        ).join(Products, history_implementation.c.id_продукция == Products.id).filter(
+            history_implementation.c.id_партнер.in_(partner_ids), *period_conditions(start, end)
+        ).order_by(history_implementation.c.id_партнер, history_implementation.c.дата_продажи, Products.наименование)
+        for partner_id, sale_date, product_name, quantity in rows:
+            sales[partner_id].append((sale_date, product_name, quantity))
+
+    for partner_id in partner_ids:
+        month_total = sum(quantity or 0 for _, _, quantity in sales[partner_id])
+        lines = sales[partner_id] + [
+            ("", "Итого за месяц", month_total),
+            ("", "Всего продаж", totals.get(partner_id, 0)),
+            ("", "Текущая скидка", f"{calculate_discount(totals.get(partner_id, 0))}%"),
+        ]
+        title = f"Выписка: {names.get(partner_id, partner_id)} за {month:02d}.{year}"
+        path = statement_path(output_dir, partner_id)
+        TableReport(path, title, ["Дата продажи", "Продукция", "Количество"], [1, 4, 1], invariant=True).write(lines)
+        files.append(path)
+    return files
+
+
+def iter_statements(year, month, output_dir="statements", workers=None, chunk_size=CHUNK_SIZE):
+    # Генерация выписок всех партнеров; после каждой завершенной пачки отдает (готово, всего, файлы пачки).
+    # Если генератор закрыт раньше времени (отмена), еще не начатые пачки отменяются
+    os.makedirs(output_dir, exist_ok=True)
+    with Connect.session_scope() as session:
+        partner_ids = [partner_id for partner_id, in session.query(Partner.id).order_by(Partner.id)]
+    chunks = [partner_ids[i:i + chunk_size] for i in range(0, len(partner_ids), chunk_size)]
+
+    done = 0
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker, initargs=(Connect.settings(),)
+    )
+    try:
+        futures = {executor.submit(write_statements, chunk, year, month, output_dir): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            done += len(futures[future])
+            yield done, len(partner_ids), future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def generate_statements(year, month, output_dir="statements", workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    # Генерация выписок всех партнеров; progress(готово, всего) вызывается по мере завершения пачек
+    files = []
+    for done, total, chunk_files in iter_statements(year, month, output_dir, workers, chunk_size):
+        files.extend(chunk_files)
+        if progress:
+            progress(done, total)
+    return sorted(files)
+
+
+if __name__ == "__main__":
+    today = datetime.date.today()
+    parser = argparse.ArgumentParser(description="Генерация ежемесячных выписок для партнеров")
+    parser.add_argument("year", type=int, nargs="?", default=today.year, help="год")
+    parser.add_argument("month", type=int, nargs="?", default=today.month, help="месяц")
+    parser.add_argument("--output", default="statements", help="папка для выписок")
+    parser.add_argument("--workers", type=int, default=None, help="количество процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="количество партнеров в одной задаче")
+    args = parser.parse_args()
+    files = generate_statements(
+        args.year, args.month, os.path.join(args.output, f"{args.year}-{args.month:02d}"), args.workers, args.chunk_size,
+        progress=lambda done, total: print(f"\r{done}/{total}", end="", flush=True)
+    )
+    print(f"\nСоздано выписок: {len(files)}")
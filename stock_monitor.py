@@ -0,0 +1,321 @@
+# Монитор остатков: материалы и продукция, количество которых на складе ниже порога.
+# Порог материала - мин_колво, порог продукции - общая настройка product_min_stock (PRAKTIKA_PRODUCT_MIN_STOCK),
+# так как у продукции своего минимального количества нет.
+# В памяти хранятся только позиции ниже порога. Индекс загружается двумя запросами при первом обращении,
+# дальше он обновляется по одной позиции:
+#   - изменения через ORM (вставка, изменение, удаление материала или продукции) применяются при фиксации сессии;
+#   - в PostgreSQL триггеры строк отправляют уведомления NOTIFY, и поток-слушатель применяет изменения,
+#     сделанные запросами SQLAlchemy Core, другими программами и вручную. Слушатель включается переменной
+#     окружения PRAKTIKA_STOCK_NOTIFY=1 или Connect.configure(stock_notify=True); триггеры устанавливаются
+#     при создании таблиц, для существующей базы данных - командой: python stock_monitor.py install
+# Каждое появление, изменение и устранение нехватки попадает в ленту событий (feed) и передается подписчикам.
+#   python stock_monitor.py report  - текущие нехватки по складам
+import argparse
+import datetime
+import json
+import select as select_module
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from datebase import Connect, Material, Products
+
+MATERIAL = Material.__tablename__
+PRODUCT = Products.__tablename__
+CHANNEL = "остатки_склада"  # Канал уведомлений PostgreSQL
+PENDING_KEY = "stock_monitor_changes"  # Изменения остатков сессии до фиксации (session.info)
+MAX_EVENTS = 500  # Сколько последних событий хранится в ленте
+RECONNECT_DELAY = 5  # Пауза перед повторным подключением слушателя, секунд
+
+# Статусы событий ленты
+SHORTAGE = "нехватка"
+CHANGED = "изменено"
+RESOLVED = "пополнено"
+REMOVED = "удалено"
+
+
+# Позиция ниже порога
+class StockItem:
+    __slots__ = ("kind", "id", "name", "warehouse", "quantity", "minimum")
+
+    def __init__(self, kind, item_id, name, warehouse, quantity, minimum):
+        self.kind = kind  # MATERIAL или PRODUCT
+        self.id = item_id
+        self.name = name
+        self.warehouse = warehouse  # id склада (у продукции склада нет)
+        self.quantity = quantity  # Количество на складе
+        self.minimum = minimum  # Порог
+
+    @property
+    def deficit(self):
+        # Сколько не хватает до порога
+        return self.minimum - self.quantity
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def product_minimum():
+    return Connect.settings()["product_min_stock"]
+
+
+def is_below(quantity, minimum):
+    return quantity is not None and minimum is not None and quantity < minimum
+
+
+class StockMonitor:
+    def __init__(self):
+        self.items = None  # (вид, id) -> StockItem ниже порога (None - индекс не загружен)
+        self.events = deque(maxlen=MAX_EVENTS)  # Лента: (номер, время, статус, StockItem)
+        self.sequence = 0  # Номер последнего события
+        self.subscribers = []  # Функции callback(событие), вызываются в потоке, применившем изменение
+        self.generation = 0  # Увеличивается при каждом сбросе и изменении индекса
+        self.listener = None  # Поток-слушатель уведомлений PostgreSQL
+        # Изменения приходят из потоков, фиксирующих сессии, и из слушателя; блокировка не удерживается во время запросов
+        self.lock = threading.Lock()
+
+    def load(self, session):
+        # Позиции ниже порога двумя запросами (материалы и продукция); повторный вызов ничего не делает
+        with self.lock:
+            if self.items is not None:
+                return
+            generation = self.generation
+        minimum = product_minimum()
+        items = {}
+        for row in session.execute(select(
+            Material.id, Material.наименование, Material.id_склад, Material.колво_на_складе, Material.мин_колво
+        ).where(Material.колво_на_складе < Material.мин_колво)):
+            items[(MATERIAL, row.id)] = StockItem(MATERIAL, row.id, row.наименование, row.id_склад, row.колво_на_складе, row.мин_колво)
+        for row in session.execute(select(
+            Products.id, Products.наименование, Products.колво_на_складе
+        ).where(Products.колво_на_складе < minimum)):
+            items[(PRODUCT, row.id)] = StockItem(PRODUCT, row.id, row.наименование, None, row.колво_на_складе, minimum)
+        with self.lock:
+            if generation == self.generation:  # Остатки не изменились, пока выполнялись запросы
+                self.items = items
+
+    def ensure_loaded(self, session=None):
+        if self.items is None:
+            if session is not None:
+                self.load(session)
+            else:
+                with Connect.session_scope() as own_session:
+                    self.load(own_session)
+
+    def update(self, kind, item_id, name, warehouse, quantity, minimum, deleted=False):
+        # Новое состояние одной позиции; событие создается, если нехватка появилась, изменилась или устранена
+        below = not deleted and is_below(quantity, minimum)
+        with self.lock:
+            self.generation += 1
+            if self.items is None:
+                return  # Индекс еще не загружен: позиция попадет в него при загрузке
+            key = (kind, item_id)
+            old = self.items.get(key)
+            status = None
+            if below:
+                item = self.items[key] = StockItem(kind, item_id, name, warehouse, quantity, minimum)
+                if old is None:
+                    status = SHORTAGE
+                elif (old.quantity, old.minimum) != (quantity, minimum):
+                    status = CHANGED
+            elif old is not None:
+                item = self.items.pop(key)
+                status = REMOVED if deleted else RESOLVED
+            if status is None:
+                return
+            self.sequence += 1
+            record = (self.sequence, datetime.datetime.now(), status, item)
+            self.events.append(record)
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(record)
+            except RuntimeError:
+                self.unsubscribe(callback)  # Объект интерфейса подписчика уже удален
+
+    def invalidate(self):
+        # Сброс индекса: следующее обращение загрузит его заново
+        with self.lock:
+            self.items = None
+            self.generation += 1
+
+    def shortages(self, warehouse=None, session=None, load=True):
+        # Позиции ниже порога (для склада или все), от самой острой нехватки к наименьшей.
+        # load=False - без запросов к базе данных: None, если индекс не загружен (для потока интерфейса)
+        if load:
+            self.ensure_loaded(session)
+        with self.lock:
+            if self.items is None and not load:
+                return None
+            items = list((self.items or {}).values())
+        if warehouse is not None:
+            items = [item for item in items if item.warehouse == warehouse]
+        items.sort(key=lambda item: (item.quantity / item.minimum if item.minimum else 0, item.kind, item.id))
+        return items
+
+    def count(self):
+        # Количество позиций ниже порога (None, если индекс еще не загружен)
+        with self.lock:
+            return None if self.items is None else len(self.items)
+
+    def feed(self, after=0):
+        # События ленты с номером больше after
+        with self.lock:
+            return [record for record in self.events if record[0] > after]
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def apply_notification(self, payload):
+        # Уведомление триггера: вид (таблица), признак удаления и значения строки
+        data = json.loads(payload)
+        row = data["строка"]
+        if data["вид"] == MATERIAL:
+            self.update(MATERIAL, row["id"], row.get("наименование"), row.get("id_склад"), row.get("колво_на_складе"), row.get("мин_колво"), data["удален"])
+        else:
+            self.update(PRODUCT, row["id"], row.get("наименование"), None, row.get("колво_на_складе"), product_minimum(), data["удален"])
+
+    def start_listener(self):
+        # Поток-слушатель уведомлений запускается один раз и только для PostgreSQL
+        if self.listener is None and Connect.get_engine().dialect.name == "postgresql":
+            self.listener = threading.Thread(target=self.listen, name="stock-monitor", daemon=True)
+            self.listener.start()
+
+    def listen(self):
+        # Отдельное соединение в режиме автофиксации (psycopg 3 или psycopg2); при потере соединения
+        # уведомления могли быть пропущены, поэтому индекс сбрасывается и загружается заново
+        while True:
+            try:
+                with Connect.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.exec_driver_sql(f'LISTEN "{CHANNEL}"')
+                    self.invalidate()  # Изменения до подписки в уведомления не попали
+                    self.ensure_loaded()
+                    driver_connection = connection.connection.driver_connection
+                    if connection.dialect.driver == "psycopg":
+                        for notify in driver_connection.notifies():
+                            self.apply_notification(notify.payload)
+                    else:
+                        while True:
+                            select_module.select([driver_connection], [], [], RECONNECT_DELAY)
+                            driver_connection.poll()
+                            while driver_connection.notifies:
+                                self.apply_notification(driver_connection.notifies.pop(0).payload)
+            except Exception:
+                self.invalidate()
+                time.sleep(RECONNECT_DELAY)
+
+
+monitor = StockMonitor()  # Общий для процесса монитор
+
+
+def load_job(session):
+    # Задача для фоновой группы: загрузка индекса и запуск слушателя уведомлений (если он включен)
+    monitor.ensure_loaded(session)
+    if Connect.settings()["stock_notify"]:
+        monitor.start_listener()
+    yield monitor.count()
+
+
+@event.listens_for(Material, "after_insert")
+@event.listens_for(Material, "after_update")
+@event.listens_for(Products, "after_insert")
+@event.listens_for(Products, "after_update")
+def on_item_saved(mapper, connection, target):
+    # Изменение запоминается в сессии и применяется только после фиксации; значения берутся из объекта
+    # без дополнительных запросов. Объект без загруженных остатка или порога пропускается
+    session = Session.object_session(target)
+    values = target.__dict__
+    if session is None or "колво_на_складе" not in values or (isinstance(target, Material) and "мин_колво" not in values):
+        return
+    if isinstance(target, Material):
+        change = (MATERIAL, target.id, values.get("наименование"), values.get("id_склад"), values.get("колво_на_складе"), values.get("мин_колво"), False)
+    else:
+        change = (PRODUCT, target.id, values.get("наименование"), None, values.get("колво_на_складе"), None, False)
+    session.info.setdefault(PENDING_KEY, {})[change[:2]] = change
+
+
+@event.listens_for(Material, "after_delete")
+@event.listens_for(Products, "after_delete")
+def on_item_deleted(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        kind = MATERIAL if isinstance(target, Material) else PRODUCT
+        session.info.setdefault(PENDING_KEY, {})[(kind, target.id)] = (kind, target.id, None, None, None, None, True)
+
+
+@event.listens_for(Session, "after_commit")
+def on_commit(session):
+    changes = session.info.pop(PENDING_KEY, None)
+    if changes:
+        minimum = product_minimum()
+        for kind, item_id, name, warehouse, quantity, item_minimum, deleted in changes.values():
+            monitor.update(kind, item_id, name, warehouse, quantity, minimum if kind == PRODUCT else item_minimum, deleted)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def on_rollback(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+
+
+# PostgreSQL: уведомление об изменении остатка, порога, наименования или склада; в уведомление попадают только
+# нужные монитору колонки строки
+NOTIFY_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION уведомить_об_остатках() RETURNS trigger AS $$
+    DECLARE
+        строка jsonb;
+    BEGIN
+        строка := to_jsonb(CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END);
+        PERFORM pg_notify('{CHANNEL}', jsonb_build_object(
+            'вид', TG_TABLE_NAME,
+            'удален', TG_OP = 'DELETE',
+            'строка', (SELECT jsonb_object_agg(key, value) FROM jsonb_each(строка)
+                       WHERE key IN ('id', 'наименование', 'id_склад', 'колво_на_складе', 'мин_колво'))
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+WATCHED_COLUMNS = {
+    MATERIAL: "колво_на_складе, мин_колво, наименование, id_склад",
+    PRODUCT: "колво_на_складе, наименование",
+}
+
+
+def install_triggers(connection):
+    # Установка (или переустановка) триггеров уведомлений; только для PostgreSQL
+    connection.exec_driver_sql(NOTIFY_FUNCTION)
+    for table, columns in WATCHED_COLUMNS.items():
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS остатки_уведомление ON {table}")
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER остатки_уведомление AFTER INSERT OR DELETE OR UPDATE OF {columns} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION уведомить_об_остатках()"
+        )
+
+
+@event.listens_for(Material.__table__, "after_create")
+@event.listens_for(Products.__table__, "after_create")
+def on_table_created(target, connection, **kw):
+    # Триггеры ставятся, когда созданы обе таблицы
+    if connection.dialect.name == "postgresql" and all(inspect(connection).has_table(table) for table in WATCHED_COLUMNS):
+        install_triggers(connection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Монитор остатков материалов и продукции")
+    parser.add_argument("command", choices=["install", "report"], help="install - установить триггеры уведомлений, report - текущие нехватки")
+    args = parser.parse_args()
+    if args.command == "install":
+        with Connect.get_engine().begin() as connection:
+            install_triggers(connection)
+        print("Триггеры уведомлений об остатках установлены")
+    else:
+        for item in monitor.shortages():
+            place = f"склад {item.warehouse}" if item.warehouse is not None else "-"
+            print(f"{item.kind:10} {item.id:6} {item.name or '':40} {place:10} {item.quantity:>8} < {item.minimum:<8} не хватает {item.deficit}")
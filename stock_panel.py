@@ -0,0 +1,160 @@
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QListWidget, QComboBox, QLabel, QSplitter
+)
+from PySide6.QtCore import Qt, QObject, Signal, QTimer
+from PySide6.QtGui import QColor
+from stock_monitor import monitor, load_job, MATERIAL, SHORTAGE, CHANGED, REMOVED, MAX_EVENTS  # Монитор остатков
+from workers import create_task_group  # Фоновое выполнение запросов
+import assets  # Общий кэш логотипа и иконки
+
+EMPTY_COLOR = QColor("#F6C9C4")  # Подсветка позиций, которых нет на складе
+ALL = "all"  # Фильтр "все склады"
+PRODUCTS = "products"  # Фильтр "продукция" (у продукции склада нет)
+
+
+# Передача событий монитора в поток интерфейса: монитор вызывает подписчиков в потоке, применившем изменение
+class StockEvents(QObject):
+    changed = Signal(object)  # Событие ленты: (номер, время, статус, позиция)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        callback = self.changed.emit
+        monitor.subscribe(callback)
+        self.destroyed.connect(lambda: monitor.unsubscribe(callback))  # Подписка действует, пока существует объект
+
+
+def describe(record):
+    # Строка ленты событий
+    _, moment, status, item = record
+    place = f", склад {item.warehouse}" if item.warehouse is not None else ""
+    if status in (SHORTAGE, CHANGED):
+        detail = f"{item.quantity} из {item.minimum}"
+    else:
+        detail = "позиция удалена" if status == REMOVED else "выше порога"
+    return f"{moment:%H:%M:%S}  {status}: {item.kind} {item.name or item.id}{place} - {detail}"
+
+
+# Панель остатков: что нужно пополнить (позиции ниже порога) и лента изменений.
+# Данные берутся из монитора в памяти и обновляются по его событиям, без запросов к базе данных в потоке интерфейса:
+# события за REFRESH_DELAY собираются и показываются одной перерисовкой, сброшенный монитор загружается в фоне
+class StockPanel(QDialog):
+    REFRESH_DELAY = 200  # Пауза после события монитора перед перерисовкой, мс: пачка изменений перерисовывается один раз
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Остатки на складах")  # Устанавливаем заголовок окна
+        self.setWindowIcon(assets.icon())  # Устанавливаем иконку окна
+        self.setGeometry(150, 150, 900, 600)  # Устанавливаем начальные размеры окна
+        self.tasks = create_task_group(self)  # Фоновая загрузка монитора
+        self.loading = False  # Выполняется ли фоновая загрузка монитора
+        self.pending_events = []  # События монитора, еще не показанные в ленте
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(self.REFRESH_DELAY)
+        self.refresh_timer.timeout.connect(self.show_events)
+        self.events = StockEvents(self)
+        self.events.changed.connect(self.on_event)
+        self.init_ui()
+        # Панель немодальная: остатки обновляются, пока пользователь работает в других окнах
+        self.load()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Фильтр по складу
+        self.warehouse_combo = QComboBox()
+        self.warehouse_combo.currentIndexChanged.connect(self.refresh)
+        self.summary_label = QLabel()
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Склад"))
+        filter_layout.addWidget(self.warehouse_combo)
+        filter_layout.addStretch()
+        filter_layout.addWidget(self.summary_label)
+        layout.addLayout(filter_layout)
+
+        # Позиции ниже порога, от самой острой нехватки
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(["Вид", "Наименование", "Склад", "Остаток", "Порог", "Не хватает"])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+
+        # Лента изменений, новые события сверху
+        self.feed_list = QListWidget()
+        for record in reversed(monitor.feed()):
+            self.feed_list.addItem(describe(record))
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.feed_list)
+        layout.addWidget(splitter)
+
+    def load(self):
+        # Фоновая загрузка монитора; после нее панель перерисовывается
+        if self.loading:
+            return
+        self.loading = True
+        self.summary_label.setText("Загрузка...")
+        self.tasks.start(load_job, on_chunk=self.on_loaded, on_failed=self.on_load_failed)
+
+    def on_loaded(self, count):
+        self.loading = False
+        self.refresh()
+
+    def on_load_failed(self, message):
+        self.loading = False
+        self.summary_label.setText(f"Ошибка: {message}")
+
+    def on_event(self, record):
+        # События за REFRESH_DELAY показываются одной перерисовкой (таймер не перезапускается, чтобы поток событий не откладывал ее бесконечно)
+        self.pending_events.append(record)
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+
+    def show_events(self):
+        # Накопленные события в ленту (новые сверху, не больше MAX_EVENTS строк) и одна перерисовка таблицы
+        records, self.pending_events = self.pending_events, []
+        for record in records:
+            self.feed_list.insertItem(0, describe(record))
+        while self.feed_list.count() > MAX_EVENTS:
+            self.feed_list.takeItem(self.feed_list.count() - 1)
+        self.refresh()
+
+    def update_warehouses(self, items):
+        # Список складов, по которым есть нехватка; выбранный фильтр сохраняется
+        current = self.warehouse_combo.currentData() or ALL
+        warehouses = sorted({item.warehouse for item in items if item.kind == MATERIAL and item.warehouse is not None})
+        choices = [(ALL, "Все"), (PRODUCTS, "Продукция")] + [(warehouse, f"Склад {warehouse}") for warehouse in warehouses]
+        if current not in [value for value, _ in choices]:
+            choices.append((current, f"Склад {current}"))
+        self.warehouse_combo.blockSignals(True)
+        self.warehouse_combo.clear()
+        for value, text in choices:
+            self.warehouse_combo.addItem(text, value)
+        self.warehouse_combo.setCurrentIndex(max(self.warehouse_combo.findData(current), 0))
+        self.warehouse_combo.blockSignals(False)
+        return current
+
+    def refresh(self):
+        items = monitor.shortages(load=False)
+        if items is None:
+            self.load()  # Монитор сброшен или еще загружается
+            return
+        current = self.update_warehouses(items)
+        if current == PRODUCTS:
+            items = [item for item in items if item.kind != MATERIAL]
+        elif current != ALL:
+            items = [item for item in items if item.kind == MATERIAL and item.warehouse == current]
+        self.table.setRowCount(len(items))
+        for row, item in enumerate(items):
+            values = [item.kind, item.name or "", item.warehouse if item.warehouse is not None else "", item.quantity, item.minimum, item.deficit]
+            for column, value in enumerate(values):
+                cell = QTableWidgetItem(str(value))
+                if isinstance(value, int):
+                    cell.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                if item.quantity <= 0:
+                    cell.setBackground(EMPTY_COLOR)
+                self.table.setItem(row, column, cell)
+        self.summary_label.setText(f"Нужно пополнить: {len(items)}")
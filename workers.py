@@ -0,0 +1,93 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from datebase import Connect  # Общий пул соединений с базой данных
+import query_stats  # Действие интерфейса, запустившее задачу
+
+
+# Сигналы фоновой задачи (QRunnable не является QObject и не может иметь собственных сигналов)
+class WorkerSignals(QObject):
+    chunk = Signal(object)  # Очередная порция результата
+    failed = Signal(str)  # Текст ошибки
+    finished = Signal()  # Задача завершена (успешно, с ошибкой или отменена)
+
+
+# Фоновая задача для выполнения запросов к базе данных вне потока интерфейса.
+# job - функция-генератор job(session, *args), которая по мере готовности отдает порции результата.
+# Если сессия не передана, задача открывает собственную сессию и закрывает ее по завершении.
+class DbWorker(QRunnable):
+    def __init__(self, job, *args, session=None):
+        super().__init__()
+        self.job = job  # Функция, выполняющая запросы
+        self.args = args  # Аргументы функции
+        self.session = session  # Сессия, принадлежащая вызывающему коду (если есть)
+        self.cancelled = False  # Флаг отмены задачи
+        self.action = query_stats.current_action()  # Запросы задачи относятся к действию, во время которого она создана
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        # Отмена проверяется между порциями результата
+        self.cancelled = True
+
+    def run(self):
+        session = self.session or Connect.create_connection()  # Собственная сессия потока
+        try:
+            with query_stats.attach(self.action):
+                for chunk in self.job(session, *self.args):
+                    if self.cancelled:
+                        break
+                    self.signals.chunk.emit(chunk)  # Передаем порцию в поток интерфейса
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+        finally:
+            if self.session is None:
+                session.close()  # Возвращаем соединение в пул
+            self.signals.finished.emit()
+
+
+# Группа фоновых задач окна: запускает задачи и отменяет их все при закрытии окна
+class DbTaskGroup(QObject):
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()  # Пул потоков для выполнения задач
+        self.workers = set()  # Выполняющиеся задачи
+
+    def start(self, job, *args, on_chunk=None, on_failed=None, on_finished=None, session=None):
+        worker = DbWorker(job, *args, session=session)
+        # Результаты отмененной задачи в интерфейс не передаются
+        if on_chunk:
+            worker.signals.chunk.connect(lambda chunk: None if worker.cancelled else on_chunk(chunk))
+        if on_failed:
+            worker.signals.failed.connect(lambda message: None if worker.cancelled else on_failed(message))
+        worker.signals.finished.connect(lambda: self.on_worker_finished(worker, on_finished))
+        self.workers.add(worker)
+        self.pool.start(worker)
+        return worker
+
+    def on_worker_finished(self, worker, on_finished):
+        self.workers.discard(worker)
+        if on_finished and not worker.cancelled:
+            on_finished()
+
+    def cancel_all(self):
+        # Отменяем все задачи группы (например, при закрытии окна)
+        for worker in list(self.workers):
+            worker.cancel()
+
+    def wait(self):
+        # Ожидание завершения задач, использующих общую с вызывающим кодом сессию
+        self.pool.waitForDone()
+
+    def create_session(self):
+        # Сессия, принадлежащая окну или модели (передается в start через session=)
+        return Connect.create_connection()
+
+    def close_session(self, session):
+        session.close()
+
+
+def create_task_group(parent=None, pool=None):
+    # Группа задач окна: пул потоков с обычными сессиями или асинхронный слой, если он включен (async_db.py)
+    if Connect.settings()["async_io"]:
+        from async_db import AsyncTaskGroup
+        return AsyncTaskGroup(parent)
+    return DbTaskGroup(parent, pool)